@@ -6,19 +6,19 @@ from passlib.context import CryptContext
 
 from backend.app.schemas.admin.admin_requests import AdminLoginHTTPRequest
 from common.app.core.config import config as cfg
-from common.app.db.api_db import create_admin
+from common.app.db.storage import storage
 
 router = APIRouter()
 
 
 
-def authenticate_admin(username: str, password: str):
+async def authenticate_admin(username: str, password: str):
     # Здесь должна быть логика для проверки никнейма и пароля администратора
     # Например, проверка хэша пароля из базы данных
     # Пока используем захардкоженные значения для тестирования
     if username == "admin" and password == "password":
         password_hash = CryptContext(schemes=["bcrypt"]).hash(password)
-        create_admin(username, password_hash)
+        await storage.create_admin(username, password_hash)
         return {"username": username}
     return None
 
@@ -36,7 +36,7 @@ def create_access_token(data: dict, expires_delta: timedelta | None = None):
 
 @router.post("/login")
 async def login_for_access_token(form_data: AdminLoginHTTPRequest):
-    user = authenticate_admin(form_data.username, form_data.password)
+    user = await authenticate_admin(form_data.username, form_data.password)
     if not user:
         raise HTTPException(status_code=400, detail="Incorrect username or password")
 
@@ -0,0 +1,104 @@
+import asyncio
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+
+from backend.app.api.websocket_core.authenticate import authenticate_admin_token
+
+"""
+Admin endpoints for looking inside a running worker without restarting it.
+ - GET /admin/profile samples the stack of the event loop thread from a background thread every
+   interval_ms for the given number of seconds and returns the stacks in the collapsed format
+   ("frame;frame;frame count" per line, root first), which flamegraph.pl and speedscope read as is.
+   The loop keeps serving clients while it is sampled; the cost is one stack walk per sample.
+ - GET /admin/heap takes two tracemalloc snapshots the given number of seconds apart and returns
+   the allocation sites that grew the most. Tracing is switched on only for the duration of the request.
+Both require the admin access token (Authorization: Bearer), checked with authenticate_admin_token.
+Only one profile or heap diff runs at a time per worker.
+"""
+
+router = APIRouter()
+bearer = HTTPBearer(auto_error=False)
+_busy = asyncio.Lock()
+
+
+async def require_admin(credentials: Optional[HTTPAuthorizationCredentials] = Depends(bearer)) -> str:
+    admin = await authenticate_admin_token(credentials.credentials) if credentials else None
+    if not admin or admin[1] is None:
+        raise HTTPException(status_code=401, detail="Invalid or expired token")
+    return admin[0]
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_filename.rsplit('/', 1)[-1]}:{code.co_name}:{frame.f_lineno}"
+
+
+def sample_stacks(thread_id: int, seconds: float, interval: float) -> Dict[str, int]:
+    """
+    Снимает стек потока thread_id каждые interval секунд, пока не пройдет seconds.
+    Вызывается в отдельном потоке: поток цикла событий в это время продолжает работать.
+    """
+    stacks: Counter = Counter()
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        frame = sys._current_frames().get(thread_id)
+        names = []
+        while frame is not None:
+            names.append(_frame_name(frame))
+            frame = frame.f_back
+        if names:
+            stacks[";".join(reversed(names))] += 1
+        del frame
+        time.sleep(interval)
+    return dict(stacks)
+
+
+def collapse(stacks: Dict[str, int]) -> str:
+    return "".join(f"{stack} {count}\n" for stack, count in sorted(stacks.items(), key=lambda item: -item[1]))
+
+
+async def heap_diff(seconds: float, limit: int) -> List[dict]:
+    started_here = not tracemalloc.is_tracing()
+    if started_here:
+        tracemalloc.start(16)
+    try:
+        before = tracemalloc.take_snapshot()
+        await asyncio.sleep(seconds)
+        after = tracemalloc.take_snapshot()
+    finally:
+        if started_here:
+            tracemalloc.stop()
+    stats = after.compare_to(before, "lineno")[:limit]
+    return [{"location": str(stat.traceback[0]), "size_diff": stat.size_diff, "size": stat.size,
+             "count_diff": stat.count_diff, "count": stat.count} for stat in stats]
+
+
+@router.get("/profile", response_class=PlainTextResponse)
+async def profile(seconds: float = Query(10, gt=0, le=60), interval_ms: float = Query(5, ge=1, le=1000),
+                  admin: str = Depends(require_admin)):
+    if _busy.locked():
+        raise HTTPException(status_code=409, detail="Another profile is running")
+    async with _busy:
+        # Запрос обрабатывается в потоке цикла событий - его и профилируем
+        loop_thread = threading.get_ident()
+        stacks = await asyncio.to_thread(sample_stacks, loop_thread, seconds, interval_ms / 1000)
+    filename = f"profile-{datetime.now(timezone.utc):%Y%m%dT%H%M%S}.folded"
+    return PlainTextResponse(collapse(stacks), headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+
+@router.get("/heap")
+async def heap(seconds: float = Query(10, gt=0, le=300), limit: int = Query(25, ge=1, le=500),
+               admin: str = Depends(require_admin)):
+    if _busy.locked():
+        raise HTTPException(status_code=409, detail="Another profile is running")
+    async with _busy:
+        return {"seconds": seconds, "top": await heap_diff(seconds, limit)}
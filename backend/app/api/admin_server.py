@@ -0,0 +1,20 @@
+from fastapi import APIRouter, Depends
+
+from backend.app.api.admin_profiler import require_admin
+from backend.app.api.websocket_core.handlers import drain_host
+
+"""
+POST /admin/drain lets the clients go before the process is stopped. On SIGTERM uvicorn closes websockets
+with 1012 before the shutdown hook runs, so the reconnect message with its jitter only reaches clients when
+the drain is requested first, e.g. from the deployment's pre-stop hook. Workers of one host share the port,
+so the request is forwarded to the others over the bus. The response is sent once this worker has drained.
+Requires the admin access token (Authorization: Bearer), like the profiling endpoints.
+"""
+
+router = APIRouter()
+
+
+@router.post("/drain")
+async def drain(admin: str = Depends(require_admin)):
+    await drain_host()
+    return {"status": "drained"}
@@ -1,5 +1,9 @@
 from fastapi import APIRouter
 import backend.app.api.admin_login as admin_login
+import backend.app.api.admin_profiler as admin_profiler
+import backend.app.api.admin_server as admin_server
 
 def include_api(router: APIRouter):
     router.include_router(admin_login.router, prefix="/admin")
+    router.include_router(admin_profiler.router, prefix="/admin")
+    router.include_router(admin_server.router, prefix="/admin")
@@ -1,4 +1,4 @@
-import json
+import time
 from typing import Tuple
 
 import starlette
@@ -9,15 +9,12 @@ from starlette.websockets import WebSocketState
 
 from backend.app.api.websocket_core.authenticate import authenticate
 from backend.app.api.websocket_core.connection_manager import manager
-from backend.app.api.websocket_core.handlers import (
-    handle_update_pixel, handle_selection_update, handle_send_field_state, handle_online_count,
-    handle_change_cooldown, handle_pixel_info, handle_ban_user, handle_reset_game, handle_disconnect,
-    handle_send_cooldown, handle_get_online_info_admin,
-)
-from backend.app.api.websocket_core.metrics_handler import send_text_metric, receive_text_metric
-from backend.app.schemas.admin.admin_requests import AdminPixelUpdateRequest, AdminPixelInfoRequest, \
-    AdminBanUserRequest, AdminChangeCooldownRequest, AdminResetGameRequest
-from backend.app.schemas.user.user_requests import PixelUpdateRequest, SelectionUpdateRequest, DisconnectRequest
+from backend.app.api.websocket_core.dispatch import ROUTES, ALLOWED_TYPES, request_adapter, loads, MESSAGE_SECONDS, \
+    UNKNOWN_MESSAGE_SECONDS
+from backend.app.api.websocket_core.loop_monitor import current_message_type
+from backend.app.api.websocket_core.metrics_handler import receive_text_metric
+from backend.app.api.websocket_core.rate_limiter import rate_limiter
+from backend.app.prometheus.metrics import ws_messages_rate_limited
 from backend.app.schemas.user.user_respones import SuccessResponse, ErrorResponse
 
 app_ws = FastAPI()
@@ -26,6 +23,10 @@ app_ws = FastAPI()
 @app_ws.websocket("/")
 async def websocket_endpoint(websocket: WebSocket):
     await websocket.accept()
+    if manager.draining:
+        # Сервер останавливается: клиент сразу идет на другой
+        await websocket.close(code=1012, reason="Server is restarting")
+        return
     user, response = await authenticate(websocket)
     admin = False
     try:
@@ -36,13 +37,18 @@ async def websocket_endpoint(websocket: WebSocket):
         admin = True if response[1] == "admin" else False
 
         if admin:
-            manager.admin_connections.append(websocket)
-            await send_text_metric(websocket, SuccessResponse(data="Success login as admin").json())
+            session = manager.connect_admin(websocket, user[0], compression=websocket.state.compression,
+                                            heartbeat=websocket.state.heartbeat)
+            manager.reply(websocket, SuccessResponse(data="Success login as admin").json())
         else:
-            await manager.connect(websocket, user[0], user[1])
-            await send_text_metric(websocket, SuccessResponse(data="Success login as user").json())
+            session = await manager.connect(websocket, user[0], user[1],
+                                            binary=websocket.state.protocol == "binary",
+                                            compression=websocket.state.compression,
+                                            heartbeat=websocket.state.heartbeat)
+            manager.reply(websocket, SuccessResponse(data="Success login as user").json())
         while True:
             message = await receive_text_metric(websocket)
+            session.last_seen = time.monotonic()  # любое сообщение - признак живого клиента
             await process_message(websocket, message, user, admin)
 
     except (WebSocketDisconnect, starlette.websockets.WebSocketDisconnect, RuntimeError) as e:
@@ -50,46 +56,42 @@ async def websocket_endpoint(websocket: WebSocket):
         message_code = 1000 if not isinstance(e, RuntimeError) else 1006
         print(f"Websocket disconnected: {e}" if not isinstance(e, RuntimeError) else f"RuntimeError: {e}", flush=True)
         if admin is not False:
-            manager.admin_connections = [adm for adm in manager.admin_connections if adm != websocket]
+            manager.disconnect_admin(websocket)
         else:
             await manager.disconnect(websocket, code=message_code, reason=message_reason)
 
 
 async def process_message(websocket: WebSocket, message: str, user: Tuple[str, str], admin: bool = False):
-    message_data = json.loads(message)
-    message_type = message_data.get('type')
-
-    async def access_denied(ws: WebSocket):
-        await ws.send_text(ErrorResponse(message="Access denied").json())
+    started = time.perf_counter()
+    try:
+        message_data = loads(message)
+    except ValueError:
+        manager.reply(websocket, ErrorResponse(message="Invalid JSON").json())
+        UNKNOWN_MESSAGE_SECONDS.observe(time.perf_counter() - started)
+        return
+    message_type = message_data.get("type") if isinstance(message_data, dict) else None
+    route = ROUTES.get(message_type) if isinstance(message_type, str) else None
 
-    # Словарь обработчиков сообщений
-    message_handlers = {
-        "disconnect": lambda ws, md, u: handle_disconnect(ws, DisconnectRequest(**md)),
-        "update_pixel": lambda ws, md, u: handle_update_pixel(ws, PixelUpdateRequest(**md), u, permission=False),
-        "update_selection": lambda ws, md, u: handle_selection_update(ws, SelectionUpdateRequest(**md), u),
-        "get_field_state": lambda ws, md, u: handle_send_field_state(ws),
-        "get_online_count": lambda ws, md, u: handle_online_count(ws),
-        "get_cooldown": lambda ws, md, u: handle_send_cooldown(ws),
-        # Административные обработчики
-        "update_pixel_admin": lambda ws, md, u: handle_update_pixel(ws, AdminPixelUpdateRequest(**md), u,
-                                                                    permission=True) if admin else access_denied(ws),
-        "pixel_info_admin": lambda ws, md, u: handle_pixel_info(ws, AdminPixelInfoRequest(
-            **md)) if admin else access_denied(ws),
-        "toggle_ban_user_admin": lambda ws, md, u: handle_ban_user(ws, AdminBanUserRequest(
-            **md)) if admin else access_denied(ws),
-        "update_cooldown_admin": lambda ws, md, u: handle_change_cooldown(
-            AdminChangeCooldownRequest(**md).data) if admin else access_denied(ws),
-        "reset_game_admin": lambda ws, md, u: handle_reset_game(ws, AdminResetGameRequest(
-            **md)) if admin else access_denied(ws),
-        "get_online_info_admin": lambda ws, md, u: handle_get_online_info_admin(ws) if admin else access_denied(ws),
-    }
+    # Лимиты частоты проверяются до разбора сообщения; админов не ограничиваем
+    limit_type = message_type if route is not None else "*"
+    if not admin and not rate_limiter.allow(user[1], limit_type):
+        ws_messages_rate_limited.labels(type=limit_type).inc()
+        if route is not None and route.reply_when_limited:
+            manager.reply(websocket, ErrorResponse(message="Rate limited").json())
+        return
 
+    # По типу монитор цикла событий узнает, какое сообщение задержало цикл
+    current_message_type.set(message_type if route is not None else "unknown")
+    if route is None:
+        manager.reply(websocket, "Unknown message type or action not allowed.")
+        UNKNOWN_MESSAGE_SECONDS.observe(time.perf_counter() - started)
+        return
     try:
-        if message_type in message_handlers and (message_handlers[message_type] is not None):
-            handler = message_handlers[message_type]
-            if callable(handler):  # Проверяем, является ли обработчик вызываемым объектом
-                await handler(websocket, message_data, user)
-        else:
-            await websocket.send_text("Unknown message type or action not allowed.")
+        if message_type not in ALLOWED_TYPES[admin]:
+            manager.reply(websocket, ErrorResponse(message="Access denied").json())
+            return
+        await route.handler(websocket, request_adapter.validate_python(message_data), user)
     except ValidationError as e:
-        await websocket.send_text(ErrorResponse(message=str(e)).json())
+        manager.reply(websocket, ErrorResponse(message=str(e)).json())
+    finally:
+        MESSAGE_SECONDS[message_type].observe(time.perf_counter() - started)
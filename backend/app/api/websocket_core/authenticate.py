@@ -6,12 +6,13 @@ from fastapi.websockets import WebSocketDisconnect
 from jose import jwt, JWTError
 from pydantic import ValidationError
 
+from backend.app.api.websocket_core.canvas import canvas
+from backend.app.api.websocket_core.rate_limiter import cooldown_tracker
 from backend.app.schemas.admin.admin_requests import AdminLoginRequest
 from backend.app.schemas.user.user_requests import LoginRequest
 from backend.app.schemas.user.user_respones import ErrorResponse, AuthResponse
 from common.app.core.config import config as cfg
-from common.app.db.api_db import get_user_by_id, create_user, update_user_nickname, \
-    get_admin_by_username
+from common.app.db.storage import storage
 
 
 async def authenticate(websocket: WebSocket) -> Tuple[Optional[Tuple[str, str]], Tuple[int, str]]:
@@ -19,6 +20,8 @@ async def authenticate(websocket: WebSocket) -> Tuple[Optional[Tuple[str, str]],
         auth_data = await websocket.receive_json()
         if auth_data['type'] == "login_admin":
             request = AdminLoginRequest(**auth_data)
+            websocket.state.compression = request.compression
+            websocket.state.heartbeat = request.heartbeat
             admin = await authenticate_admin_token(request.data)
             return (admin, (200, "admin")) if admin else (None, (1008, "Policy Violation"))
 
@@ -31,17 +34,18 @@ async def authenticate(websocket: WebSocket) -> Tuple[Optional[Tuple[str, str]],
 
             user_id = request.user_id
             if user_id:
-                user = await get_user_by_id(user_id)
+                user = await storage.get_user_by_id(user_id)
                 if not user:
                     await websocket.send_json(ErrorResponse(message="User not found").dict())
                     return None, (1002, "Protocol Error")
                 elif user['nickname'] != request.nickname:
-                    success = await update_user_nickname(user_id, request.nickname)
+                    success = await storage.update_user_nickname(user_id, request.nickname)
                     if not success:
                         await websocket.send_json(ErrorResponse(message="Nickname already exist").dict())
                         return None, (1002, "Protocol Error")
+                    canvas.rename_user(user_id, request.nickname)
             else:
-                user = await create_user(request.nickname)
+                user = await storage.create_user(request.nickname)
                 if not user:
                     await websocket.send_json(ErrorResponse(message="Nickname already exist").dict())
                     return None, (1002, "Protocol Error")
@@ -51,7 +55,13 @@ async def authenticate(websocket: WebSocket) -> Tuple[Optional[Tuple[str, str]],
             if user.get('is_banned'):
                 await websocket.send_json(ErrorResponse(message="User is banned").dict())
                 return None, (1002, "Protocol Error")
+            cooldown_tracker.seed(user_id, user.get('last_pixel_update'))
 
+            # Формат снимка поля, протокол обновлений, сжатие и ping/pong, согласованные при входе
+            websocket.state.snapshot_format = request.snapshot_format
+            websocket.state.protocol = request.protocol
+            websocket.state.compression = request.compression
+            websocket.state.heartbeat = request.heartbeat
             return (request.nickname, user_id), (200, "user")
         else:
             await websocket.send_json(ErrorResponse(message="Unsupported login type").dict())
@@ -73,7 +83,7 @@ async def authenticate_admin_token(token: str) -> Optional[Tuple[str, str]]:
         current_time = datetime.now(timezone.utc).timestamp()
         if current_time > expiration:
             return None
-        return nickname, await get_admin_by_username(nickname)
+        return nickname, await storage.get_admin_by_username(nickname)
 
     except JWTError as e:
         print(f"JWTError: {e}")
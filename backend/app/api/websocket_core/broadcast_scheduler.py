@@ -0,0 +1,101 @@
+import asyncio
+import itertools
+import json
+from typing import Dict, FrozenSet, List, Optional, Set, Tuple
+
+from backend.app.api.websocket_core.registry import Session
+from backend.app.api.websocket_core.tiles import Tile, tile_of
+from backend.app.api.websocket_core.wire_codec import Pixel, Selection, encode_batch
+from backend.app.schemas.data_models import PositionData
+
+"""
+The broadcast scheduler buffers pixel and selection events for BROADCAST_TICK_MS and sends
+one batch_update frame per tick instead of a frame per event. All pixel changes of the tick are kept
+(each with its seq), selections are collapsed to the latest position per nickname.
+Each event is serialized once; a frame is assembled once for the full-field subscribers and admins,
+and once per distinct viewport among the tile subscribers that the tick touched - in each protocol
+only if some recipient of the frame uses it.
+A tick of 0 disables batching and the manager sends every event as it happens.
+"""
+
+
+def _dumps(obj) -> str:
+    # Тот же компактный формат, что и у pydantic .json()
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False)
+
+
+def _frame(seq: Optional[int], pixels: List[str], selections: List[str]) -> str:
+    return (f'{{"type":"batch_update","seq":{_dumps(seq)},'
+            f'"data":{{"pixels":[{",".join(pixels)}],"selections":[{",".join(selections)}]}}}}')
+
+
+class BroadcastScheduler:
+    def __init__(self, manager, tick_ms: int):
+        self.manager = manager
+        self.tick = tick_ms / 1000
+        self._pixels: List[Tuple[Tile, str, Pixel]] = []  # тайл, сериализованное изменение, оно же для бинарного
+        self._selections: Dict[str, Tuple[Set[Tile], str, Selection]] = {}
+        self._handle: Optional[asyncio.TimerHandle] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.tick > 0
+
+    def _schedule(self):
+        if self._handle is None:
+            self._handle = asyncio.get_running_loop().call_later(self.tick, self.flush)
+
+    def add_pixel(self, seq: int, x: int, y: int, color: str, nickname: str):
+        fragment = _dumps({"seq": seq, "x": x, "y": y, "color": color, "nickname": nickname})
+        self._pixels.append((tile_of(x, y), fragment, (seq, x, y, color, nickname)))
+        self._schedule()
+
+    def add_selection(self, nickname: str, position: Optional[PositionData], previous: Optional[PositionData]):
+        # Получатели - все, кто видел выделение в каком-либо его положении за тик
+        tiles = {tile_of(p.x, p.y) for p in (position, previous) if p is not None}
+        pending = self._selections.get(nickname)
+        if pending is not None:
+            tiles |= pending[0]
+        data = {"x": position.x, "y": position.y} if position is not None else None
+        self._selections[nickname] = (tiles, _dumps({"nickname": nickname, "position": data}),
+                                      (nickname, (position.x, position.y) if position is not None else None))
+        self._schedule()
+
+    def _send(self, sessions, seq: Optional[int], pixels: List[Tuple[Tile, str, Pixel]],
+              selections: List[Tuple[Set[Tile], str, Selection]]):
+        self.manager.send_encoded(
+            sessions,
+            lambda: _frame(seq, [fragment for _, fragment, _ in pixels], [fragment for _, fragment, _ in selections]),
+            lambda: encode_batch(seq, [pixel for _, _, pixel in pixels], [selection for _, _, selection in selections]),
+            message_type="batch_update",
+        )
+
+    def flush(self):
+        self._handle = None
+        pixels, self._pixels = self._pixels, []
+        selections, self._selections = list(self._selections.values()), {}
+        if not (pixels or selections):
+            return
+        seq = pixels[-1][2][0] if pixels else None
+
+        self._send(itertools.chain(self.manager.full_subscribers, self.manager.registry.admins.values()),
+                   seq, pixels, selections)
+
+        # Подписчики с одинаковым viewport получают один и тот же кадр
+        touched = {tile for tile, _, _ in pixels}
+        for tiles, _, _ in selections:
+            touched |= tiles
+        groups: Dict[FrozenSet[Tile], Set[Session]] = {}
+        for tile in touched:
+            for session in self.manager.tile_subscribers.get(tile, ()):
+                groups.setdefault(session.tiles, set()).add(session)
+        for viewport, sessions in groups.items():
+            self._send(sessions, seq, [pixel for pixel in pixels if pixel[0] in viewport],
+                       [selection for selection in selections if not viewport.isdisjoint(selection[0])])
+
+    def discard(self):
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        self._pixels = []
+        self._selections = {}
@@ -0,0 +1,206 @@
+import asyncio
+import json
+import logging
+import uuid
+from abc import ABC, abstractmethod
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import psycopg
+from psycopg import sql
+
+from backend.app.prometheus.metrics import bus_events_published, bus_events_received, bus_publish_errors
+from common.app.core.config import config as cfg
+from common.app.db.api_db import notify
+
+"""
+The bus carries pixel, selection, presence and admin events between server processes, so several
+uvicorn workers (or hosts) can serve one game. Every process has its own node id; events are
+delivered to every node, including the sender, and each node ignores its own events.
+Backends (BUS_BACKEND):
+ - "memory": in-process delivery through a shared hub, the default for a single worker and for tests;
+ - "postgres": LISTEN/NOTIFY on BUS_CHANNEL. Events published during one loop iteration are sent
+   with a single NOTIFY as a JSON array; a dedicated connection listens and reconnects on failure.
+   start() returns once LISTEN is issued. Events sent while the listener was disconnected are lost, so
+   after a reconnect the node gets a local {"type": "resync"} event and catches up from storage.
+Handlers run one event at a time, in publish order per sender. Between hold() and release() incoming events
+are buffered and then handled in arrival order, so a node can subscribe before loading its state
+and apply what arrived during the load afterwards.
+"""
+
+logger = logging.getLogger(__name__)
+
+Event = dict
+EventHandler = Callable[[Event], Awaitable[None]]
+
+NOTIFY_PAYLOAD_LIMIT = 7900  # NOTIFY принимает до 8000 байт
+RECONNECT_DELAY = 1.0
+
+
+class Bus(ABC):
+    def __init__(self):
+        self.node_id = uuid.uuid4().hex
+        self._handler: Optional[EventHandler] = None
+        self._held: Optional[List[Event]] = None
+
+    async def start(self, handler: EventHandler):
+        self._handler = handler
+
+    async def stop(self):
+        self._handler = None
+
+    @abstractmethod
+    def publish(self, event: Event):
+        ...
+
+    def hold(self):
+        self._held = []
+
+    async def release(self):
+        # События, пришедшие во время разбора буфера, встают в его конец
+        while self._held:
+            await self._handle(self._held.pop(0))
+        self._held = None
+
+    async def _deliver(self, event: Event):
+        if event.get("node") == self.node_id or self._handler is None:
+            return
+        if self._held is not None:
+            self._held.append(event)
+            return
+        await self._handle(event)
+
+    async def _handle(self, event: Event):
+        bus_events_received.labels(type=event.get("type")).inc()
+        try:
+            await self._handler(event)
+        except Exception as e:
+            logger.error(f"Bus event {event.get('type')} failed: {e}")
+
+
+class MemoryBus(Bus):
+    def __init__(self, hub: List["MemoryBus"] = None):
+        super().__init__()
+        # Узлы с общим hub видят события друг друга; по умолчанию - общий на процесс
+        self.hub = MEMORY_HUB if hub is None else hub
+        self._inbox: asyncio.Queue = asyncio.Queue()
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self, handler: EventHandler):
+        await super().start(handler)
+        self.hub.append(self)
+        self._task = asyncio.create_task(self._consume())
+
+    async def stop(self):
+        if self in self.hub:
+            self.hub.remove(self)
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await super().stop()
+
+    def publish(self, event: Event):
+        event = {**event, "node": self.node_id}
+        bus_events_published.labels(type=event["type"]).inc()
+        for node in self.hub:
+            if node is not self:
+                node._inbox.put_nowait(event)
+
+    async def _consume(self):
+        while True:
+            await self._deliver(await self._inbox.get())
+
+
+MEMORY_HUB: List[MemoryBus] = []
+
+
+class PostgresBus(Bus):
+    def __init__(self, dsn: str, channel: str):
+        super().__init__()
+        self.dsn = dsn
+        self.channel = channel
+        self._pending: List[str] = []
+        self._flush_task: Optional[asyncio.Task] = None
+        self._listen_task: Optional[asyncio.Task] = None
+
+    async def start(self, handler: EventHandler):
+        await super().start(handler)
+        # LISTEN до возврата: все события, отправленные после start, дойдут до узла
+        connection = await self._listen()
+        self._listen_task = asyncio.create_task(self._listen_forever(connection))
+
+    async def stop(self):
+        if self._listen_task is not None:
+            self._listen_task.cancel()
+            self._listen_task = None
+        if self._flush_task is not None:
+            await self._flush_task
+        await super().stop()
+
+    def publish(self, event: Event):
+        event = {**event, "node": self.node_id}
+        bus_events_published.labels(type=event["type"]).inc()
+        self._pending.append(json.dumps(event, separators=(",", ":"), ensure_ascii=False))
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush())
+
+    def _payloads(self, events: List[str]) -> List[str]:
+        payloads, chunk, size = [], [], 2
+        for event in events:
+            if chunk and size + len(event.encode()) + 1 > NOTIFY_PAYLOAD_LIMIT:
+                payloads.append(f"[{','.join(chunk)}]")
+                chunk, size = [], 2
+            chunk.append(event)
+            size += len(event.encode()) + 1
+        if chunk:
+            payloads.append(f"[{','.join(chunk)}]")
+        return payloads
+
+    async def _flush(self):
+        # Отправка откладывается до следующей итерации цикла, чтобы собрать события пачкой
+        await asyncio.sleep(0)
+        events, self._pending = self._pending, []
+        self._flush_task = None
+        for payload in self._payloads(events):
+            try:
+                await notify(self.channel, payload)
+            except Exception as e:
+                bus_publish_errors.inc()
+                logger.error(f"Bus publish failed: {e}")
+
+    async def _listen(self) -> psycopg.AsyncConnection:
+        connection = await psycopg.AsyncConnection.connect(self.dsn, autocommit=True)
+        await connection.execute(sql.SQL("LISTEN {}").format(sql.Identifier(self.channel)))
+        return connection
+
+    async def _listen_forever(self, connection: Optional[psycopg.AsyncConnection]):
+        while True:
+            try:
+                if connection is None:
+                    connection = await self._listen()
+                    logger.info("Bus listener reconnected")
+                    # Пока слушателя не было, события терялись: узел сверяется с хранилищем
+                    await self._deliver({"type": "resync"})
+                async with connection:
+                    async for notification in connection.notifies():
+                        for event in json.loads(notification.payload):
+                            await self._deliver(event)
+                connection = None
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Bus listener disconnected: {e}")
+                connection = None
+                await asyncio.sleep(RECONNECT_DELAY)
+
+
+def create_bus(backend: str) -> Bus:
+    backends: Dict[str, Callable[[], Bus]] = {
+        "memory": MemoryBus,
+        "postgres": lambda: PostgresBus(cfg.DB_URL, cfg.BUS_CHANNEL),
+    }
+    if backend not in backends:
+        raise ValueError(f"Unknown bus backend: {backend}")
+    return backends[backend]()
+
+
+bus = create_bus(cfg.BUS_BACKEND)
@@ -0,0 +1,192 @@
+import array
+import logging
+import string
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, TypeVar
+
+from backend.app.api.websocket_core.tiles import Tile, tile_of
+from backend.app.api.websocket_core.write_queue import pixel_write_queue
+from common.app.core.config import config as cfg
+from common.app.db.storage import storage
+
+"""
+The canvas object is the authoritative copy of the field. It keeps the pixels in memory
+as flat arrays in row-major order (index = y * width + x):
+ - colors: 0xRRGGBB for every cell,
+ - writers: index of the last writer in the users table, EMPTY if nobody painted the cell,
+ - action_times: UTC timestamp of the last change,
+ - origins: rank of the server that made the last change (node_rank of its bus node id, 0 if loaded from storage).
+A change is applied only if (action_time, origin) is not older than the cell's: servers receive concurrent
+changes of the same cell in different orders, and this way every copy of the field (and the database,
+which keeps the newer action_time) ends up with the same pixel.
+The version grows with every change (including a reset), so derived data such as the
+serialized field state can be cached per version. Every tile also remembers the canvas version
+of its last change, so per-tile data can be cached per tile.
+The canvas is loaded once at startup and updated by the websocket handlers; changes reach
+the database through the pixel write queue, so reading the field never touches the database.
+"""
+
+EMPTY = -1
+
+T = TypeVar("T")
+
+logger = logging.getLogger(__name__)
+
+
+def parse_color(color: str) -> int:
+    if len(color) != 7 or color[0] != "#" or not all(c in string.hexdigits for c in color[1:]):
+        raise ValueError(f"Invalid color: {color}")
+    return int(color[1:], 16)
+
+
+def format_color(value: int) -> str:
+    return f"#{value:06X}"
+
+
+def node_rank(node: Optional[str]) -> int:
+    # Порядок серверов при равном action_time; id узла - hex uuid, берем старшие 64 бита
+    return int(node[:16], 16) if node else 0
+
+
+class Canvas:
+    def __init__(self, size: Tuple[int, int]):
+        self.user_ids: List[Optional[str]] = []
+        self.nicknames: List[str] = []
+        self._user_index: Dict[object, int] = {}
+        self.version = 0
+        self.names_version = 0
+        self.tile_versions: Dict[Tile, int] = {}
+        self._allocate(size)
+
+    def _allocate(self, size: Tuple[int, int]):
+        self.width, self.height = size
+        cells = self.width * self.height
+        self.colors = array.array('I', bytes(4 * cells))
+        self.writers = array.array('i', [EMPTY]) * cells
+        self.action_times = array.array('d', bytes(8 * cells))
+        self.origins = array.array('Q', bytes(8 * cells))
+        self.user_ids.clear()
+        self.nicknames.clear()
+        self._user_index.clear()
+        self.tile_versions.clear()
+        self.version += 1
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        return self.width, self.height
+
+    def contains(self, x: int, y: int) -> bool:
+        return 0 <= x < self.width and 0 <= y < self.height
+
+    def writer_index(self, user_id: Optional[str], nickname: str) -> int:
+        # Пиксели админа хранятся без user_id, поэтому для них ключом служит никнейм
+        key = user_id if user_id is not None else (None, nickname)
+        index = self._user_index.get(key)
+        if index is None:
+            index = len(self.nicknames)
+            self._user_index[key] = index
+            self.user_ids.append(user_id)
+            self.nicknames.append(nickname)
+        elif self.nicknames[index] != nickname:
+            self.nicknames[index] = nickname
+            self.version += 1
+            self.names_version += 1
+        return index
+
+    def rename_user(self, user_id: str, nickname: str):
+        index = self._user_index.get(user_id)
+        if index is not None and self.nicknames[index] != nickname:
+            self.nicknames[index] = nickname
+            self.version += 1
+            self.names_version += 1
+
+    def close(self):
+        pass
+
+    def consistent(self, read: Callable[[], T]) -> T:
+        # Согласованное чтение нескольких массивов; у разделяемого поля - под seqlock
+        return read()
+
+    def older_than(self, x: int, y: int, action_time: datetime) -> bool:
+        # Клетка пуста или изменена раньше action_time
+        i = y * self.width + x
+        stamp = action_time.replace(tzinfo=timezone.utc).timestamp()
+        return self.consistent(lambda: self.writers[i] == EMPTY or self.action_times[i] < stamp)
+
+    def _accepts(self, i: int, stamp: float, origin: int) -> bool:
+        # Равные (время, узел) - повтор с того же сервера: события одного узла приходят по порядку
+        return self.writers[i] == EMPTY or (stamp, origin) >= (self.action_times[i], self.origins[i])
+
+    def set_pixel(self, x: int, y: int, color: int, user_id: Optional[str], nickname: str,
+                  action_time: datetime, node: Optional[str] = None) -> bool:
+        # False - в клетке уже более новое изменение, пиксель не применен
+        i = y * self.width + x
+        stamp, origin = action_time.replace(tzinfo=timezone.utc).timestamp(), node_rank(node)
+        if not self._accepts(i, stamp, origin):
+            return False
+        self.colors[i] = color
+        self.writers[i] = self.writer_index(user_id, nickname)
+        self.action_times[i] = stamp
+        self.origins[i] = origin
+        self.version += 1
+        self.tile_versions[tile_of(x, y)] = self.version
+        return True
+
+    def get_pixel(self, x: int, y: int) -> Optional[dict]:
+        i = y * self.width + x
+        writer = self.writers[i]
+        if writer == EMPTY:
+            return None
+        return {"x": x, "y": y, "color": format_color(self.colors[i]),
+                "user_id": self.user_ids[writer], "nickname": self.nicknames[writer]}
+
+    def pixels(self, bounds: Tuple[int, int, int, int] = None) -> Iterator[Tuple[int, int, str, str]]:
+        width, colors, writers, nicknames = self.width, self.colors, self.writers, self.nicknames
+        if bounds is None:
+            for i, writer in enumerate(writers):
+                if writer != EMPTY:
+                    y, x = divmod(i, width)
+                    yield x, y, format_color(colors[i]), nicknames[writer]
+            return
+        x0, y0, x1, y1 = bounds
+        for y in range(y0, y1):
+            row = y * width
+            for x in range(x0, x1):
+                writer = writers[row + x]
+                if writer != EMPTY:
+                    yield x, y, format_color(colors[row + x]), nicknames[writer]
+
+    async def load(self):
+        rows = await storage.get_canvas_pixels()
+        self._allocate(cfg.FIELD_SIZE)
+        for row in rows:
+            if not self.contains(row['x'], row['y']):
+                continue
+            action_time = row['action_time'] or datetime.utcfromtimestamp(0)
+            self.set_pixel(row['x'], row['y'], parse_color(row['color']), row['user_id'], row['nickname'],
+                           action_time)
+        logger.info(f"Canvas loaded: {len(rows)} pixels, size {self.size}")
+
+    async def reset(self, size: Tuple[int, int], clear_storage: bool = True):
+        # Блокировка очереди не дает фоновой записи вернуть старые пиксели после очистки базы.
+        # clear_storage=False - сброс пришел с другого сервера, базу он уже очистил
+        async with pixel_write_queue.lock:
+            pixel_write_queue.discard()
+            if clear_storage:
+                await storage.clear_game()
+            self._allocate(size)
+
+
+def create_canvas() -> Canvas:
+    if not cfg.CANVAS_SHARED_MEMORY:
+        return Canvas(cfg.FIELD_SIZE)
+    if cfg.BUS_BACKEND != "postgres":
+        # Изменения читателей доходят до писателя только через шину между процессами
+        raise ValueError("CANVAS_SHARED_MEMORY requires BUS_BACKEND=postgres")
+    # Импорт здесь: shared_canvas наследует Canvas из этого модуля
+    from backend.app.api.websocket_core.shared_canvas import SharedCanvas
+    return SharedCanvas(cfg.FIELD_SIZE, cfg.CANVAS_SHARED_MEMORY, cfg.CANVAS_SHARED_MAX_USERS,
+                        cfg.CANVAS_SHARED_NAMES_BYTES)
+
+
+canvas = create_canvas()
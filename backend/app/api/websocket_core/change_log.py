@@ -0,0 +1,52 @@
+import uuid
+from collections import deque
+from typing import Deque, List, Optional, Tuple
+
+from common.app.core.config import config as cfg
+
+"""
+The change log numbers every pixel change with a sequence number and keeps the last
+CHANGE_LOG_SIZE changes in a ring buffer. A reconnecting client sends the last seq it has seen
+and gets only the changes made since then instead of the whole field.
+The epoch identifies the log itself: it changes on server restart and on game reset, so a seq
+from another epoch is never mixed with the current one and the client falls back to a full snapshot.
+"""
+
+Change = Tuple[int, int, int, str, str]  # seq, x, y, color, nickname
+
+
+class ChangeLog:
+    def __init__(self, capacity: int):
+        self._changes: Deque[Change] = deque(maxlen=capacity)
+        self.epoch = uuid.uuid4().hex
+        self.seq = 0
+
+    def append(self, x: int, y: int, color: str, nickname: str) -> int:
+        self.seq += 1
+        self._changes.append((self.seq, x, y, color, nickname))
+        return self.seq
+
+    def since(self, epoch: Optional[str], since_seq: int) -> Optional[List[Change]]:
+        """
+        Изменения после since_seq, по одному (последнему) на клетку, в порядке seq.
+        None, если клиент из другой эпохи или отстал сильнее, чем хранит буфер.
+        """
+        if epoch != self.epoch or not (0 <= since_seq <= self.seq):
+            return None
+        oldest = self._changes[0][0] if self._changes else self.seq + 1
+        if since_seq < oldest - 1:
+            return None
+        latest = {}
+        for change in reversed(self._changes):
+            if change[0] <= since_seq:
+                break
+            latest.setdefault((change[1], change[2]), change)
+        return sorted(latest.values())
+
+    def reset(self):
+        self._changes.clear()
+        self.epoch = uuid.uuid4().hex
+        self.seq = 0
+
+
+change_log = ChangeLog(cfg.CHANGE_LOG_SIZE)
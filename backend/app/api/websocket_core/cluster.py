@@ -0,0 +1,107 @@
+import asyncio
+from datetime import datetime
+
+from backend.app.api.websocket_core.bus import Event
+from backend.app.api.websocket_core.canvas import canvas, parse_color
+from backend.app.api.websocket_core.connection_manager import manager
+from backend.app.api.websocket_core.handlers import apply_pixel, apply_cooldown, apply_reset, kick_user, \
+    drain_server, HOST
+from backend.app.api.websocket_core.rate_limiter import cooldown_tracker
+from backend.app.api.websocket_core.write_queue import pixel_write_queue
+from backend.app.schemas.data_models import PositionData
+from common.app.core.config import config as cfg
+from common.app.db.storage import storage
+
+"""
+Handlers for events that come over the bus from other server processes.
+They apply the change to this process's state and notify local clients, without publishing it again.
+The process that received the original message is the one that writes it to the database.
+join_cluster starts the node: it subscribes to the bus before loading the field, so no pixel published
+by another process is missed. Events that arrive during the load are held and applied after it.
+A pixel another process published just before the subscription may still be in that process's write
+queue, so with a shared bus the node waits for those queues to be flushed before it loads the field.
+The same catch-up runs when the bus listener reconnects (a "resync" event).
+A "drain" event stops the node only if it runs on the host named in the event.
+"""
+
+
+def _settle_delay() -> float:
+    # Очередь записи соседа сбрасывается раз в интервал: через два интервала его пиксели уже в базе
+    return 2 * cfg.PIXEL_WRITE_FLUSH_INTERVAL_MS / 1000 if cfg.BUS_BACKEND != "memory" else 0
+
+
+async def on_pixel(event: Event):
+    if not canvas.contains(event["x"], event["y"]):
+        return
+    action_time = datetime.fromisoformat(event["action_time"])
+    if event["user_id"] is not None:
+        # Пользователь может быть подключен и к этому серверу: cooldown общий
+        cooldown_tracker.seed(event["user_id"], action_time)
+    await apply_pixel(event["x"], event["y"], parse_color(event["color"]), event["user_id"], event["nickname"],
+                      action_time, event["node"])
+
+
+async def on_selection(event: Event):
+    position = PositionData(**event["position"]) if event["position"] else None
+    await manager.update_selection(event["nickname"], position, publish=False)
+
+
+async def on_presence(event: Event):
+    manager.presence.remote_update(event["node"], event["online"], event["joined"], event["left"])
+
+
+async def on_kick(event: Event):
+    await kick_user(event["user_id"])
+
+
+async def on_cooldown(event: Event):
+    await apply_cooldown(event["value"])
+
+
+async def on_reset(event: Event):
+    await apply_reset(tuple(event["size"]), clear_storage=False)
+
+
+async def on_drain(event: Event):
+    # Остановку хоста запросили у соседнего воркера
+    if event["host"] == HOST:
+        await drain_server()
+
+
+async def on_resync(event: Event):
+    # Шина переподключилась: пиксели, разосланные за время обрыва, берем из хранилища.
+    # Свои изменения сначала дописываем, чтобы сравнивать поле с полной базой
+    await pixel_write_queue.flush()
+    await asyncio.sleep(_settle_delay())
+    for row in await storage.get_canvas_pixels():
+        action_time = row['action_time'] or datetime.utcfromtimestamp(0)
+        if canvas.contains(row['x'], row['y']) and canvas.older_than(row['x'], row['y'], action_time):
+            await apply_pixel(row['x'], row['y'], parse_color(row['color']), row['user_id'], row['nickname'],
+                              action_time, None)
+
+
+EVENT_HANDLERS = {
+    "pixel": on_pixel,
+    "selection": on_selection,
+    "presence": on_presence,
+    "kick": on_kick,
+    "cooldown": on_cooldown,
+    "reset": on_reset,
+    "drain": on_drain,
+    "resync": on_resync,
+}
+
+
+async def handle_bus_event(event: Event):
+    handler = EVENT_HANDLERS.get(event.get("type"))
+    if handler is not None:
+        await handler(event)
+
+
+async def join_cluster():
+    bus = manager.bus
+    bus.hold()
+    await bus.start(handle_bus_event)
+    await asyncio.sleep(_settle_delay())
+    await canvas.load()
+    await bus.release()
@@ -0,0 +1,61 @@
+import gzip
+import time
+import zlib
+from typing import Dict, Optional, Union
+
+from backend.app.prometheus.metrics import ws_compression_bytes_in, ws_compression_bytes_saved, \
+    ws_compression_cpu_seconds
+from common.app.core.config import config as cfg
+
+"""
+Application-level compression of outbound messages. A client opts in with "compression" in its login
+message; it then receives large messages of the types listed in COMPRESSION_MESSAGE_TYPES as binary
+frames holding the compressed JSON, everything else stays a text frame.
+permessage-deflate would compress a broadcast once per socket; here a SharedFrame compresses a message
+at most once per encoding and every recipient that negotiated that encoding gets the same bytes.
+Messages shorter than COMPRESSION_MIN_BYTES, and messages that do not get smaller, are sent as they are.
+"""
+
+COMPRESSORS = {
+    "gzip": lambda payload: gzip.compress(payload, compresslevel=cfg.COMPRESSION_LEVEL),
+    "deflate": lambda payload: zlib.compress(payload, cfg.COMPRESSION_LEVEL),
+}
+
+
+def compress(encoding: str, payload: bytes, message_type: str) -> bytes:
+    started = time.thread_time()
+    data = COMPRESSORS[encoding](payload)
+    ws_compression_cpu_seconds.labels(type=message_type).inc(time.thread_time() - started)
+    ws_compression_bytes_in.labels(type=message_type, encoding=encoding).inc(len(payload))
+    ws_compression_bytes_saved.labels(type=message_type, encoding=encoding).inc(max(len(payload) - len(data), 0))
+    return data
+
+
+def should_compress(message_type: Optional[str], size: int) -> bool:
+    return message_type in cfg.COMPRESSION_MESSAGE_TYPES and size >= cfg.COMPRESSION_MIN_BYTES
+
+
+class SharedFrame:
+    """
+    Одно сообщение для многих получателей: сжатая копия строится один раз на кодировку
+    """
+    __slots__ = ("message_type", "text", "_encoded")
+
+    def __init__(self, message_type: Optional[str], text: str):
+        self.message_type = message_type
+        self.text = text
+        self._encoded: Dict[str, Union[str, bytes]] = {}
+
+    def for_encoding(self, encoding: Optional[str]) -> Union[str, bytes]:
+        if encoding is None or self.message_type not in cfg.COMPRESSION_MESSAGE_TYPES:
+            return self.text
+        data = self._encoded.get(encoding)
+        if data is None:
+            payload = self.text.encode()
+            data = self.text
+            if should_compress(self.message_type, len(payload)):
+                compressed = compress(encoding, payload, self.message_type)
+                if len(compressed) < len(payload):
+                    data = compressed
+            self._encoded[encoding] = data
+        return data
@@ -1,93 +1,324 @@
-from typing import List, Tuple, Optional, Dict
+import asyncio
+import itertools
+import logging
+import random
+import time
+from typing import Optional, Dict, Set, FrozenSet, Iterable, Callable, Tuple
 
 from fastapi import WebSocket
 from starlette.websockets import WebSocketState
 
-from backend.app.prometheus.metrics import active_connections_gauge
+from backend.app.api.websocket_core.broadcast_scheduler import BroadcastScheduler
+from backend.app.api.websocket_core.bus import Bus, bus as default_bus
+from backend.app.api.websocket_core.change_log import change_log
+from backend.app.api.websocket_core.compression import SharedFrame
+from backend.app.api.websocket_core.heartbeat import Heartbeat
+from backend.app.api.websocket_core.presence import Presence
+from backend.app.api.websocket_core.registry import ConnectionRegistry, Session
+from backend.app.api.websocket_core.send_queue import SendQueue, Message
+from backend.app.api.websocket_core.tiles import Tile, tile_of
+from backend.app.api.websocket_core.wire_codec import encode_pixel, encode_selection
+from backend.app.prometheus.metrics import active_connections_gauge, ws_send_queue_depth, \
+    ws_slow_consumer_resyncs, ws_slow_consumer_evictions, server_draining, ws_drain_seconds, ws_broadcast_seconds, \
+    ws_broadcast_recipients
 from backend.app.schemas.admin.admin_respones import AdminUserInfoResponse
 from backend.app.schemas.data_models import PositionData, UserInfoData, \
     SelectionUpdateBroadcastData
-from backend.app.schemas.user.user_respones import SelectionUpdateResponse, OnlineCountResponse, PixelUpdateResponse
+from backend.app.schemas.user.user_respones import SelectionUpdateResponse, PixelUpdateResponse, \
+    ResyncRequiredResponse, ReconnectResponse
+from common.app.core.config import config as cfg
+
+logger = logging.getLogger(__name__)
+
+# Метрики рассылки по типу сообщения: дочерние метрики создаются один раз на тип
+_fanout_metrics: Dict[Optional[str], Tuple] = {}
+
+
+def _observe_fanout(message_type: Optional[str], started: float, recipients: int):
+    metrics = _fanout_metrics.get(message_type)
+    if metrics is None:
+        label = message_type or "other"
+        metrics = _fanout_metrics[message_type] = (ws_broadcast_seconds.labels(type=label),
+                                                   ws_broadcast_recipients.labels(type=label))
+    metrics[0].observe(time.perf_counter() - started)
+    metrics[1].observe(recipients)
 
 
 class ConnectionManager:
-    def __init__(self):
-        self.active_connections: List[Tuple[WebSocket, str]] = []
-        self.admin_connections: List[WebSocket] = []
-        self.nicknames: Dict[WebSocket, str] = {}
+    def __init__(self, bus: Bus = default_bus):
+        # Через шину события доходят до менеджеров других процессов
+        self.bus = bus
+        self.registry = ConnectionRegistry()
         self.selections: Dict[str, PositionData] = {}
+        self.selections_version = 0
+        # Подписки на тайлы: клиенты без viewport получают обновления всего поля
+        self.full_subscribers: Set[Session] = set()
+        self.tile_subscribers: Dict[Tile, Set[Session]] = {}
+        self._evictions: Set[asyncio.Task] = set()
+        # При BROADCAST_TICK_MS > 0 пиксели и выделения рассылаются пакетами раз в тик
+        self.scheduler = BroadcastScheduler(self, cfg.BROADCAST_TICK_MS)
+        self.presence = Presence(self, cfg.PRESENCE_INTERVAL_MS, bus, cfg.CLUSTER_HEARTBEAT_S)
+        self.heartbeat = Heartbeat(self, cfg.HEARTBEAT_INTERVAL_S, cfg.HEARTBEAT_TIMEOUT_S)
+        self.draining = False  # сервер останавливается: новые входы не принимаются
+
+    @property
+    def online_count(self) -> int:
+        return len(self.registry)
+
+    def subscribe_viewport(self, websocket: WebSocket, tiles: Optional[FrozenSet[Tile]]) -> bool:
+        # Админы получают обновления всего поля и не подписываются
+        session = self.registry.get(websocket)
+        if session is None or session.is_admin:
+            return False
+        self._unsubscribe_viewport(session)
+        session.tiles = tiles
+        if tiles is None:
+            self.full_subscribers.add(session)
+            return True
+        for tile in tiles:
+            self.tile_subscribers.setdefault(tile, set()).add(session)
+        return True
+
+    def _unsubscribe_viewport(self, session: Session):
+        self.full_subscribers.discard(session)
+        for tile in session.tiles or ():
+            subscribers = self.tile_subscribers.get(tile)
+            if subscribers is not None:
+                subscribers.discard(session)
+                if not subscribers:
+                    del self.tile_subscribers[tile]
+        session.tiles = None
 
-    async def broadcast(self, message: str, recipients: List[WebSocket] = None):
+    def tile_recipients(self, tiles: Iterable[Tile]) -> Iterable[Session]:
+        # Сессия подписана либо на всё поле, либо на тайлы, а админы не подписываются вовсе: эти множества
+        # не пересекаются и обходятся без копирования. Повторы возможны только у подписчиков нескольких тайлов.
+        # Рассылка кладет сообщения в очереди без await, поэтому множества не меняются во время обхода
+        tile_sets = [subscribers for subscribers in map(self.tile_subscribers.get, tiles) if subscribers]
+        if len(tile_sets) > 1:
+            tile_sets = [set().union(*tile_sets)]
+        return itertools.chain(self.full_subscribers, *tile_sets, self.registry.admins.values())
+
+    def send(self, message: str, recipients: Iterable[Session] = None, message_type: str = None):
+        # Рассылка не ждет клиентов: одно и то же сообщение кладется в очереди получателей
         if recipients is None:
-            recipients = [conn for conn, _ in self.active_connections] + self.admin_connections
-        for connection in recipients:
-            if connection.client_state == WebSocketState.CONNECTED:
-                try:
-                    await connection.send_text(message)
-                except Exception as e:
-                    print(f"Error sending message: {e}")
-
-    async def update_selection(self, nickname: str, position: Optional[PositionData]):
+            recipients = self.registry
+        started = time.perf_counter()
+        frame = SharedFrame(message_type, message)
+        count = 0
+        for session in recipients:
+            session.outbox.put(frame.for_encoding(session.compression))
+            count += 1
+        _observe_fanout(message_type, started, count)
+
+    def send_encoded(self, recipients: Iterable[Session], text: Callable[[], str], binary: Callable[[], bytes],
+                     message_type: str = None):
+        # Сообщение кодируется не больше одного раза на протокол и только если есть его получатели
+        started = time.perf_counter()
+        frame = binary_message = None
+        count = 0
+        for session in recipients:
+            if session.binary:
+                if binary_message is None:
+                    binary_message = binary()
+                session.outbox.put(binary_message)
+            else:
+                if frame is None:
+                    frame = SharedFrame(message_type, text())
+                session.outbox.put(frame.for_encoding(session.compression))
+            count += 1
+        _observe_fanout(message_type, started, count)
+
+    def reply(self, websocket: WebSocket, message: Message):
+        # Ответ на запрос клиента идет через его очередь: после уже поставленных рассылок и без ожидания клиента
+        session = self.registry.get(websocket)
+        if session is not None:
+            session.outbox.put(message)
+
+    async def broadcast(self, message: str, recipients: Iterable[Session] = None, message_type: str = None):
+        self.send(message, recipients, message_type)
+
+    def _open_session(self, session: Session):
+        session.outbox = SendQueue(session.websocket, cfg.SEND_QUEUE_SIZE,
+                                   lambda outbox: self._on_slow_consumer(session))
+        session.outbox.start()
+        self.registry.add(session)
+
+    def _on_slow_consumer(self, session: Session):
+        outbox = session.outbox
+        if cfg.SLOW_CONSUMER_POLICY == "resync" and not outbox.resync_pending:
+            # Пропущенные обновления клиент доберет через get_field_delta
+            outbox.resync_pending = True
+            outbox.replace(ResyncRequiredResponse(seq=change_log.seq, epoch=change_log.epoch).json())
+            ws_slow_consumer_resyncs.inc()
+            return
+        # Не успел разгрузить очередь и после сброса - отключаем
+        outbox.close()
+        ws_slow_consumer_evictions.inc()
+        task = asyncio.create_task(self.disconnect(session.websocket, code=1013, reason="Slow consumer"))
+        self._evictions.add(task)
+        task.add_done_callback(self._evictions.discard)
+
+    async def update_selection(self, nickname: str, position: Optional[PositionData], publish: bool = True):
+        if publish:
+            self.bus.publish({"type": "selection", "nickname": nickname,
+                              "position": {"x": position.x, "y": position.y} if position else None})
         if position:
+            previous = self.selections.get(nickname)
             self.selections[nickname] = position
         else:
-            self.selections.pop(nickname, None)
-        await self.broadcast_selection_update(nickname, position)
-
-    async def broadcast_selection_update(self, nickname: str, position: Optional[PositionData]):
-        broadcast_message = SelectionUpdateResponse(
-            data=SelectionUpdateBroadcastData(
-                nickname=nickname,
-                position=position
-            )
-        ).json()
-        await self.broadcast(broadcast_message)
-
-    async def connect(self, websocket: WebSocket, nickname: str, user_id: str):
-        self.active_connections.append((websocket, user_id))
-        self.nicknames[websocket] = nickname
-        active_connections_gauge.set(len(self.active_connections))
-        await self.notify_updates()
+            previous = self.selections.pop(nickname, None)
+        self.selections_version += 1
+        await self.broadcast_selection_update(nickname, position, previous)
 
-    async def disconnect(self, websocket: WebSocket, code=1000, reason="Normal Closure"):
-        self.active_connections = [(conn, uid) for conn, uid in self.active_connections if conn != websocket]
-        nickname = self.nicknames.pop(websocket, None)
-        if nickname:
-            await self.broadcast_selection_update(nickname, None)
-            self.selections.pop(nickname, None)
+    async def broadcast_selection_update(self, nickname: str, position: Optional[PositionData],
+                                         previous: Optional[PositionData] = None):
+        if self.scheduler.enabled:
+            self.scheduler.add_selection(nickname, position, previous)
+            return
+        # Выделение интересно тем, кто видит старую или новую позицию
+        tiles = {tile_of(p.x, p.y) for p in (position, previous) if p is not None}
+        self.send_encoded(
+            self.tile_recipients(tiles),
+            lambda: SelectionUpdateResponse(
+                data=SelectionUpdateBroadcastData(
+                    nickname=nickname,
+                    position=position
+                )
+            ).json(),
+            lambda: encode_selection(nickname, (position.x, position.y) if position else None),
+            message_type="selection_update",
+        )
+
+    async def connect(self, websocket: WebSocket, nickname: str, user_id: str, binary: bool = False,
+                      compression: Optional[str] = None, heartbeat: bool = False) -> Session:
+        session = Session(websocket, user_id, nickname, binary=binary, compression=compression, heartbeat=heartbeat)
+        self._open_session(session)
+        self.full_subscribers.add(session)
+        active_connections_gauge.set(self.online_count)
+        # Новый клиент сразу узнает онлайн, остальные - в очередном отчете присутствия
+        session.outbox.put(self.presence.online_message)
+        if len(self.registry.by_user[user_id]) == 1:
+            self.presence.user_joined(user_id, nickname)
+        else:
+            self.presence.changed()
+        return session
+
+    def connect_admin(self, websocket: WebSocket, nickname: str, compression: Optional[str] = None,
+                      heartbeat: bool = False) -> Session:
+        session = Session(websocket, None, nickname, is_admin=True, compression=compression, heartbeat=heartbeat)
+        self._open_session(session)
+        return session
+
+    def disconnect_admin(self, websocket: WebSocket):
+        session = self.registry.remove(websocket)
+        if session is not None:
+            session.outbox.close()
+
+    async def _release(self, session: Session):
+        # Сессия уже удалена из реестра: освобождаем ее подписки, выделение и место в онлайне
+        session.outbox.close()
+        if session.is_admin:
+            return
+        self._unsubscribe_viewport(session)
+        # Выделение принадлежит нику: снимаем его, только если закрылся последний сокет
+        if not self.registry.by_nickname.get(session.nickname) and session.nickname in self.selections:
+            await self.update_selection(session.nickname, None)
+        if session.user_id in self.registry.by_user:
+            self.presence.changed()
+        else:
+            self.presence.user_left(session.user_id, session.nickname)
+
+    @staticmethod
+    async def _close_socket(websocket: WebSocket, code: int, reason: str):
         try:
             if websocket.client_state == WebSocketState.CONNECTED:
                 await websocket.close(code=code, reason=reason)
         except RuntimeError as e:
             print(f"RuntimeError: {e}", flush=True)
-        active_connections_gauge.set(len(self.active_connections))
-        await self.notify_updates()
 
-    async def notify_updates(self):
-        await self.broadcast_online_count()
-        await self.broadcast_users_info()
+    async def disconnect(self, websocket: WebSocket, code=1000, reason="Normal Closure"):
+        session = self.registry.remove(websocket)
+        if session is not None:
+            await self._release(session)
+        await self._close_socket(websocket, code, reason)
+        active_connections_gauge.set(self.online_count)
 
-    async def broadcast_online_count(self):
-        online_count = len(self.active_connections)
-        message = OnlineCountResponse(data={"online": online_count}).json()
-        await self.broadcast(message)
+    async def disconnect_many(self, sessions: Iterable[Session], code: int, reason: str):
+        # Пачка отключений: присутствие уйдет одним отчетом, сокеты закрываются параллельно
+        released = []
+        for session in sessions:
+            if self.registry.remove(session.websocket) is not None:
+                await self._release(session)
+                released.append(session)
+        await asyncio.gather(*(self._close_socket(session.websocket, code, reason) for session in released),
+                             return_exceptions=True)
+        active_connections_gauge.set(self.online_count)
 
     async def broadcast_users_info(self):
-        users_info = [UserInfoData(nickname=self.nicknames[websocket], id=user_id) for websocket, user_id in
-                      self.active_connections if websocket in self.nicknames]
+        # Полный список - по запросу админа, дальше изменения приходят через users_diff
+        users_info = [UserInfoData(nickname=next(iter(sessions.values())).nickname, id=user_id)
+                      for user_id, sessions in self.registry.by_user.items()]
         message = AdminUserInfoResponse(data=users_info).json()
-        await self.broadcast(message, recipients=self.admin_connections)
+        await self.broadcast(message, recipients=self.registry.admins.values(), message_type="users_info_update")
 
     async def broadcast_pixel_update(self, x: int, y: int, color: str, nickname: str):
-        message = PixelUpdateResponse(data={"x": x, "y": y, "color": color, "nickname": nickname}).json()
-        await self.broadcast(message)
+        seq = change_log.append(x, y, color, nickname)
+        if self.scheduler.enabled:
+            self.scheduler.add_pixel(seq, x, y, color, nickname)
+            return
+        self.send_encoded(
+            self.tile_recipients((tile_of(x, y),)),
+            lambda: PixelUpdateResponse(seq=seq, data={"x": x, "y": y, "color": color, "nickname": nickname}).json(),
+            lambda: encode_pixel(seq, x, y, color, nickname),
+            message_type="pixel_update",
+        )
 
     async def disconnect_everyone(self):
-        for connection, _ in self.active_connections:
-            await connection.close(code=1001, reason="Server shutdown")
-        self.active_connections.clear()
-        self.nicknames.clear()
+        # Админские соединения переживают сброс игры
+        self.scheduler.discard()
+        sessions = list(self.registry.users())
+        for session in sessions:
+            self.registry.remove(session.websocket)
+            session.outbox.close()
+            if session.user_id not in self.registry.by_user:
+                self.presence.user_left(session.user_id, session.nickname)
+        await asyncio.gather(*(self._close_socket(session.websocket, 1001, "Server shutdown") for session in sessions),
+                             return_exceptions=True)
+        self.full_subscribers.clear()
+        self.tile_subscribers.clear()
         self.selections.clear()
+        self.selections_version += 1
+
+    async def drain(self, timeout_s: float, jitter_ms: int, keep: Optional[WebSocket] = None):
+        """
+        Закрывает все соединения перед остановкой сервера, не дольше timeout_s.
+        Каждый клиент получает свою задержку переподключения в пределах jitter_ms,
+        чтобы после выкладки клиенты не пришли на новые серверы все разом.
+        Соединение keep (админ, запросивший остановку) остается открытым до остановки процесса.
+        """
+        if self.draining:
+            return
+        self.draining = True
+        server_draining.set(1)
+        started = time.monotonic()
+        self.heartbeat.stop()
+        # Накопленные за тик обновления уходят до прощального сообщения
+        self.scheduler.flush()
+        sessions = [session for session in self.registry if session.websocket is not keep]
+        for session in sessions:
+            session.outbox.put(ReconnectResponse(data={"retry_after_ms": random.randint(0, jitter_ms)}).json())
+        # Половина срока - на то, чтобы очереди разгрузились, остальное - на закрытие
+        while any(len(session.outbox) for session in sessions) and time.monotonic() - started < timeout_s / 2:
+            await asyncio.sleep(0.05)
+        try:
+            await asyncio.wait_for(self.disconnect_many(sessions, code=1012, reason="Server is restarting"),
+                                   max(timeout_s - (time.monotonic() - started), 0))
+        except asyncio.TimeoutError:
+            logger.warning("Drain timed out, some sockets were left open")
+        # Другие серверы сразу узнают, что пользователей этого больше нет
+        self.presence.flush()
+        ws_drain_seconds.observe(time.monotonic() - started)
 
 
 manager = ConnectionManager()
+ws_send_queue_depth.set_function(lambda: sum(len(session.outbox) for session in manager.registry))
@@ -0,0 +1,154 @@
+import json
+from typing import Annotated, Any, Awaitable, Callable, Dict, NamedTuple, Tuple, Type, Union
+
+from fastapi import WebSocket
+from pydantic import BaseModel, Field, TypeAdapter
+
+from backend.app.api.websocket_core.handlers import (
+    handle_update_pixel, handle_selection_update, handle_send_field_state, handle_online_count,
+    handle_change_cooldown, handle_pixel_info, handle_ban_user, handle_reset_game, handle_disconnect,
+    handle_send_cooldown, handle_get_online_info_admin, handle_send_field_delta, handle_subscribe_viewport,
+    handle_send_tile_state, handle_drain_server, handle_loop_stats,
+)
+from backend.app.prometheus.metrics import ws_message_seconds
+from backend.app.schemas.admin.admin_requests import AdminPixelUpdateRequest, AdminPixelInfoRequest, \
+    AdminBanUserRequest, AdminChangeCooldownRequest, AdminResetGameRequest, AdminGetOnlineInfoRequest, \
+    AdminDrainServerRequest, AdminLoopStatsRequest
+from backend.app.schemas.user.user_requests import PixelUpdateRequest, SelectionUpdateRequest, DisconnectRequest, \
+    GetFieldStateRequest, GetFieldDeltaRequest, SubscribeViewportRequest, GetTileStateRequest, \
+    GetOnlineCountRequest, GetCooldownRequest, PongRequest
+
+try:
+    import orjson
+except ImportError:  # orjson необязателен, без него разбираем стандартным json
+    orjson = None
+
+"""
+Routing table for incoming websocket messages, built once at import time.
+Every message type maps to its request model, its handler and whether only admins may send it.
+The request models form a union discriminated by "type", so validation goes straight to the
+right model instead of trying them one by one. Messages are decoded once (with orjson when it is
+installed): the rate limiter and the permission check need the type before the message is validated.
+"""
+
+Handler = Callable[[WebSocket, Any, Tuple[str, str]], Awaitable[None]]
+
+
+class Route(NamedTuple):
+    model: Type[BaseModel]
+    handler: Handler
+    admin_only: bool = False
+    # Отвечать ли ошибкой на сообщение сверх лимита; частые сообщения без ответа отбрасываются молча
+    reply_when_limited: bool = True
+
+
+async def _disconnect(websocket: WebSocket, request: DisconnectRequest, user: Tuple[str, str]):
+    await handle_disconnect(websocket, request)
+
+
+async def _update_pixel(websocket: WebSocket, request: PixelUpdateRequest, user: Tuple[str, str]):
+    await handle_update_pixel(websocket, request, user, permission=False)
+
+
+async def _update_pixel_admin(websocket: WebSocket, request: AdminPixelUpdateRequest, user: Tuple[str, str]):
+    await handle_update_pixel(websocket, request, user, permission=True)
+
+
+async def _update_selection(websocket: WebSocket, request: SelectionUpdateRequest, user: Tuple[str, str]):
+    await handle_selection_update(websocket, request, user)
+
+
+async def _field_state(websocket: WebSocket, request: GetFieldStateRequest, user: Tuple[str, str]):
+    await handle_send_field_state(websocket, request)
+
+
+async def _field_delta(websocket: WebSocket, request: GetFieldDeltaRequest, user: Tuple[str, str]):
+    await handle_send_field_delta(websocket, request)
+
+
+async def _subscribe_viewport(websocket: WebSocket, request: SubscribeViewportRequest, user: Tuple[str, str]):
+    await handle_subscribe_viewport(websocket, request)
+
+
+async def _tile_state(websocket: WebSocket, request: GetTileStateRequest, user: Tuple[str, str]):
+    await handle_send_tile_state(websocket, request)
+
+
+async def _online_count(websocket: WebSocket, request: GetOnlineCountRequest, user: Tuple[str, str]):
+    await handle_online_count(websocket)
+
+
+async def _cooldown(websocket: WebSocket, request: GetCooldownRequest, user: Tuple[str, str]):
+    await handle_send_cooldown(websocket)
+
+
+async def _pong(websocket: WebSocket, request: PongRequest, user: Tuple[str, str]):
+    # Ответ на ping: время активности уже обновлено при получении сообщения
+    pass
+
+
+async def _pixel_info(websocket: WebSocket, request: AdminPixelInfoRequest, user: Tuple[str, str]):
+    await handle_pixel_info(websocket, request)
+
+
+async def _ban_user(websocket: WebSocket, request: AdminBanUserRequest, user: Tuple[str, str]):
+    await handle_ban_user(websocket, request)
+
+
+async def _change_cooldown(websocket: WebSocket, request: AdminChangeCooldownRequest, user: Tuple[str, str]):
+    await handle_change_cooldown(request.data)
+
+
+async def _reset_game(websocket: WebSocket, request: AdminResetGameRequest, user: Tuple[str, str]):
+    await handle_reset_game(websocket, request)
+
+
+async def _online_info(websocket: WebSocket, request: AdminGetOnlineInfoRequest, user: Tuple[str, str]):
+    await handle_get_online_info_admin(websocket)
+
+
+async def _drain_server(websocket: WebSocket, request: AdminDrainServerRequest, user: Tuple[str, str]):
+    await handle_drain_server(websocket)
+
+
+async def _loop_stats(websocket: WebSocket, request: AdminLoopStatsRequest, user: Tuple[str, str]):
+    await handle_loop_stats(websocket)
+
+
+ROUTES: Dict[str, Route] = {
+    "disconnect": Route(DisconnectRequest, _disconnect),
+    "update_pixel": Route(PixelUpdateRequest, _update_pixel),
+    "update_selection": Route(SelectionUpdateRequest, _update_selection, reply_when_limited=False),
+    "get_field_state": Route(GetFieldStateRequest, _field_state),
+    "get_field_delta": Route(GetFieldDeltaRequest, _field_delta),
+    "subscribe_viewport": Route(SubscribeViewportRequest, _subscribe_viewport),
+    "get_tile_state": Route(GetTileStateRequest, _tile_state),
+    "get_online_count": Route(GetOnlineCountRequest, _online_count),
+    "get_cooldown": Route(GetCooldownRequest, _cooldown),
+    "pong": Route(PongRequest, _pong, reply_when_limited=False),
+    # Административные сообщения
+    "update_pixel_admin": Route(AdminPixelUpdateRequest, _update_pixel_admin, admin_only=True),
+    "pixel_info_admin": Route(AdminPixelInfoRequest, _pixel_info, admin_only=True),
+    "toggle_ban_user_admin": Route(AdminBanUserRequest, _ban_user, admin_only=True),
+    "update_cooldown_admin": Route(AdminChangeCooldownRequest, _change_cooldown, admin_only=True),
+    "reset_game_admin": Route(AdminResetGameRequest, _reset_game, admin_only=True),
+    "get_online_info_admin": Route(AdminGetOnlineInfoRequest, _online_info, admin_only=True),
+    "drain_server_admin": Route(AdminDrainServerRequest, _drain_server, admin_only=True),
+    "loop_stats_admin": Route(AdminLoopStatsRequest, _loop_stats, admin_only=True),
+}
+
+# Какие типы сообщений разрешены: ключ - является ли отправитель админом
+ALLOWED_TYPES: Dict[bool, frozenset] = {
+    False: frozenset(message_type for message_type, route in ROUTES.items() if not route.admin_only),
+    True: frozenset(ROUTES),
+}
+
+# Гистограмма времени обработки на каждый тип; сообщения неизвестных типов считаются вместе
+MESSAGE_SECONDS = {message_type: ws_message_seconds.labels(type=message_type) for message_type in ROUTES}
+UNKNOWN_MESSAGE_SECONDS = ws_message_seconds.labels(type="unknown")
+
+request_adapter: TypeAdapter = TypeAdapter(
+    Annotated[Union[tuple(route.model for route in ROUTES.values())], Field(discriminator="type")]
+)
+
+loads: Callable[[Union[str, bytes]], Any] = orjson.loads if orjson is not None else json.loads
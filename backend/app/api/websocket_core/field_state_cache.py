@@ -0,0 +1,114 @@
+import json
+from typing import Dict, Optional, Tuple
+
+from common.app.core.config import config as cfg
+from backend.app.api.websocket_core.canvas import canvas
+from backend.app.api.websocket_core.change_log import change_log
+from backend.app.api.websocket_core.compression import compress
+from backend.app.api.websocket_core.connection_manager import manager
+from backend.app.api.websocket_core.snapshot_codec import encode_snapshot
+from backend.app.api.websocket_core.tiles import Tile, tile_bounds
+
+"""
+The field state cache keeps the serialized field_state message for the current version of the field,
+so any number of clients asking for the field between two changes cost a single serialization.
+The version is made of the canvas version, the change log position, the selections version,
+the cooldown and the field size.
+Pixels and selections are serialized separately: a cursor move does not re-serialize the pixels.
+The binary snapshot and compressed copies are built lazily, once per version and encoding.
+Per-tile pixels are cached the same way, keyed by the canvas version of the last change in the tile.
+"""
+
+def _dumps(obj) -> str:
+    # Тот же компактный формат, что и у pydantic .json()
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False)
+
+
+class FieldStateCache:
+    def __init__(self):
+        self._pixels_version: Optional[int] = None
+        self._pixels_json = "[]"
+        self._selections_version: Optional[int] = None
+        self._selections_json = "[]"
+        self._key: Optional[tuple] = None
+        self._payload = ""
+        self._payload_bytes = b""
+        self._binary: Optional[bytes] = None
+        self._compressed: Dict[Tuple[str, bool], bytes] = {}
+        self._tiles: Dict[Tile, Tuple[tuple, str]] = {}
+
+    @property
+    def version(self) -> tuple:
+        return canvas.version, change_log.epoch, change_log.seq, manager.selections_version, cfg.COOLDOWN, \
+            canvas.size
+
+    def _render_pixels(self, bounds: Tuple[int, int, int, int] = None) -> str:
+        return canvas.consistent(lambda: _dumps([{"position": {"x": x, "y": y}, "color": color, "nickname": nickname}
+                                                 for x, y, color, nickname in canvas.pixels(bounds)]))
+
+    def _render_selections(self) -> str:
+        return _dumps([{"nickname": nickname, "position": {"x": position.x, "y": position.y}}
+                       for nickname, position in manager.selections.items()])
+
+    def _refresh(self):
+        key = self.version
+        if key == self._key:
+            return
+        canvas_version, epoch, seq, selections_version, cooldown, size = key
+        if canvas_version != self._pixels_version:
+            self._pixels_json = self._render_pixels()
+            self._pixels_version = canvas_version
+        if selections_version != self._selections_version:
+            self._selections_json = self._render_selections()
+            self._selections_version = selections_version
+        self._payload = (f'{{"type":"field_state","cooldown":{cooldown},"size":[{size[0]},{size[1]}],'
+                         f'"seq":{seq},"epoch":"{epoch}",'
+                         f'"data":{{"pixels":{self._pixels_json},"selections":{self._selections_json}}}}}')
+        self._payload_bytes = self._payload.encode()
+        self._binary = None
+        self._compressed = {}
+        self._key = key
+
+    def payload(self) -> str:
+        self._refresh()
+        return self._payload
+
+    def payload_bytes(self) -> bytes:
+        self._refresh()
+        return self._payload_bytes
+
+    def binary(self) -> bytes:
+        self._refresh()
+        if self._binary is None:
+            _, epoch, seq, _, cooldown, _ = self._key
+            self._binary = canvas.consistent(
+                lambda: encode_snapshot(canvas, manager.selections, cooldown, seq, epoch))
+        return self._binary
+
+    def compressed(self, encoding: str, binary: bool = False) -> bytes:
+        self._refresh()
+        data = self._compressed.get((encoding, binary))
+        if data is None:
+            payload = self.binary() if binary else self._payload_bytes
+            data = self._compressed[(encoding, binary)] = compress(encoding, payload, "field_state")
+        return data
+
+    def tile_payload(self, tile: Tile) -> str:
+        key = canvas.tile_versions.get(tile, 0), canvas.names_version, canvas.size
+        cached = self._tiles.get(tile)
+        bounds = tile_bounds(tile, canvas.size)
+        if cached is None or cached[0] != key:
+            if cached is not None and cached[0][2] != canvas.size:
+                # Поле пересоздано с другим размером: старые тайлы больше не нужны
+                self._tiles.clear()
+            cached = self._tiles[tile] = key, self._render_pixels(bounds)
+        x0, y0, x1, y1 = bounds
+        selections = _dumps([{"nickname": nickname, "position": {"x": position.x, "y": position.y}}
+                             for nickname, position in manager.selections.items()
+                             if x0 <= position.x < x1 and y0 <= position.y < y1])
+        return (f'{{"type":"tile_state","tile":[{tile[0]},{tile[1]}],"tile_size":{cfg.TILE_SIZE},'
+                f'"seq":{change_log.seq},"epoch":"{change_log.epoch}",'
+                f'"data":{{"pixels":{cached[1]},"selections":{selections}}}}}')
+
+
+field_state_cache = FieldStateCache()
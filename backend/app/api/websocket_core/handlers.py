@@ -1,18 +1,29 @@
+import socket
 from datetime import datetime
-from typing import Tuple
+from typing import Optional, Tuple
 
 from fastapi import WebSocket
 
 from backend.app.schemas.admin.admin_requests import AdminPixelInfoRequest, AdminBanUserRequest, AdminResetGameRequest
-from backend.app.schemas.admin.admin_respones import AdminPixelInfoResponse
+from backend.app.schemas.admin.admin_respones import AdminPixelInfoResponse, AdminLoopStatsResponse
 from backend.app.schemas.data_models import PixelData, PositionData, SelectionData, FieldStateData
-from backend.app.schemas.user.user_requests import SelectionUpdateRequest, DisconnectRequest
-from backend.app.schemas.user.user_respones import OnlineCountResponse, ChangeCooldownResponse, FieldStateResponse, \
-    ErrorResponse, SuccessResponse
+from backend.app.schemas.user.user_requests import SelectionUpdateRequest, DisconnectRequest, GetFieldStateRequest, \
+    GetFieldDeltaRequest, SubscribeViewportRequest, GetTileStateRequest
+from backend.app.schemas.user.user_respones import ChangeCooldownResponse, ErrorResponse, \
+    SuccessResponse, FieldDeltaResponse, CooldownErrorResponse
 from common.app.core.config import config as cfg
-from common.app.db.api_db import get_pixels, update_pixel, get_pixel_info, clear_db_admin, toggle_ban_user
-from backend.app.api.websocket_core.metrics_handler import send_text_metric
+from common.app.db.storage import storage
+from backend.app.api.websocket_core.canvas import canvas, parse_color, format_color
+from backend.app.api.websocket_core.change_log import change_log
+from backend.app.api.websocket_core.compression import SharedFrame, should_compress
+from backend.app.api.websocket_core.tiles import tiles_in_rect, tile_grid
+from backend.app.api.websocket_core.rate_limiter import cooldown_tracker
+from backend.app.api.websocket_core.write_queue import pixel_write_queue
+from backend.app.api.websocket_core.field_state_cache import field_state_cache
 from backend.app.api.websocket_core.connection_manager import manager
+from backend.app.api.websocket_core.loop_monitor import loop_monitor
+
+HOST = socket.gethostname()
 
 
 async def handle_disconnect(websocket: WebSocket, request: DisconnectRequest):
@@ -20,81 +31,191 @@ async def handle_disconnect(websocket: WebSocket, request: DisconnectRequest):
 
 
 async def handle_send_cooldown(websocket: WebSocket):
-    await send_text_metric(websocket, ChangeCooldownResponse(data=cfg.COOLDOWN).json())
+    manager.reply(websocket, ChangeCooldownResponse(data=cfg.COOLDOWN).json())
 
 
 async def handle_online_count(websocket: WebSocket):
-    online_count = len(manager.active_connections)
-    await send_text_metric(websocket, OnlineCountResponse(data={"online": online_count}).json())
+    manager.reply(websocket, manager.presence.online_message)
 
 
-async def handle_change_cooldown(data: int):
+async def apply_cooldown(data: int):
     cfg.COOLDOWN = data
-    await manager.broadcast(ChangeCooldownResponse(data=data).json())
+    await manager.broadcast(ChangeCooldownResponse(data=data).json(), message_type="cooldown_update")
+
+
+async def handle_change_cooldown(data: int):
+    await apply_cooldown(data)
+    manager.bus.publish({"type": "cooldown", "value": data})
 
 
 async def handle_selection_update(websocket: WebSocket, request: SelectionUpdateRequest, user: Tuple[str, str]):
     if not (0 <= request.data.position.x < cfg.FIELD_SIZE[0] and 0 <= request.data.position.y < cfg.FIELD_SIZE[1]):
-        await websocket.send_text(ErrorResponse(message="Invalid selection coordinates").json())
+        manager.reply(websocket, ErrorResponse(message="Invalid selection coordinates").json())
         return
     await manager.update_selection(user[0], request.data.position)
 
 
-async def handle_send_field_state(websocket: WebSocket):
-    field_size = cfg.FIELD_SIZE
-    cooldown = cfg.COOLDOWN
+async def send_field_state(websocket: WebSocket, compression: str = None):
+    # Сообщение сериализуется один раз на версию поля, а не на каждый запрос
+    binary = getattr(websocket.state, "snapshot_format", "json") == "binary"
+    negotiated = getattr(websocket.state, "compression", None)
+    if compression is None and negotiated is not None:
+        # Сжатие, согласованное при входе, применяется по политике; сжатая копия тоже общая на версию поля
+        size = len(field_state_cache.binary() if binary else field_state_cache.payload_bytes())
+        if should_compress("field_state", size):
+            compression = negotiated
+    if compression:
+        manager.reply(websocket, field_state_cache.compressed(compression, binary=binary))
+    elif binary:
+        manager.reply(websocket, field_state_cache.binary())
+    else:
+        manager.reply(websocket, field_state_cache.payload())
+
+
+async def handle_send_field_state(websocket: WebSocket, request: GetFieldStateRequest):
+    await send_field_state(websocket, request.data.compression if request.data else None)
 
-    raw_pixels = await get_pixels()
-    raw_selections = manager.selections
 
-    pixels = [PixelData(position=PositionData(**pixel), color=pixel["color"], nickname=pixel["nickname"]) for pixel in
-              raw_pixels]
-    selections = [SelectionData(nickname=nickname, position=position) for nickname, position in raw_selections.items()]
+async def handle_send_field_delta(websocket: WebSocket, request: GetFieldDeltaRequest):
+    changes = change_log.since(request.data.epoch, request.data.since_seq)
+    if changes is None:
+        # Клиент отстал сильнее, чем хранит журнал, или журнал сброшен: отдаем полный снимок
+        await send_field_state(websocket)
+        return
+    pixels = [PixelData(position=PositionData(x=x, y=y), color=color, nickname=nickname)
+              for _, x, y, color, nickname in changes]
+    selections = [SelectionData(nickname=nickname, position=position)
+                  for nickname, position in manager.selections.items()]
+    message = FieldDeltaResponse(seq=change_log.seq, epoch=change_log.epoch,
+                                 data=FieldStateData(pixels=pixels, selections=selections)).json()
+    compression = getattr(websocket.state, "compression", None)
+    manager.reply(websocket, SharedFrame("field_delta", message).for_encoding(compression))
+
+
+async def handle_subscribe_viewport(websocket: WebSocket, request: SubscribeViewportRequest):
+    viewport = request.data
+    tiles = None
+    if viewport is not None:
+        tiles = tiles_in_rect(viewport.x, viewport.y, viewport.width, viewport.height, canvas.size)
+    if not manager.subscribe_viewport(websocket, tiles):
+        manager.reply(websocket, ErrorResponse(message="Admins always receive the whole field").json())
+        return
+    manager.reply(websocket, SuccessResponse(data="Viewport subscribed").json())
 
-    field_state_data = FieldStateData(pixels=pixels, selections=selections)
-    message = FieldStateResponse(size=field_size, cooldown=cooldown, data=field_state_data).json()
-    await send_text_metric(websocket, message)
+
+async def handle_send_tile_state(websocket: WebSocket, request: GetTileStateRequest):
+    columns, rows = tile_grid(canvas.size)
+    if not (0 <= request.data.x < columns and 0 <= request.data.y < rows):
+        manager.reply(websocket, ErrorResponse(message="Invalid tile coordinates").json())
+        return
+    manager.reply(websocket, field_state_cache.tile_payload((request.data.x, request.data.y)))
 
 
 async def handle_update_pixel(websocket: WebSocket, request, user: Tuple[str, str],
                               permission: bool = False):
-    if not (0 <= request.data.x < cfg.FIELD_SIZE[0] and 0 <= request.data.y < cfg.FIELD_SIZE[1]):
-        await websocket.send_text(ErrorResponse(message="Invalid pixel coordinates").json())
+    if not canvas.contains(request.data.x, request.data.y):
+        manager.reply(websocket, ErrorResponse(message="Invalid pixel coordinates").json())
         return
-    message = await update_pixel(x=request.data.x, y=request.data.y, color=request.data.color, user_id=user[1],
-                                 action_time=datetime.utcnow(), permission=permission)
-    if message == "cooldown":
-        await websocket.send_text(
-            ErrorResponse(message="You can only color a pixel at a set time.").json())
+    try:
+        color = parse_color(request.data.color)
+    except ValueError:
+        manager.reply(websocket, ErrorResponse(message="Invalid pixel color").json())
+        return
+    action_time = datetime.utcnow()
+    # Пиксели админа не привязаны к пользователю и не подчиняются cooldown
+    user_id = None if permission else user[1]
+    if not permission:
+        # Cooldown проверяется в памяти, last_pixel_update уходит в базу пакетом
+        message, remaining = cooldown_tracker.claim(user_id, action_time)
+        if message == "cooldown":
+            await send_cooldown_error(websocket, remaining)
+            return
+    if cfg.BUS_BACKEND == "postgres":
+        # Пользователь может ставить пиксели и через другие процессы, а их пиксели доходят сюда с задержкой шины:
+        # решает база, проверяя cooldown и записывая пиксель одним запросом
+        message, remaining = await storage.place_pixel(request.data.x, request.data.y, format_color(color), user_id,
+                                                       user[0], action_time, permission)
+        if message == "cooldown":
+            cooldown_tracker.refused(user_id, action_time, remaining)
+            await send_cooldown_error(websocket, remaining)
+            return
     else:
-        await manager.broadcast_pixel_update(request.data.x, request.data.y, request.data.color, user[0])
+        if not permission:
+            pixel_write_queue.touch_user(user_id, action_time)
+        pixel_write_queue.put(request.data.x, request.data.y, format_color(color), user_id, user[0], action_time)
+    await apply_pixel(request.data.x, request.data.y, color, user_id, user[0], action_time, manager.bus.node_id)
+    manager.bus.publish({"type": "pixel", "x": request.data.x, "y": request.data.y, "color": format_color(color),
+                         "user_id": user_id, "nickname": user[0], "action_time": action_time.isoformat()})
+
+
+async def send_cooldown_error(websocket: WebSocket, remaining: float):
+    manager.reply(websocket, CooldownErrorResponse(message="You can only color a pixel at a set time.",
+                                                   remaining=round(remaining, 3)).json())
+
+
+async def apply_pixel(x: int, y: int, color: int, user_id: Optional[str], nickname: str, action_time: datetime,
+                      node: str):
+    # Изменение, проигравшее более новому в той же клетке, клиентам не рассылается
+    if canvas.set_pixel(x, y, color, user_id, nickname, action_time, node):
+        await manager.broadcast_pixel_update(x, y, format_color(color), nickname)
 
 
 async def handle_pixel_info(websocket: WebSocket, request: AdminPixelInfoRequest):
-    data = await get_pixel_info(request.data['x'], request.data['y'])
+    x, y = request.data['x'], request.data['y']
+    data = canvas.get_pixel(x, y) if canvas.contains(x, y) else None
     if data is None:
-        await websocket.send_text(
-            ErrorResponse(message="There is no one who past pixel there").json())
+        manager.reply(websocket, ErrorResponse(message="There is no one who past pixel there").json())
         return
     message = AdminPixelInfoResponse(data=data).json()
-    await send_text_metric(websocket, message)
+    manager.reply(websocket, message)
 
 
 async def handle_ban_user(websocket: WebSocket, request: AdminBanUserRequest):
-    await toggle_ban_user(request.data['user_id'])
-    for connection, user_id in manager.active_connections:
-        if user_id == request.data['user_id']:
-            await manager.disconnect(connection, code=1002, reason="Protocol Error")
-    await send_text_metric(websocket, SuccessResponse(data="User ban toggled").json())
+    await storage.toggle_ban_user(request.data['user_id'])
+    await kick_user(request.data['user_id'])
+    manager.bus.publish({"type": "kick", "user_id": request.data['user_id']})
+    manager.reply(websocket, SuccessResponse(data="User ban toggled").json())
 
 
-async def handle_reset_game(websocket: WebSocket, request: AdminResetGameRequest):
-    await clear_db_admin()
-    cfg.FIELD_SIZE = request.data
+async def kick_user(user_id: str):
+    for session in manager.registry.for_user(user_id):
+        await manager.disconnect(session.websocket, code=1002, reason="Protocol Error")
+
+
+async def apply_reset(size: Tuple[int, int], clear_storage: bool = True):
+    await canvas.reset(size, clear_storage=clear_storage)
+    change_log.reset()
+    cfg.FIELD_SIZE = size
     await manager.disconnect_everyone()
-    await send_text_metric(websocket, SuccessResponse(data="Game reset").json())
+
+
+async def handle_reset_game(websocket: WebSocket, request: AdminResetGameRequest):
+    await apply_reset(request.data)
+    manager.bus.publish({"type": "reset", "size": list(request.data)})
+    manager.reply(websocket, SuccessResponse(data="Game reset").json())
+
+
+async def drain_server(keep: Optional[WebSocket] = None):
+    # Сначала отпускаем клиентов, затем дописываем в базу поле и cooldown: новых изменений уже не будет
+    await manager.drain(cfg.DRAIN_TIMEOUT_S, cfg.RECONNECT_JITTER_MS, keep)
+    await pixel_write_queue.flush()
+
+
+async def drain_host(keep: Optional[WebSocket] = None):
+    # Воркеры хоста делят один порт, и запрос пришел только в один из них: остальных просим через шину
+    manager.bus.publish({"type": "drain", "host": HOST})
+    await drain_server(keep)
+
+
+async def handle_drain_server(websocket: WebSocket):
+    manager.reply(websocket, SuccessResponse(data="Server is draining").json())
+    await drain_host(keep=websocket)
+
+
+async def handle_loop_stats(websocket: WebSocket):
+    manager.reply(websocket, AdminLoopStatsResponse(data=loop_monitor.stats()).json())
 
 
 async def handle_get_online_info_admin(websocket: WebSocket):
     await manager.broadcast_users_info()
-    await send_text_metric(websocket, SuccessResponse(data="Users info sent").json())
+    manager.reply(websocket, SuccessResponse(data="Users info sent").json())
@@ -0,0 +1,74 @@
+import asyncio
+import logging
+import time
+from typing import List, Optional
+
+from backend.app.api.websocket_core.registry import Session
+from backend.app.prometheus.metrics import ws_pings_sent, ws_connections_reaped
+from backend.app.schemas.user.user_respones import PingResponse
+
+"""
+The heartbeat finds connections that are gone but not closed. A connection whose writer failed to send
+(a half-open socket) is closed on the next beat, every HEARTBEAT_INTERVAL_S.
+Clients that asked for it at login ("heartbeat": true) are also checked for silence: every message
+counts as activity, a client silent for HEARTBEAT_INTERVAL_S gets a ping, and one still silent after
+HEARTBEAT_TIMEOUT_S is closed. Older clients do not answer pings, so they are never closed for being quiet.
+All connections found on one beat are closed together through ConnectionManager.disconnect_many,
+so a mass timeout updates the gauge once and reaches clients as a single presence report.
+"""
+
+logger = logging.getLogger(__name__)
+
+
+class Heartbeat:
+    def __init__(self, manager, interval_s: float, timeout_s: float):
+        self.manager = manager
+        self.interval = interval_s
+        self.timeout = timeout_s
+        self.ping_message = PingResponse().json()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def enabled(self) -> bool:
+        # Оборванные соединения проверяются всегда; HEARTBEAT_TIMEOUT_S=0 отключает только ping и тишину
+        return self.interval > 0
+
+    def check(self, now: float) -> List[Session]:
+        # Пингует молчащих и возвращает соединения, которые пора закрыть
+        idle, broken = [], []
+        for session in self.manager.registry:
+            if session.outbox.broken:
+                broken.append(session)
+            elif not session.heartbeat or self.timeout <= 0:
+                continue
+            elif now - session.last_seen >= self.timeout:
+                idle.append(session)
+            elif now - session.last_seen >= self.interval and session.outbox.put(self.ping_message):
+                ws_pings_sent.inc()
+        if idle:
+            ws_connections_reaped.labels(reason="idle").inc(len(idle))
+        if broken:
+            ws_connections_reaped.labels(reason="broken").inc(len(broken))
+        return idle + broken
+
+    async def beat(self):
+        stale = self.check(time.monotonic())
+        if stale:
+            await self.manager.disconnect_many(stale, code=1001, reason="Heartbeat timeout")
+
+    async def _beat_forever(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.beat()
+            except Exception as e:
+                logger.error(f"Heartbeat error: {e}")
+
+    def start(self):
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._beat_forever())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
@@ -0,0 +1,117 @@
+import asyncio
+import contextvars
+import logging
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Deque, List, Optional
+
+from backend.app.prometheus.metrics import event_loop_lag_seconds, event_loop_slow_callbacks
+from common.app.core.config import config as cfg
+
+"""
+The loop monitor watches the single asyncio loop everything runs on.
+ - Lag: a task sleeps for LOOP_MONITOR_INTERVAL_MS and measures how late it wakes up; the delay is how long
+   ready callbacks waited for the loop and goes to the event_loop_lag_seconds histogram.
+ - Slow callbacks (off unless LOOP_SLOW_CALLBACK_MS > 0): every callback run by the loop is timed (the same
+   hook asyncio debug mode uses, without the rest of debug mode). One that holds the loop for
+   LOOP_SLOW_CALLBACK_MS or longer is logged with its coroutine and the type of the websocket message its task
+   handled last, and kept among the recent offenders that admins can fetch with loop_stats_admin.
+The two are switched on separately: the hook replaces asyncio.Handle._run for the whole process, so it is
+meant for a debugging session rather than for every deployment. It works with the standard asyncio loop;
+under uvloop only the lag is measured.
+"""
+
+logger = logging.getLogger(__name__)
+
+# Тип сообщения, которое обрабатывает текущая задача; process_message выставляет его при каждом сообщении
+current_message_type: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("current_message_type",
+                                                                                      default=None)
+
+
+def _describe(handle: asyncio.Handle) -> str:
+    callback = handle._callback
+    owner = getattr(callback, "__self__", None)
+    if isinstance(owner, asyncio.Task):
+        coro = owner.get_coro()
+        return getattr(coro, "__qualname__", repr(coro))
+    return getattr(callback, "__qualname__", repr(callback))
+
+
+class LoopMonitor:
+    def __init__(self, interval_ms: int, slow_callback_ms: int, history: int):
+        self.interval = interval_ms / 1000
+        self.slow_callback = slow_callback_ms / 1000
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self.offenders: Deque[dict] = deque(maxlen=history)
+        self._original_run = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.interval > 0
+
+    @property
+    def hooked(self) -> bool:
+        return self.slow_callback > 0
+
+    def _record_slow(self, handle: asyncio.Handle, duration: float):
+        event_loop_slow_callbacks.inc()
+        context = getattr(handle, "_context", None)
+        message_type = context.get(current_message_type) if context is not None else None
+        callback = _describe(handle)
+        logger.warning(f"Slow callback {callback} (message type {message_type}) took {duration * 1000:.1f} ms")
+        self.offenders.append({"callback": callback, "message_type": message_type,
+                               "duration_ms": round(duration * 1000, 1),
+                               "at": datetime.now(timezone.utc).isoformat()})
+
+    def _install_hook(self):
+        original_run = self._original_run = asyncio.Handle._run
+        monitor = self
+
+        def _timed_run(handle: asyncio.Handle):
+            started = time.perf_counter()
+            original_run(handle)
+            duration = time.perf_counter() - started
+            if duration >= monitor.slow_callback:
+                monitor._record_slow(handle, duration)
+
+        asyncio.Handle._run = _timed_run
+
+    def _remove_hook(self):
+        if self._original_run is not None:
+            asyncio.Handle._run = self._original_run
+            self._original_run = None
+
+    async def _measure_forever(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(loop.time() - expected, 0.0)
+            event_loop_lag_seconds.observe(lag)
+            self.last_lag = lag
+            self.max_lag = max(self.max_lag, lag)
+
+    def worst(self, limit: int = 10) -> List[dict]:
+        return sorted(self.offenders, key=lambda offender: offender["duration_ms"], reverse=True)[:limit]
+
+    def stats(self) -> dict:
+        return {"lag_ms": round(self.last_lag * 1000, 1), "max_lag_ms": round(self.max_lag * 1000, 1),
+                "slow_callback_ms": round(self.slow_callback * 1000), "slow_callbacks": self.worst()}
+
+    def start(self):
+        if self.hooked and self._original_run is None:
+            self._install_hook()
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._measure_forever())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self._remove_hook()
+
+
+loop_monitor = LoopMonitor(cfg.LOOP_MONITOR_INTERVAL_MS, cfg.LOOP_SLOW_CALLBACK_MS, cfg.LOOP_SLOW_HISTORY)
@@ -0,0 +1,115 @@
+import asyncio
+import time
+from typing import Dict, List, Optional, Tuple
+
+from backend.app.schemas.admin.admin_respones import AdminUsersDiffResponse
+from backend.app.schemas.data_models import UserInfoData, UsersDiffData
+from backend.app.schemas.user.user_respones import OnlineCountResponse
+
+"""
+Presence collects joins and leaves and reports them once per PRESENCE_INTERVAL_MS instead of
+on every connect and disconnect:
+ - online_count_update goes to everyone only when the count differs from the last one sent;
+ - admins get users_diff with the users who came and went since the previous report.
+A user joins with their first socket and leaves with their last one; a join and a leave
+within the same interval cancel out. The timer is armed only when something has changed.
+
+With several server processes the count is global: each node publishes its own count and diffs
+on the bus with every report and every CLUSTER_HEARTBEAT_S, and adds up the counts of the others.
+A node that has been silent for three heartbeats is dropped from the total.
+"""
+
+
+def _users_info(users: Dict[str, str]) -> List[UserInfoData]:
+    return [UserInfoData(nickname=nickname, id=user_id) for user_id, nickname in users.items()]
+
+
+class Presence:
+    def __init__(self, manager, interval_ms: int, bus, heartbeat_s: float):
+        self.manager = manager
+        self.interval = interval_ms / 1000
+        self.bus = bus
+        self.heartbeat = heartbeat_s
+        self._sent_online: Optional[int] = None
+        self._published_online: Optional[int] = None
+        self._joined: Dict[str, str] = {}  # user_id -> nickname
+        self._left: Dict[str, str] = {}
+        self._remote: Dict[str, Tuple[int, float]] = {}  # узел -> (онлайн, когда забыть)
+        self._handle: Optional[asyncio.TimerHandle] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def online_count(self) -> int:
+        return self.manager.online_count + sum(online for online, _ in self._remote.values())
+
+    @property
+    def online_message(self) -> str:
+        return OnlineCountResponse(data={"online": self.online_count}).json()
+
+    def changed(self):
+        if self._handle is None:
+            self._handle = asyncio.get_running_loop().call_later(self.interval, self.flush)
+
+    def user_joined(self, user_id: str, nickname: str):
+        if self._left.get(user_id) == nickname:
+            del self._left[user_id]
+        else:
+            self._joined[user_id] = nickname
+        self.changed()
+
+    def user_left(self, user_id: str, nickname: str):
+        if self._joined.get(user_id) == nickname:
+            del self._joined[user_id]
+        else:
+            self._left[user_id] = nickname
+        self.changed()
+
+    def _send_diff(self, joined: List[UserInfoData], left: List[UserInfoData]):
+        message = AdminUsersDiffResponse(data=UsersDiffData(joined=joined, left=left)).json()
+        self.manager.send(message, recipients=self.manager.registry.admins.values(), message_type="users_diff")
+
+    def _publish(self, joined: Dict[str, str], left: Dict[str, str]):
+        self._published_online = self.manager.online_count
+        self.bus.publish({"type": "presence", "online": self._published_online, "joined": joined, "left": left})
+
+    def flush(self):
+        self._handle = None
+        # Накопленное забираем до отправки: ошибка при сборке сообщения не повторится на следующих интервалах
+        joined, self._joined = self._joined, {}
+        left, self._left = self._left, {}
+        if self.manager.online_count != self._published_online or joined or left:
+            self._publish(joined, left)
+        online = self.online_count
+        if online != self._sent_online:
+            self._sent_online = online
+            self.manager.send(self.online_message, message_type="online_count_update")
+        if joined or left:
+            self._send_diff(_users_info(joined), _users_info(left))
+
+    def remote_update(self, node: str, online: int, joined: Dict[str, str], left: Dict[str, str]):
+        self._remote[node] = (online, time.monotonic() + 3 * self.heartbeat)
+        if joined or left:
+            # Разница уже собрана за интервал на узле-источнике
+            self._send_diff(_users_info(joined), _users_info(left))
+        if self.online_count != self._sent_online:
+            self.changed()
+
+    async def _heartbeat_forever(self):
+        while True:
+            await asyncio.sleep(self.heartbeat)
+            self._publish({}, {})
+            now = time.monotonic()
+            expired = [node for node, (_, expires) in self._remote.items() if expires < now]
+            for node in expired:
+                del self._remote[node]
+            if expired:
+                self.changed()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._heartbeat_forever())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
@@ -0,0 +1,106 @@
+import time
+from datetime import datetime, timezone
+from typing import Dict, Optional, Tuple
+
+from common.app.core.config import config as cfg
+
+"""
+In-process limits keyed by user_id, consulted before a message reaches its handler:
+ - CooldownTracker answers the pixel cooldown from memory. It is seeded from users.last_pixel_update
+   at login; new placements are persisted in the background by the pixel write queue.
+   With BUS_BACKEND=postgres a user may place through several processes, so the tracker only
+   turns away early retries and the database has the final word (see handle_update_pixel).
+   cfg.COOLDOWN is read on every check, so a cooldown change applies immediately.
+ - RateLimiter keeps a token bucket per user and message type (RATE_LIMITS), so a flood of
+   cursor moves or field requests is rejected before it costs any work.
+Idle entries are pruned when the tables grow, so memory follows the number of active users.
+"""
+
+PRUNE_MIN_SIZE = 1024
+
+
+def _timestamp(value: datetime) -> float:
+    return value.replace(tzinfo=timezone.utc).timestamp()
+
+
+class CooldownTracker:
+    def __init__(self):
+        self._last: Dict[str, float] = {}
+        self._prune_at = PRUNE_MIN_SIZE
+
+    def seed(self, user_id: str, last_pixel_update: Optional[datetime]):
+        # В памяти значение может быть новее базы: запись last_pixel_update отложенная
+        if last_pixel_update is not None:
+            last = _timestamp(last_pixel_update)
+            if last > self._last.get(user_id, 0.0):
+                self._last[user_id] = last
+
+    def remaining(self, user_id: str, now: float) -> float:
+        last = self._last.get(user_id)
+        return 0.0 if last is None else cfg.COOLDOWN - (now - last)
+
+    def claim(self, user_id: str, action_time: datetime) -> Tuple[str, float]:
+        now = _timestamp(action_time)
+        remaining = self.remaining(user_id, now)
+        if remaining > 0:
+            return "cooldown", remaining
+        self._last[user_id] = now
+        if len(self._last) > self._prune_at:
+            self._prune(now)
+        return "ok", float(cfg.COOLDOWN)
+
+    def refused(self, user_id: str, action_time: datetime, remaining: float):
+        # База отказала: отсчет идет от ее last_pixel_update, а не от попытки, которую засчитал claim
+        self._last[user_id] = _timestamp(action_time) - (cfg.COOLDOWN - remaining)
+
+    def _prune(self, now: float):
+        # Старые записи не влияют на проверку; час запаса на случай увеличения cooldown
+        horizon = now - max(cfg.COOLDOWN, 3600)
+        self._last = {user_id: last for user_id, last in self._last.items() if last > horizon}
+        self._prune_at = max(PRUNE_MIN_SIZE, 2 * len(self._last))
+
+
+class TokenBucket:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, tokens: float, updated: float):
+        self.tokens = tokens
+        self.updated = updated
+
+
+class RateLimiter:
+    def __init__(self, limits: Dict[str, Tuple[float, float]]):
+        # limits: тип сообщения -> (токенов в секунду, размер всплеска); "*" - для остальных типов
+        self.limits = limits
+        self._buckets: Dict[Tuple[str, str], TokenBucket] = {}
+        self._prune_at = PRUNE_MIN_SIZE
+
+    def allow(self, user_id: str, message_type: str) -> bool:
+        rate, burst = self.limits.get(message_type) or self.limits["*"]
+        now = time.monotonic()
+        key = (user_id, message_type)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if len(self._buckets) >= self._prune_at:
+                self._prune(now)
+            bucket = self._buckets[key] = TokenBucket(burst, now)
+        else:
+            bucket.tokens = min(burst, bucket.tokens + (now - bucket.updated) * rate)
+            bucket.updated = now
+        if bucket.tokens < 1:
+            return False
+        bucket.tokens -= 1
+        return True
+
+    def _prune(self, now: float):
+        # Корзина, успевшая наполниться, ничем не отличается от новой
+        def is_full(key, bucket):
+            rate, burst = self.limits.get(key[1]) or self.limits["*"]
+            return bucket.tokens + (now - bucket.updated) * rate >= burst
+
+        self._buckets = {key: bucket for key, bucket in self._buckets.items() if not is_full(key, bucket)}
+        self._prune_at = max(PRUNE_MIN_SIZE, 2 * len(self._buckets))
+
+
+cooldown_tracker = CooldownTracker()
+rate_limiter = RateLimiter(cfg.RATE_LIMITS)
@@ -0,0 +1,95 @@
+import time
+from typing import Dict, FrozenSet, Iterator, List, Optional
+
+from fastapi import WebSocket
+
+from backend.app.api.websocket_core.tiles import Tile
+
+"""
+The registry indexes connected sessions by websocket, by user_id (a user may have several sockets open)
+and by nickname. Every index is a dict keyed by websocket, so adding, removing and looking up
+a session are O(1) whatever the number of connections.
+"""
+
+
+class Session:
+    __slots__ = ("websocket", "user_id", "nickname", "is_admin", "tiles", "outbox", "binary", "compression",
+                 "heartbeat", "last_seen")
+
+    def __init__(self, websocket: WebSocket, user_id: Optional[str], nickname: str, is_admin: bool = False,
+                 binary: bool = False, compression: Optional[str] = None, heartbeat: bool = False):
+        self.websocket = websocket
+        self.user_id = user_id
+        self.nickname = nickname
+        self.is_admin = is_admin
+        self.tiles: Optional[FrozenSet[Tile]] = None  # None - подписка на всё поле
+        self.outbox = None  # SendQueue, создается менеджером при подключении
+        self.binary = binary  # обновления пикселей и выделений в бинарном протоколе
+        self.compression = compression  # согласованное сжатие крупных сообщений: gzip, deflate или None
+        self.heartbeat = heartbeat  # клиент отвечает на ping: долгое молчание считается обрывом
+        self.last_seen = time.monotonic()  # когда от клиента последний раз пришло сообщение
+
+
+class ConnectionRegistry:
+    def __init__(self):
+        self.by_websocket: Dict[WebSocket, Session] = {}
+        self.by_user: Dict[str, Dict[WebSocket, Session]] = {}
+        self.by_nickname: Dict[str, Dict[WebSocket, Session]] = {}
+        self.admins: Dict[WebSocket, Session] = {}
+
+    def __len__(self):
+        # Онлайн считается по пользовательским соединениям, админы не учитываются
+        return len(self.by_websocket) - len(self.admins)
+
+    def __contains__(self, websocket: WebSocket) -> bool:
+        return websocket in self.by_websocket
+
+    def __iter__(self) -> Iterator[Session]:
+        return iter(self.by_websocket.values())
+
+    def add(self, session: Session):
+        websocket = session.websocket
+        self.by_websocket[websocket] = session
+        if session.is_admin:
+            self.admins[websocket] = session
+            return
+        self.by_user.setdefault(session.user_id, {})[websocket] = session
+        self.by_nickname.setdefault(session.nickname, {})[websocket] = session
+
+    def remove(self, websocket: WebSocket) -> Optional[Session]:
+        session = self.by_websocket.pop(websocket, None)
+        if session is None:
+            return None
+        if session.is_admin:
+            del self.admins[websocket]
+            return session
+        self._discard(self.by_user, session.user_id, websocket)
+        self._discard(self.by_nickname, session.nickname, websocket)
+        return session
+
+    @staticmethod
+    def _discard(index: Dict[str, Dict[WebSocket, Session]], key: str, websocket: WebSocket):
+        sessions = index.get(key)
+        if sessions is not None:
+            sessions.pop(websocket, None)
+            if not sessions:
+                del index[key]
+
+    def get(self, websocket: WebSocket) -> Optional[Session]:
+        return self.by_websocket.get(websocket)
+
+    def for_user(self, user_id: str) -> List[Session]:
+        return list(self.by_user.get(user_id, {}).values())
+
+    def for_nickname(self, nickname: str) -> List[Session]:
+        return list(self.by_nickname.get(nickname, {}).values())
+
+    def users(self) -> Iterator[Session]:
+        for sessions in self.by_user.values():
+            yield from sessions.values()
+
+    def clear(self):
+        self.by_websocket.clear()
+        self.by_user.clear()
+        self.by_nickname.clear()
+        self.admins.clear()
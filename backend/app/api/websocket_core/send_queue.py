@@ -0,0 +1,88 @@
+import asyncio
+import logging
+from collections import deque
+from typing import Callable, Deque, Optional, Union
+
+from fastapi import WebSocket
+from starlette.websockets import WebSocketState
+
+from backend.app.prometheus.metrics import ws_messages_dropped, ws_messages_sent
+
+"""
+Every connection gets a bounded outbound queue drained by its own writer task.
+A broadcast only appends the same (already serialized) message to each recipient's queue,
+so a stalled client delays nobody but itself. Replies to the client's own requests go through
+the same queue, so they keep their order with the broadcasts and are counted in the same metrics. When a queue is full, on_overflow decides
+what to do with the slow consumer (see ConnectionManager._on_slow_consumer).
+"""
+
+logger = logging.getLogger(__name__)
+
+Message = Union[str, bytes]
+
+
+class SendQueue:
+    def __init__(self, websocket: WebSocket, max_size: int, on_overflow: Callable[["SendQueue"], None]):
+        self.websocket = websocket
+        self.max_size = max_size
+        self.on_overflow = on_overflow
+        self.resync_pending = False  # очередь уже сбрасывалась и еще не разгружена
+        self.closed = False
+        self.broken = False  # отправка не удалась: соединение мертво, хотя еще не закрыто
+        self._messages: Deque[Message] = deque()
+        self._ready = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self):
+        return len(self._messages)
+
+    def put(self, message: Message) -> bool:
+        if self.closed or self.broken:
+            return False
+        if len(self._messages) >= self.max_size:
+            ws_messages_dropped.inc()
+            self.on_overflow(self)
+            return False
+        self._messages.append(message)
+        self._ready.set()
+        return True
+
+    def replace(self, message: Message):
+        # Все ожидающие сообщения заменяются одним (например, просьбой о дозапросе)
+        ws_messages_dropped.inc(len(self._messages))
+        self._messages.clear()
+        self._messages.append(message)
+        self._ready.set()
+
+    async def _write_forever(self):
+        while True:
+            await self._ready.wait()
+            while self._messages:
+                message = self._messages.popleft()
+                if self.websocket.client_state != WebSocketState.CONNECTED:
+                    self.broken = True
+                    self._messages.clear()
+                    break
+                try:
+                    if isinstance(message, bytes):
+                        await self.websocket.send_bytes(message)
+                    else:
+                        await self.websocket.send_text(message)
+                    ws_messages_sent.inc()
+                except Exception as e:
+                    logger.warning("Error sending message: %s", e)
+                    self.broken = True
+                    self._messages.clear()
+            self.resync_pending = False
+            self._ready.clear()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._write_forever())
+
+    def close(self):
+        self.closed = True
+        self._messages.clear()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
@@ -0,0 +1,432 @@
+import array
+import asyncio
+import fcntl
+import logging
+import os
+import struct
+import tempfile
+from datetime import datetime, timezone
+from multiprocessing import resource_tracker, shared_memory
+from typing import Callable, Iterator, List, Optional, Set, Tuple, TypeVar
+
+from backend.app.api.websocket_core.canvas import Canvas, EMPTY, node_rank
+from backend.app.api.websocket_core.tiles import Tile, tile_grid, tile_of
+
+"""
+A canvas whose arrays live in a shared memory segment, so several worker processes on one host
+serve the field from a single copy. Segment layout (native byte order, the segment never leaves the host):
+
+    header          64 bytes: seq (uint64), retired, width, height, writer_count, writer_capacity,
+                    heap_used, heap_capacity, loaded (uint32 each), names_version (uint64)
+    colors          width * height uint32
+    writers         width * height int32, index in the name table, EMPTY for an empty cell
+    action_times    width * height float64
+    origins         width * height uint64, node_rank of the server that made the change
+    tile_versions   one uint64 per tile: seq of the last change in the tile
+    name_offsets    writer_capacity uint32: offset of the current record of every writer in the heap
+    heap            append-only records: uint16 length + UTF-8 user_id (0xFFFF for admins), uint16 length + nickname
+
+The name table has writer_capacity rows. When it is full, the writer hands the rows of authors who no longer
+own any cell to new authors and bumps names_version, so it only runs out when that many authors are on
+the field at once.
+
+One process is the writer: the one holding the flock on "<name>.lock" in the temp directory. It creates
+the segment and applies every change (its own and those coming over the bus); the others attach to it,
+ignore writes and read. Writes are guarded by a seqlock: the writer makes seq odd before a change and even
+after it, readers retry a read until they see the same even seq before and after, so they never observe
+a torn state. A reset creates a new segment with the same name and marks the old one retired;
+readers notice the flag and re-attach.
+At startup the writer fills the segment from storage pixel by pixel. The loaded flag is set only once
+the whole field is in place, and readers do not attach to a segment without it, so no reader serves
+a partial field (a restarted writer's readers keep serving their old copy in the meantime).
+"""
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Сегменты, созданные писателем этого процесса: resource_tracker хранит имена множеством,
+# и читатель того же процесса не должен снимать регистрацию писателя
+_created_here: Set[str] = set()
+
+HEADER_SIZE = 64
+NO_USER = 0xFFFF
+LENGTH = struct.Struct("<H")
+ATTACH_POLL_INTERVAL = 0.1
+
+
+def _region_sizes(width: int, height: int, writer_capacity: int, heap_capacity: int) -> List[Tuple[str, int]]:
+    cells = width * height
+    columns, rows = tile_grid((width, height))
+    return [("colors", 4 * cells), ("writers", 4 * cells), ("action_times", 8 * cells),
+            ("origins", 8 * cells), ("tile_versions", 8 * columns * rows), ("name_offsets", 4 * writer_capacity),
+            ("heap", heap_capacity)]
+
+
+def _encode_name(user_id: Optional[str], nickname: str) -> bytes:
+    user = user_id.encode() if user_id is not None else b""
+    name = nickname.encode()
+    return (LENGTH.pack(len(user) if user_id is not None else NO_USER) + user + LENGTH.pack(len(name)) + name)
+
+
+def _decode_name(heap: memoryview, offset: int) -> Tuple[Optional[str], str]:
+    (length,) = LENGTH.unpack_from(heap, offset)
+    offset += LENGTH.size
+    user_id = None
+    if length != NO_USER:
+        user_id = bytes(heap[offset:offset + length]).decode()
+        offset += length
+    (length,) = LENGTH.unpack_from(heap, offset)
+    offset += LENGTH.size
+    return user_id, bytes(heap[offset:offset + length]).decode()
+
+
+class _TileVersions:
+    def __init__(self, canvas: "SharedCanvas"):
+        self.canvas = canvas
+
+    def get(self, tile: Tile, default: int = 0) -> int:
+        canvas = self.canvas
+        columns, rows = tile_grid(canvas.size)
+        if not (0 <= tile[0] < columns and 0 <= tile[1] < rows):
+            return default
+        value = canvas._tile_versions[tile[1] * columns + tile[0]]
+        return canvas._versioned(value) if value else default
+
+    def __iter__(self) -> Iterator[Tile]:
+        columns, _ = tile_grid(self.canvas.size)
+        for index, value in enumerate(self.canvas._tile_versions):
+            if value:
+                yield index % columns, index // columns
+
+
+def _open_untracked(name: str) -> shared_memory.SharedMemory:
+    # Сегмент принадлежит писателю: при выходе читателя resource_tracker не должен его удалять
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:  # Python < 3.13
+        shm = shared_memory.SharedMemory(name=name)
+        if name not in _created_here:
+            resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+
+class SharedCanvas(Canvas):
+    def __init__(self, size: Tuple[int, int], name: str, writer_capacity: int, heap_capacity: int):
+        self.name = name
+        self.writer_capacity = writer_capacity
+        self.heap_capacity = heap_capacity
+        self.width, self.height = size
+        self._shm: Optional[shared_memory.SharedMemory] = None
+        self._views: List[memoryview] = []
+        # Каждое подключение к сегменту меняет старшие биты версий: кэши не спутают старое поле с новым
+        self._attaches = 0
+        self._user_index = {}
+        self._user_ids: List[Optional[str]] = []
+        self._nicknames: List[str] = []
+        self._free_indices: List[int] = []  # строки таблицы имен, на которые не ссылается ни одна клетка
+        self._names_key = None
+        # Пока писатель не загрузил поле из хранилища, его сегменты не помечаются загруженными
+        self._loading = True
+        self._lock_fd = self._elect()
+        self.is_writer = self._lock_fd is not None
+        if self.is_writer:
+            self._allocate(size)
+
+    def _elect(self) -> Optional[int]:
+        fd = os.open(os.path.join(tempfile.gettempdir(), f"{self.name}.lock"), os.O_CREAT | os.O_RDWR, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return None
+        return fd
+
+    # --- сегмент ---
+
+    def _map(self, shm: shared_memory.SharedMemory):
+        self._release()
+        self._shm = shm
+        buf = shm.buf
+        self._header_q = buf[0:48].cast("Q")  # [0] seq, [5] names_version
+        self._header_i = buf[8:40].cast("I")  # retired, width, height, writer_count, writer_capacity, heap_used,
+        # heap_capacity, loaded
+        width, height = self._header_i[1], self._header_i[2]
+        offset, regions = HEADER_SIZE, {}
+        for region, length in _region_sizes(width, height, self._header_i[4], self._header_i[6]):
+            regions[region] = buf[offset:offset + length]
+            offset += length
+        self.width, self.height = width, height
+        self.colors = regions["colors"].cast("I")
+        self.writers = regions["writers"].cast("i")
+        self.action_times = regions["action_times"].cast("d")
+        self.origins = regions["origins"].cast("Q")
+        self._tile_versions = regions["tile_versions"].cast("Q")
+        self._name_offsets = regions["name_offsets"].cast("I")
+        self._heap = regions["heap"]
+        self._views = [self._header_q, self._header_i, self.colors, self.writers, self.action_times, self.origins,
+                       self._tile_versions, self._name_offsets, self._heap, *regions.values()]
+        self._attaches += 1
+        self._names_key = None
+
+    def _release(self):
+        for view in self._views:
+            view.release()
+        self._views = []
+        if self._shm is not None:
+            try:
+                self._shm.close()
+            except BufferError:
+                # Кто-то еще держит срез буфера; память освободится вместе с ним
+                pass
+            self._shm = None
+
+    def _allocate(self, size: Tuple[int, int]):
+        if not self.is_writer:
+            self._attach()
+            return
+        # Прежний сегмент (свой или оставшийся от упавшего писателя) помечается retired и удаляется
+        try:
+            stale = shared_memory.SharedMemory(name=self.name)
+        except FileNotFoundError:
+            pass
+        else:
+            struct.pack_into("<I", stale.buf, 8, 1)
+            stale.unlink()
+            stale.close()
+            _created_here.discard(self.name)
+        total = HEADER_SIZE + sum(length for _, length in
+                                  _region_sizes(size[0], size[1], self.writer_capacity, self.heap_capacity))
+        shm = shared_memory.SharedMemory(name=self.name, create=True, size=total)
+        _created_here.add(self.name)
+        struct.pack_into("<Q8IQ", shm.buf, 0, 0, 0, size[0], size[1], 0, self.writer_capacity, 0,
+                         self.heap_capacity, 0 if self._loading else 1, 0)
+        self._map(shm)
+        self.writers[:] = array.array("i", [EMPTY]) * len(self.writers)
+        self._user_index.clear()
+        self._user_ids.clear()
+        self._nicknames.clear()
+        self._free_indices.clear()
+
+    def _attach(self) -> bool:
+        try:
+            shm = _open_untracked(self.name)
+        except FileNotFoundError:
+            return False
+        retired, loaded = struct.unpack_from("<I", shm.buf, 8)[0], struct.unpack_from("<I", shm.buf, 36)[0]
+        if retired or not loaded:
+            shm.close()
+            return False
+        self._map(shm)
+        return True
+
+    def _ensure_current(self):
+        if not self.is_writer and (self._shm is None or self._header_i[0]):
+            self._attach()
+
+    # --- seqlock ---
+
+    def _versioned(self, value: int) -> int:
+        return (self._attaches << 40) | value
+
+    def _begin_write(self) -> int:
+        self._header_q[0] += 1
+        return self._header_q[0] + 1  # версия после записи
+
+    def _end_write(self):
+        self._header_q[0] += 1
+
+    def consistent(self, read: Callable[[], T]) -> T:
+        if self.is_writer:
+            # Писатель пишет синхронно в этом же потоке: пока выполняется read, записи нет
+            return read()
+        while True:
+            self._ensure_current()
+            if self._shm is None:
+                raise RuntimeError("Shared canvas is not available yet")
+            start = self._header_q[0]
+            if start & 1:
+                os.sched_yield()
+                continue
+            try:
+                result = read()
+            except (IndexError, UnicodeDecodeError, struct.error):
+                # Чтение попало на запись: данные могли быть несогласованы
+                if self._header_q[0] == start:
+                    raise
+                continue
+            if self._header_q[0] == start:
+                return result
+
+    # --- версии и таблица имен ---
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        self._ensure_current()
+        return self.width, self.height
+
+    def contains(self, x: int, y: int) -> bool:
+        width, height = self.size
+        return 0 <= x < width and 0 <= y < height
+
+    @property
+    def version(self) -> int:
+        self._ensure_current()
+        return self._versioned(self._header_q[0]) if self._shm is not None else 0
+
+    @property
+    def names_version(self) -> int:
+        self._ensure_current()
+        return self._versioned(self._header_q[5]) if self._shm is not None else 0
+
+    @property
+    def tile_versions(self) -> _TileVersions:
+        self._ensure_current()
+        return _TileVersions(self)
+
+    def _read_names(self):
+        key = self._attaches, self._header_q[5]
+        if key != self._names_key:
+            self._user_ids, self._nicknames = [], []
+        for index in range(len(self._nicknames), self._header_i[3]):
+            user_id, nickname = _decode_name(self._heap, self._name_offsets[index])
+            self._user_ids.append(user_id)
+            self._nicknames.append(nickname)
+        self._names_key = key
+
+    @property
+    def nicknames(self) -> List[str]:
+        if not self.is_writer:
+            self.consistent(self._read_names)
+        return self._nicknames
+
+    @property
+    def user_ids(self) -> List[Optional[str]]:
+        if not self.is_writer:
+            self.consistent(self._read_names)
+        return self._user_ids
+
+    def _store_name(self, index: int, user_id: Optional[str], nickname: str):
+        record = _encode_name(user_id, nickname)
+        used = self._header_i[5]
+        if used + len(record) > self.heap_capacity:
+            used = self._compact_names()
+            if used + len(record) > self.heap_capacity:
+                raise RuntimeError("Shared canvas name table is full, increase CANVAS_SHARED_NAMES_BYTES")
+        self._heap[used:used + len(record)] = record
+        self._name_offsets[index] = used
+        self._header_i[5] = used + len(record)
+
+    def _compact_names(self) -> int:
+        # Переименования оставляют старые записи; переписываем кучу только с актуальными
+        self._header_q[5] += 1
+        used = 0
+        for index, (user_id, nickname) in enumerate(zip(self._user_ids, self._nicknames)):
+            record = _encode_name(user_id, nickname)
+            self._heap[used:used + len(record)] = record
+            self._name_offsets[index] = used
+            used += len(record)
+        self._header_i[5] = used
+        return used
+
+    # --- запись (только писатель) ---
+
+    def _reclaim_indices(self):
+        # Таблица имен заполнена: строки авторов, чьи клетки все перекрашены, отдаются новым авторам
+        live = set(self.writers)
+        for index, user_id in enumerate(self._user_ids):
+            if index not in live:
+                del self._user_index[user_id if user_id is not None else (None, self._nicknames[index])]
+                self._free_indices.append(index)
+        logger.info(f"Shared canvas {self.name}: reclaimed {len(self._free_indices)} name table rows")
+
+    def writer_index(self, user_id: Optional[str], nickname: str) -> int:
+        key = user_id if user_id is not None else (None, nickname)
+        index = self._user_index.get(key)
+        if index is None and len(self._nicknames) < self.writer_capacity:
+            index = len(self._nicknames)
+            self._user_index[key] = index
+            self._user_ids.append(user_id)
+            self._nicknames.append(nickname)
+            self._store_name(index, user_id, nickname)
+            self._header_i[3] = index + 1
+        elif index is None:
+            if not self._free_indices:
+                self._reclaim_indices()
+            if not self._free_indices:
+                raise RuntimeError("Shared canvas user table is full, increase CANVAS_SHARED_MAX_USERS")
+            # Строка меняет владельца: читатели перечитывают таблицу имен целиком
+            index = self._free_indices.pop()
+            self._user_index[key] = index
+            self._user_ids[index] = user_id
+            self._nicknames[index] = nickname
+            self._store_name(index, user_id, nickname)
+            self._header_q[5] += 1
+        elif self._nicknames[index] != nickname:
+            self._nicknames[index] = nickname
+            self._store_name(index, user_id, nickname)
+            self._header_q[5] += 1
+        return index
+
+    def rename_user(self, user_id: str, nickname: str):
+        index = self._user_index.get(user_id)
+        if not self.is_writer or index is None or self._nicknames[index] == nickname:
+            return
+        self._begin_write()
+        try:
+            self.writer_index(user_id, nickname)
+        finally:
+            self._end_write()
+
+    def set_pixel(self, x: int, y: int, color: int, user_id: Optional[str], nickname: str,
+                  action_time: datetime, node: Optional[str] = None) -> bool:
+        i = y * self.width + x
+        stamp, origin = action_time.replace(tzinfo=timezone.utc).timestamp(), node_rank(node)
+        if not self.is_writer:
+            # Читатели не пишут: изменение дойдет до писателя через шину. Сообщаем только, не устарело ли оно
+            return self.consistent(lambda: self._accepts(i, stamp, origin))
+        if not self._accepts(i, stamp, origin):
+            return False
+        version = self._begin_write()
+        try:
+            # Строка таблицы имен берется первой: если места нет, клетка остается нетронутой
+            writer = self.writer_index(user_id, nickname)
+            self.colors[i] = color
+            self.writers[i] = writer
+            self.action_times[i] = stamp
+            self.origins[i] = origin
+            columns, _ = tile_grid(self.size)
+            tx, ty = tile_of(x, y)
+            self._tile_versions[ty * columns + tx] = version
+        finally:
+            self._end_write()
+        return True
+
+    def get_pixel(self, x: int, y: int) -> Optional[dict]:
+        return self.consistent(lambda: super(SharedCanvas, self).get_pixel(x, y))
+
+    def _mark_loaded(self):
+        self._loading = False
+        self._header_i[7] = 1
+
+    async def load(self):
+        if self.is_writer:
+            await super().load()
+            self._mark_loaded()
+            logger.info(f"Shared canvas {self.name}: this process is the writer")
+            return
+        # Читатель ждет, пока писатель создаст сегмент и загрузит поле
+        while not self._attach():
+            await asyncio.sleep(ATTACH_POLL_INTERVAL)
+        logger.info(f"Shared canvas {self.name}: attached as a reader, size {self.size}")
+
+    def close(self):
+        # Писатель удаляет сегмент; читатели дочитывают свою копию, пока новый писатель не создаст следующий
+        if self.is_writer and self._shm is not None:
+            self._header_i[0] = 1
+            self._shm.unlink()
+            _created_here.discard(self.name)
+        self._release()
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)
+            self._lock_fd = None
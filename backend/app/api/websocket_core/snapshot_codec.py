@@ -0,0 +1,90 @@
+import struct
+import sys
+from typing import Dict, Iterable, List, Tuple
+
+from backend.app.schemas.data_models import PositionData
+
+"""
+Compact binary encoding of the field state, sent as a single binary websocket frame
+to clients that asked for snapshot_format="binary" at login. All numbers are little-endian.
+
+    header      struct HEADER (40 bytes): magic b"PB", format version, flags, width, height,
+                cooldown, seq, epoch (16 bytes), number of nicknames
+    colors      width * height uint32, 0x00RRGGBB in row-major order (index = y * width + x)
+    writers     width * height int32, index in the nickname dictionary, -1 for an empty cell
+    nicknames   for each nickname: uint16 length + UTF-8 bytes
+    selections  uint32 count, then for each: uint16 length + UTF-8 nickname, uint16 x, uint16 y
+
+colors and writers are taken directly from the canvas arrays through memoryviews,
+so the only copy is the final join of the frame.
+"""
+
+MAGIC = b"PB"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<2sBBHHIQ16sI")
+SELECTION = struct.Struct("<HH")
+LENGTH = struct.Struct("<H")
+COUNT = struct.Struct("<I")
+
+
+def _le_view(values) -> memoryview:
+    if sys.byteorder == "little":
+        return memoryview(values).cast("B")
+    swapped = values[:]
+    swapped.byteswap()
+    return memoryview(swapped).cast("B")
+
+
+def _pack_string(value: str) -> bytes:
+    data = value.encode()
+    return LENGTH.pack(len(data)) + data
+
+
+def encode_snapshot(canvas, selections: Dict[str, PositionData], cooldown: int, seq: int, epoch: str) -> bytes:
+    header = HEADER.pack(MAGIC, FORMAT_VERSION, 0, canvas.width, canvas.height, cooldown, seq,
+                         bytes.fromhex(epoch), len(canvas.nicknames))
+    nicknames = b"".join(_pack_string(nickname) for nickname in canvas.nicknames)
+    selection_parts = [COUNT.pack(len(selections))]
+    for nickname, position in selections.items():
+        selection_parts.append(_pack_string(nickname))
+        selection_parts.append(SELECTION.pack(position.x, position.y))
+    return b"".join([header, _le_view(canvas.colors), _le_view(canvas.writers), nicknames, *selection_parts])
+
+
+def _unpack_strings(data: memoryview, offset: int, count: int) -> Tuple[List[str], int]:
+    values = []
+    for _ in range(count):
+        (length,) = LENGTH.unpack_from(data, offset)
+        offset += LENGTH.size
+        values.append(bytes(data[offset:offset + length]).decode())
+        offset += length
+    return values, offset
+
+
+def decode_snapshot(data: bytes) -> dict:
+    """
+    Разбор бинарного снимка обратно в структуру, близкую к field_state (для тестов и клиентов на Python)
+    """
+    view = memoryview(data)
+    magic, version, _, width, height, cooldown, seq, epoch, nickname_count = HEADER.unpack_from(view, 0)
+    if magic != MAGIC or version != FORMAT_VERSION:
+        raise ValueError("Unsupported snapshot format")
+    cells = width * height
+    offset = HEADER.size
+    colors = view[offset:offset + 4 * cells].cast("I")
+    offset += 4 * cells
+    writers = view[offset:offset + 4 * cells].cast("i")
+    offset += 4 * cells
+    nicknames, offset = _unpack_strings(view, offset, nickname_count)
+    (selection_count,) = COUNT.unpack_from(view, offset)
+    offset += COUNT.size
+    selections = []
+    for _ in range(selection_count):
+        (nickname,), offset = _unpack_strings(view, offset, 1)
+        x, y = SELECTION.unpack_from(view, offset)
+        offset += SELECTION.size
+        selections.append({"nickname": nickname, "position": {"x": x, "y": y}})
+    pixels: Iterable = ({"position": {"x": i % width, "y": i // width}, "color": f"#{colors[i]:06X}",
+                         "nickname": nicknames[writers[i]]} for i in range(cells) if writers[i] != -1)
+    return {"size": [width, height], "cooldown": cooldown, "seq": seq, "epoch": epoch.hex(),
+            "data": {"pixels": list(pixels), "selections": selections}}
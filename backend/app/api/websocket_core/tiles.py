@@ -0,0 +1,39 @@
+from typing import FrozenSet, Tuple
+
+from common.app.core.config import config as cfg
+
+"""
+The field is split into square tiles of TILE_SIZE pixels. Clients subscribe to the tiles
+their viewport overlaps and only receive pixel and selection updates for those tiles.
+"""
+
+Tile = Tuple[int, int]
+
+
+def tile_of(x: int, y: int, tile_size: int = None) -> Tile:
+    tile_size = tile_size or cfg.TILE_SIZE
+    return x // tile_size, y // tile_size
+
+
+def tile_grid(field_size: Tuple[int, int], tile_size: int = None) -> Tuple[int, int]:
+    tile_size = tile_size or cfg.TILE_SIZE
+    return -(-field_size[0] // tile_size), -(-field_size[1] // tile_size)
+
+
+def tile_bounds(tile: Tile, field_size: Tuple[int, int], tile_size: int = None) -> Tuple[int, int, int, int]:
+    # (x0, y0, x1, y1), правая и нижняя границы не включаются
+    tile_size = tile_size or cfg.TILE_SIZE
+    x0, y0 = tile[0] * tile_size, tile[1] * tile_size
+    return x0, y0, min(x0 + tile_size, field_size[0]), min(y0 + tile_size, field_size[1])
+
+
+def tiles_in_rect(x: int, y: int, width: int, height: int, field_size: Tuple[int, int],
+                  tile_size: int = None) -> FrozenSet[Tile]:
+    tile_size = tile_size or cfg.TILE_SIZE
+    x0, y0 = max(x, 0), max(y, 0)
+    x1, y1 = min(x + width, field_size[0]), min(y + height, field_size[1])
+    if x0 >= x1 or y0 >= y1:
+        return frozenset()
+    return frozenset((tx, ty)
+                     for ty in range(y0 // tile_size, (y1 - 1) // tile_size + 1)
+                     for tx in range(x0 // tile_size, (x1 - 1) // tile_size + 1))
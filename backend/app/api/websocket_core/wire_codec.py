@@ -0,0 +1,104 @@
+import struct
+from typing import List, Optional, Tuple
+
+"""
+Binary encoding of the high-frequency broadcasts for clients that asked for protocol="binary" at login.
+Every message is one binary websocket frame that starts with an opcode byte; all numbers are little-endian.
+
+    pixel_update      u8 OP_PIXEL, then a pixel record
+    selection_update  u8 OP_SELECTION, then a selection record
+    batch_update      u8 OP_BATCH, u8 flags (1 - seq is set), u64 seq, u32 pixel count, u32 selection count,
+                      then the pixel records and the selection records
+
+    pixel record      u64 seq, u16 x, u16 y, u32 color 0x00RRGGBB, u16 length + UTF-8 nickname
+    selection record  u8 flags (1 - position is set), u16 x, u16 y, u16 length + UTF-8 nickname
+
+Opcodes never collide with the "PB" magic of binary field snapshots, so a client can tell the frames apart
+by the first byte. All other messages stay JSON text frames.
+"""
+
+OP_PIXEL = 1
+OP_SELECTION = 2
+OP_BATCH = 3
+
+OPCODE = struct.Struct("<B")
+PIXEL = struct.Struct("<QHHI")
+SELECTION = struct.Struct("<BHH")
+BATCH = struct.Struct("<BBQII")
+LENGTH = struct.Struct("<H")
+
+Pixel = Tuple[int, int, int, str, str]  # seq, x, y, "#RRGGBB", nickname
+Selection = Tuple[str, Optional[Tuple[int, int]]]  # nickname, (x, y) или None
+
+
+def _pack_string(value: str) -> bytes:
+    data = value.encode()
+    return LENGTH.pack(len(data)) + data
+
+
+def _pixel_record(seq: int, x: int, y: int, color: str, nickname: str) -> bytes:
+    return PIXEL.pack(seq, x, y, int(color[1:], 16)) + _pack_string(nickname)
+
+
+def _selection_record(nickname: str, position: Optional[Tuple[int, int]]) -> bytes:
+    x, y = position if position is not None else (0, 0)
+    return SELECTION.pack(position is not None, x, y) + _pack_string(nickname)
+
+
+def encode_pixel(seq: int, x: int, y: int, color: str, nickname: str) -> bytes:
+    return OPCODE.pack(OP_PIXEL) + _pixel_record(seq, x, y, color, nickname)
+
+
+def encode_selection(nickname: str, position: Optional[Tuple[int, int]]) -> bytes:
+    return OPCODE.pack(OP_SELECTION) + _selection_record(nickname, position)
+
+
+def encode_batch(seq: Optional[int], pixels: List[Pixel], selections: List[Selection]) -> bytes:
+    header = BATCH.pack(OP_BATCH, seq is not None, seq or 0, len(pixels), len(selections))
+    return b"".join([header, *(_pixel_record(*pixel) for pixel in pixels),
+                     *(_selection_record(*selection) for selection in selections)])
+
+
+def _unpack_string(data: memoryview, offset: int) -> Tuple[str, int]:
+    (length,) = LENGTH.unpack_from(data, offset)
+    offset += LENGTH.size
+    return bytes(data[offset:offset + length]).decode(), offset + length
+
+
+def _unpack_pixels(data: memoryview, offset: int, count: int) -> Tuple[List[dict], int]:
+    pixels = []
+    for _ in range(count):
+        seq, x, y, color = PIXEL.unpack_from(data, offset)
+        nickname, offset = _unpack_string(data, offset + PIXEL.size)
+        pixels.append({"seq": seq, "x": x, "y": y, "color": f"#{color:06X}", "nickname": nickname})
+    return pixels, offset
+
+
+def _unpack_selections(data: memoryview, offset: int, count: int) -> Tuple[List[dict], int]:
+    selections = []
+    for _ in range(count):
+        flags, x, y = SELECTION.unpack_from(data, offset)
+        nickname, offset = _unpack_string(data, offset + SELECTION.size)
+        selections.append({"nickname": nickname, "position": {"x": x, "y": y} if flags & 1 else None})
+    return selections, offset
+
+
+def decode_message(data: bytes) -> dict:
+    """
+    Разбор бинарного сообщения в тот же вид, что у JSON-версии (для тестов и клиентов на Python)
+    """
+    view = memoryview(data)
+    (opcode,) = OPCODE.unpack_from(view, 0)
+    if opcode == OP_PIXEL:
+        (pixel,), _ = _unpack_pixels(view, OPCODE.size, 1)
+        return {"type": "pixel_update", "seq": pixel.pop("seq"), "data": pixel}
+    if opcode == OP_SELECTION:
+        (selection,), _ = _unpack_selections(view, OPCODE.size, 1)
+        return {"type": "selection_update", "data": selection}
+    if opcode == OP_BATCH:
+        _, flags, seq, pixel_count, selection_count = BATCH.unpack_from(view, 0)
+        pixels, offset = _unpack_pixels(view, BATCH.size, pixel_count)
+        selections, _ = _unpack_selections(view, offset, selection_count)
+        return {"type": "batch_update", "seq": seq if flags & 1 else None,
+                "data": {"pixels": pixels, "selections": selections}}
+    raise ValueError(f"Unknown opcode: {opcode}")
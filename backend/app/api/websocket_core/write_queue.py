@@ -0,0 +1,104 @@
+import asyncio
+import logging
+import time
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+from backend.app.prometheus.metrics import pixel_write_queue_depth, pixel_write_flush_seconds, \
+    pixel_write_flushed_rows, pixel_write_flush_errors
+from common.app.core.config import config as cfg
+from common.app.db.storage import storage
+
+"""
+The pixel write queue collects pixel writes and sends them to the database in batches.
+Pending writes are keyed by cell, so several writes to the same (x, y) collapse to the last one.
+A batch is flushed every PIXEL_WRITE_FLUSH_INTERVAL_MS or as soon as PIXEL_WRITE_FLUSH_SIZE cells
+are pending, with a single multi-row upsert, so a burst of placements costs a few pool checkouts
+instead of one per pixel. users.last_pixel_update is batched the same way, keyed by user.
+"""
+
+logger = logging.getLogger(__name__)
+
+PixelRow = Tuple[int, int, str, Optional[str], str, datetime]
+
+
+class PixelWriteQueue:
+    def __init__(self, flush_interval_ms: int, flush_size: int):
+        self.flush_interval = flush_interval_ms / 1000
+        self.flush_size = flush_size
+        # Блокировка сериализует пакеты и дает сбросу игры дождаться записи в процессе
+        self.lock = asyncio.Lock()
+        self._pending: Dict[Tuple[int, int], PixelRow] = {}
+        self._last_updates: Dict[str, datetime] = {}
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self):
+        return len(self._pending)
+
+    def put(self, x: int, y: int, color: str, user_id: Optional[str], nickname: str, action_time: datetime):
+        self._pending[(x, y)] = (x, y, color, user_id, nickname, action_time)
+        pixel_write_queue_depth.set(len(self._pending))
+        if len(self._pending) >= self.flush_size:
+            self._wakeup.set()
+
+    def touch_user(self, user_id: str, action_time: datetime):
+        self._last_updates[user_id] = action_time
+
+    def discard(self):
+        self._pending.clear()
+        self._last_updates.clear()
+        pixel_write_queue_depth.set(0)
+
+    async def flush(self):
+        async with self.lock:
+            if not (self._pending or self._last_updates):
+                return
+            batch, self._pending = self._pending, {}
+            last_updates, self._last_updates = self._last_updates, {}
+            start = time.perf_counter()
+            try:
+                if batch:
+                    await storage.upsert_pixels(list(batch.values()))
+                    pixel_write_flushed_rows.inc(len(batch))
+                    batch = {}
+                if last_updates:
+                    await storage.update_last_pixel_updates(list(last_updates.items()))
+                    last_updates = {}
+            except Exception as e:
+                # Не теряем изменения: более новые записи тех же клеток и пользователей важнее
+                for cell, row in batch.items():
+                    self._pending.setdefault(cell, row)
+                for user_id, action_time in last_updates.items():
+                    self._last_updates.setdefault(user_id, action_time)
+                pixel_write_flush_errors.inc()
+                logger.error(f"Pixel write flush failed: {e}")
+            finally:
+                pixel_write_flush_seconds.observe(time.perf_counter() - start)
+                pixel_write_queue_depth.set(len(self._pending))
+
+    async def _flush_forever(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._flush_forever())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+
+pixel_write_queue = PixelWriteQueue(cfg.PIXEL_WRITE_FLUSH_INTERVAL_MS, cfg.PIXEL_WRITE_FLUSH_SIZE)
@@ -0,0 +1,97 @@
+import argparse
+import json
+import sys
+from typing import List, NamedTuple, Optional
+
+from backend.app.benchmarks.websocket_load_bench import LOAD_ARGS
+
+"""
+Regression gate for websocket_load_bench results: compares a run against a baseline (usually the
+previous commit on the same machine) and exits with 1 when a metric got worse by more than the tolerance,
+with 2 when the runs were made with different load settings and cannot be compared.
+A change must exceed both the relative tolerance and the absolute floor (--min-delta, in the metric's own
+units: ms, per second, percent, MB) to count, so sub-millisecond noise on a fast path does not fail the gate.
+
+    python -m backend.app.benchmarks.compare baseline.json current.json --tolerance 0.1
+"""
+
+# Путь к метрике в results -> больше ли значит лучше
+METRICS = {
+    "placements_per_s": True,
+    "deliveries_per_s": True,
+    "deliveries_per_placement": True,
+    "latency_ms.p50": False,
+    "latency_ms.p95": False,
+    "latency_ms.p99": False,
+    "field_state_ms.p95": False,
+    "errors": False,
+    "disconnects": False,
+    "server.cpu_percent": False,
+    "server.rss_peak_mb": False,
+}
+
+
+class Comparison(NamedTuple):
+    metric: str
+    baseline: Optional[float]
+    current: Optional[float]
+    change: Optional[float]  # относительное изменение, со знаком "лучше - больше"
+    regressed: bool
+
+
+def _value(results: dict, path: str) -> Optional[float]:
+    for key in path.split("."):
+        if not isinstance(results, dict):
+            return None
+        results = results.get(key)
+    return results
+
+
+def compare(baseline: dict, current: dict, tolerance: float, min_delta: float) -> List[Comparison]:
+    rows = []
+    for metric, higher_is_better in METRICS.items():
+        before, after = _value(baseline["results"], metric), _value(current["results"], metric)
+        if before is None or after is None:
+            rows.append(Comparison(metric, before, after, None, False))
+            continue
+        delta = after - before if higher_is_better else before - after  # отрицательная - стало хуже
+        change = delta / before if before else (0.0 if not delta else float("inf") * (1 if delta > 0 else -1))
+        regressed = change < -tolerance and -delta > min_delta
+        rows.append(Comparison(metric, before, after, change, regressed))
+    return rows
+
+
+def load_mismatch(baseline: dict, current: dict) -> List[str]:
+    before, after = baseline["meta"]["args"], current["meta"]["args"]
+    return [name for name in LOAD_ARGS if before.get(name) != after.get(name)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="allowed relative regression")
+    parser.add_argument("--min-delta", type=float, default=1.0, help="ignore absolute changes below this")
+    args = parser.parse_args()
+
+    with open(args.baseline) as baseline_file, open(args.current) as current_file:
+        baseline, current = json.load(baseline_file), json.load(current_file)
+    mismatch = load_mismatch(baseline, current)
+    if mismatch:
+        print(f"runs used different load settings: {', '.join(mismatch)}")
+        sys.exit(2)
+
+    rows = compare(baseline, current, args.tolerance, args.min_delta)
+    print(f"{'metric':<26}{'baseline':>12}{'current':>12}{'change':>10}")
+    for row in rows:
+        change = f"{row.change:+.1%}" if row.change is not None else "-"
+        print(f"{row.metric:<26}{str(row.baseline):>12}{str(row.current):>12}{change:>10}"
+              f"{'  REGRESSION' if row.regressed else ''}")
+    regressions = [row.metric for row in rows if row.regressed]
+    if regressions:
+        print(f"regressed beyond {args.tolerance:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+import argparse
+import random
+import time
+import tracemalloc
+from typing import List, Tuple
+
+from backend.app.api.websocket_core.registry import ConnectionRegistry, Session
+
+"""
+Connection registry benchmark: memory per session and connect/disconnect churn with N simulated sessions.
+The old list-of-tuples bookkeeping is measured on a smaller N for comparison, its disconnect is O(n).
+
+    python -m backend.app.benchmarks.connection_registry_bench --sessions 50000
+"""
+
+
+class FakeWebSocket:
+    __slots__ = ()
+
+
+def _make_sessions(count: int, sockets_per_user: int) -> List[Tuple[FakeWebSocket, str, str]]:
+    return [(FakeWebSocket(), f"user-{i // sockets_per_user}", f"nick-{i // sockets_per_user}") for i in range(count)]
+
+
+def bench_registry(count: int, sockets_per_user: int, seed: int) -> dict:
+    connections = _make_sessions(count, sockets_per_user)
+    registry = ConnectionRegistry()
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    for websocket, user_id, nickname in connections:
+        registry.add(Session(websocket, user_id, nickname))
+    connect_time = time.perf_counter() - start
+    memory = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    for i in range(0, count, sockets_per_user):
+        registry.for_user(f"user-{i // sockets_per_user}")
+    lookup_time = time.perf_counter() - start
+
+    random.Random(seed).shuffle(connections)
+    start = time.perf_counter()
+    for websocket, _, _ in connections:
+        registry.remove(websocket)
+    disconnect_time = time.perf_counter() - start
+    assert len(registry) == 0
+
+    return {"sessions": count, "bytes_per_session": memory / count,
+            "connect_us": connect_time / count * 1e6, "lookup_user_us": lookup_time / (count / sockets_per_user) * 1e6,
+            "disconnect_us": disconnect_time / count * 1e6}
+
+
+def bench_legacy(count: int, sockets_per_user: int, seed: int) -> dict:
+    # Прежняя схема: список (websocket, user_id), словарь ников и пересборка списка при отключении
+    connections = _make_sessions(count, sockets_per_user)
+    active_connections, nicknames = [], {}
+
+    start = time.perf_counter()
+    for websocket, user_id, nickname in connections:
+        active_connections.append((websocket, user_id))
+        nicknames[websocket] = nickname
+    connect_time = time.perf_counter() - start
+
+    random.Random(seed).shuffle(connections)
+    start = time.perf_counter()
+    for websocket, _, _ in connections:
+        active_connections = [(conn, uid) for conn, uid in active_connections if conn != websocket]
+        nicknames.pop(websocket, None)
+    disconnect_time = time.perf_counter() - start
+
+    return {"sessions": count, "connect_us": connect_time / count * 1e6,
+            "disconnect_us": disconnect_time / count * 1e6}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sessions", type=int, default=50000)
+    parser.add_argument("--legacy-sessions", type=int, default=5000)
+    parser.add_argument("--sockets-per-user", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    result = bench_registry(args.sessions, args.sockets_per_user, args.seed)
+    print(f"registry  {result['sessions']:>7} sessions: {result['bytes_per_session']:.0f} B/session, "
+          f"connect {result['connect_us']:.2f} us, lookup by user {result['lookup_user_us']:.2f} us, "
+          f"disconnect {result['disconnect_us']:.2f} us")
+    if args.legacy_sessions:
+        legacy = bench_legacy(args.legacy_sessions, args.sockets_per_user, args.seed)
+        print(f"legacy    {legacy['sessions']:>7} sessions: connect {legacy['connect_us']:.2f} us, "
+              f"disconnect {legacy['disconnect_us']:.2f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,369 @@
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import websockets
+
+from backend.app.api.websocket_core.wire_codec import decode_message
+from common.app.core.config import config as cfg
+
+"""
+Websocket load benchmark: N simulated users place pixels, move cursors and request the field at configurable
+rates against a real server, started as a local uvicorn subprocess (or an already running one given with --url).
+
+Reported for the measurement window, after connecting everyone and a warmup:
+ - throughput: placements sent and pixel broadcasts received per second, deliveries per placement;
+ - latency from sending update_pixel to receiving its broadcast, over every receiving client (p50/p95/p99);
+ - latency of get_field_state;
+ - server CPU (percent of one core) and resident memory, read from /proc of the server process.
+Every user gets its own seeded random generator, so the same arguments produce the same load. The results are
+written as JSON together with the commit and the arguments; compare two runs with
+backend.app.benchmarks.compare, which exits non-zero on a regression.
+
+The started server uses STORAGE_BACKEND from the environment unless --storage is given: "memory" measures
+the websocket layer alone, "postgres" includes the database round trips. Users are created with unique
+bench-* nicknames, so point a persistent backend at a disposable database.
+
+    python -m backend.app.benchmarks.websocket_load_bench --users 200 --duration 30 --output after.json
+    python -m backend.app.benchmarks.compare before.json after.json
+"""
+
+REPO_ROOT = Path(__file__).resolve().parents[3]
+
+# Параметры нагрузки: результаты сравнимы, только если они совпадают
+LOAD_ARGS = ("users", "duration", "warmup", "placement_rate", "cursor_rate", "field_state_rate", "protocol", "seed",
+             "storage")
+
+
+def percentiles(samples: List[float]) -> dict:
+    # Перцентили по ближайшему рангу, в миллисекундах
+    if not samples:
+        return {"count": 0, "p50": None, "p95": None, "p99": None, "max": None}
+    ordered = sorted(samples)
+
+    def rank(q: float) -> float:
+        return round(ordered[max(math.ceil(q * len(ordered)) - 1, 0)] * 1000, 3)
+
+    return {"count": len(ordered), "p50": rank(0.50), "p95": rank(0.95), "p99": rank(0.99), "max": rank(1.0)}
+
+
+class ProcessUsage:
+    """
+    CPU и память процесса сервера из /proc (Linux)
+    """
+
+    def __init__(self, pid: int):
+        self.pid = pid
+        self.ticks = os.sysconf("SC_CLK_TCK")
+        self.page_size = os.sysconf("SC_PAGE_SIZE")
+
+    def cpu_seconds(self) -> float:
+        with open(f"/proc/{self.pid}/stat") as stat:
+            # Имя процесса в скобках может содержать пробелы, поля считаем после него
+            fields = stat.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / self.ticks  # utime + stime
+
+    def rss_bytes(self) -> int:
+        with open(f"/proc/{self.pid}/statm") as statm:
+            return int(statm.read().split()[1]) * self.page_size
+
+
+class ServerProcess:
+    def __init__(self, port: int, storage: Optional[str] = None):
+        self.port = port
+        self.storage = storage
+        self.process: Optional[subprocess.Popen] = None
+
+    def start(self):
+        env = {**os.environ, "PYTHONPATH": str(REPO_ROOT)}
+        if self.storage:
+            env["STORAGE_BACKEND"] = self.storage
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "backend.app.main:app", "--host", "127.0.0.1",
+             "--port", str(self.port), "--log-level", "warning"],
+            cwd=REPO_ROOT, env=env)
+
+    async def wait_ready(self, timeout: float = 30):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"Server exited with code {self.process.returncode}")
+            try:
+                with socket.create_connection(("127.0.0.1", self.port), timeout=0.5):
+                    return
+            except OSError:
+                await asyncio.sleep(0.2)
+        raise RuntimeError(f"Server did not start listening on port {self.port} in {timeout} s")
+
+    def stop(self):
+        if self.process is None or self.process.poll() is not None:
+            return
+        # SIGTERM: сервер отпускает клиентов и дописывает изменения в базу
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+
+
+class LoadStats:
+    def __init__(self):
+        self.measuring = False
+        self.settling = False  # окно закончилось, дожидаемся рассылок уже отправленных пикселей
+        self.connected = 0
+        self.placements = 0
+        self.deliveries = 0
+        self.messages = 0
+        self.errors: Dict[str, int] = {}
+        self.disconnects = 0
+        self.pending: Dict[Tuple[int, int, str, str], float] = {}  # (x, y, color, nickname) -> время отправки
+        self.broadcast_latencies: List[float] = []
+        self.field_state_latencies: List[float] = []
+
+    def placed(self, key: Tuple[int, int, str, str]):
+        if self.measuring and not self.settling:
+            self.placements += 1
+            self.pending[key] = time.perf_counter()
+
+    def received_pixel(self, pixel: dict, now: float):
+        sent = self.pending.get((pixel["x"], pixel["y"], pixel["color"], pixel["nickname"]))
+        if sent is not None and self.measuring:
+            self.deliveries += 1
+            self.broadcast_latencies.append(now - sent)
+
+    def error(self, message: str):
+        if self.measuring:
+            self.errors[message] = self.errors.get(message, 0) + 1
+
+
+class SimulatedUser:
+    def __init__(self, nickname: str, args: argparse.Namespace, stats: LoadStats, rng: random.Random):
+        self.nickname = nickname
+        self.args = args
+        self.stats = stats
+        self.rng = rng
+        self.field_state_sent: Optional[float] = None
+        self.websocket = None
+
+    def _next(self, rate: float, now: float) -> float:
+        # Пуассоновский поток: интервалы между действиями распределены экспоненциально
+        return now + self.rng.expovariate(rate) if rate > 0 else math.inf
+
+    async def run(self, url: str, stop: asyncio.Event):
+        async with websockets.connect(url, max_size=None) as websocket:
+            self.websocket = websocket
+            await websocket.send(json.dumps({"type": "login", "data": {"nickname": self.nickname,
+                                                                       "protocol": self.args.protocol}}))
+            while True:
+                reply = json.loads(await websocket.recv())
+                if reply["type"] == "success":
+                    break
+                if reply["type"] == "error":
+                    raise RuntimeError(f"Login of {self.nickname} failed: {reply['message']}")
+            self.stats.connected += 1
+            reader = asyncio.create_task(self.read(websocket))
+            try:
+                await self.act(websocket, stop)
+            finally:
+                reader.cancel()
+
+    async def act(self, websocket, stop: asyncio.Event):
+        width, height = self.args.field_size
+        now = time.perf_counter()
+        next_pixel = self._next(self.args.placement_rate, now)
+        next_cursor = self._next(self.args.cursor_rate, now)
+        next_field = self._next(self.args.field_state_rate, now)
+        while not stop.is_set():
+            due = min(next_pixel, next_cursor, next_field)
+            wait = due - time.perf_counter()
+            if wait > 0:
+                try:
+                    await asyncio.wait_for(stop.wait(), min(wait, 1.0))
+                    return
+                except asyncio.TimeoutError:
+                    pass
+                if time.perf_counter() < due:
+                    continue
+            if due == next_pixel:
+                x, y = self.rng.randrange(width), self.rng.randrange(height)
+                color = f"#{self.rng.randrange(1 << 24):06X}"
+                self.stats.placed((x, y, color, self.nickname))
+                await websocket.send(json.dumps({"type": "update_pixel", "data": {"x": x, "y": y, "color": color}}))
+                next_pixel = self._next(self.args.placement_rate, due)
+            elif due == next_cursor:
+                position = {"x": self.rng.randrange(width), "y": self.rng.randrange(height)}
+                await websocket.send(json.dumps({"type": "update_selection", "data": {"position": position}}))
+                next_cursor = self._next(self.args.cursor_rate, due)
+            else:
+                self.field_state_sent = time.perf_counter()
+                await websocket.send(json.dumps({"type": "get_field_state"}))
+                next_field = self._next(self.args.field_state_rate, due)
+
+    async def read(self, websocket):
+        try:
+            async for message in websocket:
+                self.handle(message, time.perf_counter())
+        except websockets.ConnectionClosed:
+            self.stats.disconnects += 1
+
+    def handle(self, message, now: float):
+        stats = self.stats
+        if stats.measuring:
+            stats.messages += 1
+        if isinstance(message, bytes):
+            if self.args.protocol != "binary":
+                return
+            data = decode_message(message)
+        else:
+            data = json.loads(message)
+        message_type = data.get("type")
+        if message_type == "pixel_update":
+            stats.received_pixel(data["data"], now)
+        elif message_type == "batch_update":
+            for pixel in data["data"]["pixels"]:
+                stats.received_pixel(pixel, now)
+        elif message_type == "field_state":
+            if self.field_state_sent is not None and stats.measuring:
+                stats.field_state_latencies.append(now - self.field_state_sent)
+            self.field_state_sent = None
+        elif message_type == "ping":
+            asyncio.ensure_future(self.websocket.send(json.dumps({"type": "pong"})))
+        elif message_type == "error":
+            stats.error(data.get("message", ""))
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run_benchmark(args: argparse.Namespace) -> dict:
+    server, url = None, args.url
+    if url is None:
+        server = ServerProcess(args.port, args.storage)
+        server.start()
+        await server.wait_ready()
+        url = f"ws://127.0.0.1:{args.port}/ws/"
+    pid = server.process.pid if server else args.server_pid
+    usage = ProcessUsage(pid) if pid else None
+    stats = LoadStats()
+    stop = asyncio.Event()
+    run_id = uuid.uuid4().hex[:6]
+    started_at = datetime.now(timezone.utc).isoformat()
+    tasks = []
+    try:
+        for i in range(args.users):
+            user = SimulatedUser(f"bench-{run_id}-{i}", args, stats, random.Random(args.seed * 1000003 + i))
+            tasks.append(asyncio.create_task(user.run(url, stop)))
+            await asyncio.sleep(1 / args.connect_rate)
+        deadline = time.monotonic() + 60
+        while stats.connected < args.users:
+            failed = [task for task in tasks if task.done()]
+            if failed:
+                failed[0].result()
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"Only {stats.connected} of {args.users} users logged in")
+            await asyncio.sleep(0.1)
+        await asyncio.sleep(args.warmup)
+
+        cpu_before = usage.cpu_seconds() if usage else None
+        client_cpu_before = time.process_time()
+        rss_peak = 0
+        started = time.perf_counter()
+        stats.measuring = True
+        while time.perf_counter() - started < args.duration:
+            await asyncio.sleep(min(0.5, args.duration - (time.perf_counter() - started)))
+            if usage:
+                rss_peak = max(rss_peak, usage.rss_bytes())
+        elapsed = time.perf_counter() - started
+        # Дожидаемся рассылок, отправленных в конце окна, но новых изменений уже не учитываем
+        stats.settling = True
+        placements = stats.placements
+        await asyncio.sleep(args.settle)
+        stats.measuring = False
+        cpu_after = usage.cpu_seconds() if usage else None
+        client_cpu = time.process_time() - client_cpu_before
+    finally:
+        stop.set()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if server:
+            server.stop()
+
+    server_report = None
+    if usage:
+        server_report = {"cpu_percent": round((cpu_after - cpu_before) / (elapsed + args.settle) * 100, 1),
+                         "rss_peak_mb": round(rss_peak / 2 ** 20, 1)}
+    return {
+        "meta": {"commit": _git_commit(), "started_at": started_at,
+                 "python": platform.python_version(), "url": url,
+                 "args": {name: getattr(args, name) for name in LOAD_ARGS}},
+        "results": {
+            "placements": placements,
+            "placements_per_s": round(placements / elapsed, 2),
+            "deliveries_per_s": round(stats.deliveries / elapsed, 2),
+            "deliveries_per_placement": round(stats.deliveries / placements, 2) if placements else None,
+            "messages_per_s": round(stats.messages / elapsed, 2),
+            "latency_ms": percentiles(stats.broadcast_latencies),
+            "field_state_ms": percentiles(stats.field_state_latencies),
+            "errors": sum(stats.errors.values()),
+            "error_messages": stats.errors,
+            "disconnects": stats.disconnects,
+            "client_cpu_percent": round(client_cpu / (elapsed + args.settle) * 100, 1),
+            "server": server_report,
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--duration", type=float, default=30, help="measurement window, seconds")
+    parser.add_argument("--warmup", type=float, default=5, help="load before measuring, seconds")
+    parser.add_argument("--settle", type=float, default=1, help="wait for late broadcasts after the window")
+    parser.add_argument("--placement-rate", type=float, default=1, help="update_pixel per user per second")
+    parser.add_argument("--cursor-rate", type=float, default=5, help="update_selection per user per second")
+    parser.add_argument("--field-state-rate", type=float, default=0.05, help="get_field_state per user per second")
+    parser.add_argument("--protocol", choices=("json", "binary"), default="json")
+    parser.add_argument("--field-size", type=int, nargs=2, default=cfg.FIELD_SIZE, metavar=("WIDTH", "HEIGHT"))
+    parser.add_argument("--connect-rate", type=float, default=50, help="new connections per second")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--storage", choices=("postgres", "sqlite", "memory"),
+                        help="STORAGE_BACKEND of the started server")
+    parser.add_argument("--url", help="benchmark a running server instead of starting one")
+    parser.add_argument("--server-pid", type=int, help="process of the running server, for CPU and memory")
+    parser.add_argument("--port", type=int, default=8765, help="port of the started server")
+    parser.add_argument("--output", default="websocket_load.json")
+    args = parser.parse_args()
+
+    report = asyncio.run(run_benchmark(args))
+    results = report["results"]
+    latency = results["latency_ms"]
+    print(f"{args.users} users: {results['placements_per_s']} placements/s, "
+          f"{results['deliveries_per_s']} deliveries/s ({results['deliveries_per_placement']} per placement), "
+          f"latency p50 {latency['p50']} ms, p95 {latency['p95']} ms, p99 {latency['p99']} ms, "
+          f"errors {results['errors']}")
+    if results["server"]:
+        print(f"server: {results['server']['cpu_percent']}% CPU, {results['server']['rss_peak_mb']} MB peak RSS")
+    with open(args.output, "w") as output:
+        json.dump(report, output, indent=2)
+    print(f"results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,7 +4,14 @@ from fastapi.middleware.cors import CORSMiddleware
 
 from backend.app.api.router import include_api
 from common.app.core.config import config as cfg
-from common.app.db import db_pool, create_db
+from common.app.db.storage import storage
+from backend.app.api.websocket_core.canvas import canvas
+from backend.app.api.websocket_core.write_queue import pixel_write_queue
+from backend.app.api.websocket_core.bus import bus
+from backend.app.api.websocket_core.cluster import join_cluster
+from backend.app.api.websocket_core.connection_manager import manager
+from backend.app.api.websocket_core.handlers import drain_server
+from backend.app.api.websocket_core.loop_monitor import loop_monitor
 # from backend.app.api.web_socket import app_ws as websocket_app
 from backend.app.api.web_socket import app_ws as websocket_app
 from prometheus_fastapi_instrumentator import Instrumentator
@@ -45,13 +52,26 @@ app.add_middleware(
 # Function to be called when the server starts
 @app.on_event("startup")
 async def open_pool():
-    await db_pool.init_pool(cfg)
-    await create_db.init_db()
-    logging.debug(f'=> pool open:')
+    await storage.start()
+    logging.debug(f'=> storage open: {cfg.STORAGE_BACKEND}')
+    # Подписка на события других серверов (BUS_BACKEND) и загрузка поля
+    await join_cluster()
+    pixel_write_queue.start()
+    manager.presence.start()
+    manager.heartbeat.start()
+    loop_monitor.start()
 
 
 # Function to be called when the server shuts down
 @app.on_event("shutdown")
 async def close_pool():
-    await db_pool.close_pool()
-    logging.debug('=> pool close /)')
+    # Отпускаем клиентов и дописываем в базу накопленные изменения поля, пока работают шина и пул.
+    # По SIGTERM uvicorn закрывает соединения раньше этого обработчика: клиентов отпускает POST /admin/drain
+    await drain_server()
+    manager.presence.stop()
+    await bus.stop()
+    await pixel_write_queue.stop()
+    canvas.close()
+    loop_monitor.stop()
+    await storage.close()
+    logging.debug('=> storage close /)')
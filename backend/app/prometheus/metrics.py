@@ -1,4 +1,4 @@
-from prometheus_client import Gauge, Counter
+from prometheus_client import Gauge, Counter, Histogram
 
 # Создание метрики для отслеживания активных подключений
 active_connections_gauge = Gauge('active_websocket_connections', 'Number of active websocket_core connections')
@@ -6,3 +6,55 @@ active_connections_gauge = Gauge('active_websocket_connections', 'Number of acti
 # Создаем счетчики для отправленных и полученных сообщений
 ws_messages_sent = Counter('ws_messages_sent', 'Number of WebSocket messages sent')
 ws_messages_received = Counter('ws_messages_received', 'Number of WebSocket messages received')
+ws_messages_rate_limited = Counter('ws_messages_rate_limited', 'Number of WebSocket messages dropped by rate limits',
+                                   ['type'])
+
+# Очередь отложенной записи пикселей в базу
+pixel_write_queue_depth = Gauge('pixel_write_queue_depth', 'Number of pixel writes waiting to be flushed')
+pixel_write_flush_seconds = Histogram('pixel_write_flush_seconds', 'Duration of a batched pixel write',
+                                      buckets=(.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5))
+pixel_write_flushed_rows = Counter('pixel_write_flushed_rows', 'Number of pixel rows written by batched flushes')
+pixel_write_flush_errors = Counter('pixel_write_flush_errors', 'Number of failed batched pixel writes')
+
+# Исходящие очереди соединений
+ws_send_queue_depth = Gauge('ws_send_queue_depth', 'Number of messages waiting in per-connection send queues')
+ws_messages_dropped = Counter('ws_messages_dropped', 'Number of outbound messages dropped for slow consumers')
+ws_slow_consumer_resyncs = Counter('ws_slow_consumer_resyncs', 'Number of send queues reset with a resync request')
+ws_slow_consumer_evictions = Counter('ws_slow_consumer_evictions', 'Number of connections closed as slow consumers')
+
+# Шина событий между серверами
+bus_events_published = Counter('bus_events_published', 'Number of events published to the bus', ['type'])
+bus_events_received = Counter('bus_events_received', 'Number of events received from other nodes', ['type'])
+bus_publish_errors = Counter('bus_publish_errors', 'Number of failed bus publishes')
+
+# Сжатие исходящих сообщений
+ws_compression_bytes_in = Counter('ws_compression_bytes_in', 'Bytes of messages passed to the compressor',
+                                  ['type', 'encoding'])
+ws_compression_bytes_saved = Counter('ws_compression_bytes_saved', 'Bytes saved by compressing outbound messages',
+                                     ['type', 'encoding'])
+ws_compression_cpu_seconds = Counter('ws_compression_cpu_seconds', 'CPU time spent compressing outbound messages',
+                                     ['type'])
+
+# Проверка живости соединений
+ws_pings_sent = Counter('ws_pings_sent', 'Number of heartbeat pings sent to idle connections')
+ws_connections_reaped = Counter('ws_connections_reaped', 'Number of idle or broken connections closed by the heartbeat',
+                                ['reason'])
+
+# Остановка сервера
+server_draining = Gauge('server_draining', 'Whether the server is draining connections before shutdown')
+ws_drain_seconds = Histogram('ws_drain_seconds', 'Time taken to close all connections on drain',
+                             buckets=(.01, .05, .1, .25, .5, 1, 2.5, 5, 10, 30))
+
+# Время обработки входящих сообщений и рассылок по типам; типы берутся из таблицы маршрутов, их число ограничено
+ws_message_seconds = Histogram('ws_message_seconds', 'Time spent processing an incoming message', ['type'],
+                               buckets=(.0001, .00025, .0005, .001, .0025, .005, .01, .025, .05, .1, .25, 1))
+ws_broadcast_seconds = Histogram('ws_broadcast_seconds', 'Time spent queueing a broadcast for its recipients',
+                                 ['type'], buckets=(.00001, .00005, .0001, .0005, .001, .005, .01, .05, .1))
+ws_broadcast_recipients = Histogram('ws_broadcast_recipients', 'Number of recipients of a broadcast', ['type'],
+                                    buckets=(0, 1, 5, 10, 50, 100, 500, 1000, 5000, 10000, 50000))
+
+# Задержки цикла событий
+event_loop_lag_seconds = Histogram('event_loop_lag_seconds', 'How late the event loop runs a scheduled callback',
+                                   buckets=(.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5))
+event_loop_slow_callbacks = Counter('event_loop_slow_callbacks', 'Number of callbacks that held the event loop '
+                                                                 'longer than LOOP_SLOW_CALLBACK_MS')
@@ -1,3 +1,5 @@
+from typing import Literal, Optional
+
 from pydantic import BaseModel, Field
 
 from backend.app.schemas.data_models import (
@@ -40,8 +42,19 @@ class AdminGetOnlineUsersRequest(BaseMessage):
         }
 
 
+class AdminGetOnlineInfoRequest(BaseMessage):
+    type: Literal["get_online_info_admin"] = "get_online_info_admin"
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "type": "get_online_info_admin"
+            }
+        }
+
+
 class AdminChangeCooldownRequest(BaseModel):
-    type: str = Field(default="update_cooldown_admin")
+    type: Literal["update_cooldown_admin"] = "update_cooldown_admin"
     data: int
 
     class Config:
@@ -54,7 +67,7 @@ class AdminChangeCooldownRequest(BaseModel):
 
 
 class AdminPixelUpdateRequest(BaseMessage):
-    type: str = Field(default="update_pixel_admin")
+    type: Literal["update_pixel_admin"] = "update_pixel_admin"
     data: PixelUpdateData
 
     class Config:
@@ -73,18 +86,22 @@ class AdminPixelUpdateRequest(BaseMessage):
 class AdminLoginRequest(BaseMessage):
     type: str = Field(default="login_admin")
     data: str  # Здесь предполагается, что data - это токен
+    compression: Optional[Literal["gzip", "deflate"]] = None
+    heartbeat: bool = False
 
     class Config:
         json_schema_extra = {
             "example": {
                 "type": "login_admin",
-                "data": "token"
+                "data": "token",
+                "compression": "gzip",
+                "heartbeat": True
             }
         }
 
 
 class AdminPixelInfoRequest(BaseMessage):
-    type: str = Field(default="pixel_info_admin")
+    type: Literal["pixel_info_admin"] = "pixel_info_admin"
     data: dict[str, int]  # Словарь с ключами 'x' и 'y'
 
     class Config:
@@ -97,7 +114,7 @@ class AdminPixelInfoRequest(BaseMessage):
 
 
 class AdminBanUserRequest(BaseMessage):
-    type: str = Field(default="toggle_ban_user_admin")
+    type: Literal["toggle_ban_user_admin"] = "toggle_ban_user_admin"
     data: dict[str, str]  # Словарь с ключом 'user_id'
 
     class Config:
@@ -110,7 +127,7 @@ class AdminBanUserRequest(BaseMessage):
 
 
 class AdminResetGameRequest(BaseMessage):
-    type: str = Field(default="reset_game_admin")
+    type: Literal["reset_game_admin"] = "reset_game_admin"
     data: tuple[int, int]
 
     class Config:
@@ -120,3 +137,25 @@ class AdminResetGameRequest(BaseMessage):
                 "data": (10, 10)
             }
         }
+
+
+class AdminDrainServerRequest(BaseMessage):
+    type: Literal["drain_server_admin"] = "drain_server_admin"
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "type": "drain_server_admin"
+            }
+        }
+
+
+class AdminLoopStatsRequest(BaseMessage):
+    type: Literal["loop_stats_admin"] = "loop_stats_admin"
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "type": "loop_stats_admin"
+            }
+        }
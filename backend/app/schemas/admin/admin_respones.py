@@ -3,7 +3,7 @@ from typing import List
 from pydantic import Field
 
 from backend.app.schemas.data_models import (
-    BaseMessage, PixelInfoData, UserInfoData
+    BaseMessage, PixelInfoData, UserInfoData, UsersDiffData, LoopStatsData
 )
 
 
@@ -23,6 +23,22 @@ class AdminUserInfoResponse(BaseMessage):
         }
 
 
+class AdminUsersDiffResponse(BaseMessage):
+    type: str = Field(default="users_diff")
+    data: UsersDiffData
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "type": "users_diff",
+                "data": {
+                    "joined": [{"nickname": "user125", "id": "125"}],
+                    "left": [{"nickname": "user123", "id": "123"}]
+                }
+            }
+        }
+
+
 class AdminPixelInfoResponse(BaseMessage):
     type: str = Field(default="pixel_info_update")
     data: PixelInfoData
@@ -40,3 +56,24 @@ class AdminPixelInfoResponse(BaseMessage):
                 }
             }
         }
+
+
+class AdminLoopStatsResponse(BaseMessage):
+    type: str = Field(default="loop_stats")
+    data: LoopStatsData
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "type": "loop_stats",
+                "data": {
+                    "lag_ms": 0.4,
+                    "max_lag_ms": 182.3,
+                    "slow_callback_ms": 100,
+                    "slow_callbacks": [
+                        {"callback": "websocket_endpoint", "message_type": "get_field_state",
+                         "duration_ms": 181.9, "at": "2024-05-01T12:00:00+00:00"}
+                    ]
+                }
+            }
+        }
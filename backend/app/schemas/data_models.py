@@ -5,13 +5,17 @@ class BaseMessage(BaseModel):
     type: str
 
 
-from typing import Optional, List
+from typing import Optional, List, Literal
 from pydantic import BaseModel
 
 
 class LoginData(BaseModel):
     nickname: str
     user_id: Optional[str] = None
+    snapshot_format: Literal["json", "binary"] = "json"
+    protocol: Literal["json", "binary"] = "json"
+    compression: Optional[Literal["gzip", "deflate"]] = None
+    heartbeat: bool = False
 
 
 class PositionData(BaseModel):
@@ -47,6 +51,27 @@ class FieldStateData(BaseModel):
     selections: List[SelectionData]
 
 
+class FieldStateRequestData(BaseModel):
+    compression: Optional[Literal["gzip", "deflate"]] = None
+
+
+class ViewportData(BaseModel):
+    x: int
+    y: int
+    width: int
+    height: int
+
+
+class TileData(BaseModel):
+    x: int
+    y: int
+
+
+class FieldDeltaRequestData(BaseModel):
+    since_seq: int
+    epoch: str
+
+
 class PixelUpdateData(BaseModel):
     x: int
     y: int
@@ -62,6 +87,38 @@ class SelectionUpdateBroadcastData(BaseModel):
     position: Optional[PositionData] = None
 
 
+class BatchPixelData(BaseModel):
+    seq: int
+    x: int
+    y: int
+    color: str
+    nickname: str
+
+
+class BatchUpdateData(BaseModel):
+    pixels: List[BatchPixelData]
+    selections: List[SelectionUpdateBroadcastData]
+
+
 class UserInfoData(BaseModel):
     nickname: str
     id: str
+
+
+class UsersDiffData(BaseModel):
+    joined: List[UserInfoData]
+    left: List[UserInfoData]
+
+
+class SlowCallbackData(BaseModel):
+    callback: str
+    message_type: Optional[str] = None  # последнее сообщение, которое обработала задача
+    duration_ms: float
+    at: str
+
+
+class LoopStatsData(BaseModel):
+    lag_ms: float
+    max_lag_ms: float
+    slow_callback_ms: int
+    slow_callbacks: List[SlowCallbackData]
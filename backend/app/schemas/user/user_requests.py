@@ -1,14 +1,17 @@
+from typing import Optional, Literal
+
 from pydantic import BaseModel, Field
 
 from backend.app.schemas.data_models import (
     BaseMessage, PixelUpdateData,
     SelectionUpdateData,
-    LoginData
+    LoginData, FieldStateRequestData, FieldDeltaRequestData,
+    ViewportData, TileData
 )
 
 
 class SelectionUpdateRequest(BaseModel):
-    type: str = Field(default="update_selection")
+    type: Literal["update_selection"] = "update_selection"
     data: SelectionUpdateData
 
     class Config:
@@ -27,7 +30,7 @@ class SelectionUpdateRequest(BaseModel):
 
 
 class PixelUpdateRequest(BaseMessage):
-    type: str = Field(default="update_pixel")
+    type: Literal["update_pixel"] = "update_pixel"
     data: PixelUpdateData
 
     class Config:
@@ -53,25 +56,82 @@ class LoginRequest(BaseMessage):
                 "type": "login",
                 "data": {
                     "nickname": "user123",
-                    "user_id": "123"
+                    "user_id": "123",
+                    "snapshot_format": "json",
+                    "protocol": "json",
+                    "compression": "gzip"
                 }
             }
         }
 
 
 class GetFieldStateRequest(BaseMessage):
-    type: str = Field(default="get_field_state")
+    type: Literal["get_field_state"] = "get_field_state"
+    data: Optional[FieldStateRequestData] = None  # compression: ответ бинарным фреймом в gzip/deflate
 
     class Config:
         json_schema_extra = {
             "example": {
                 "type": "get_field_state",
+                "data": {
+                    "compression": "gzip"
+                }
+            }
+        }
+
+
+class GetFieldDeltaRequest(BaseMessage):
+    type: Literal["get_field_delta"] = "get_field_delta"
+    data: FieldDeltaRequestData
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "type": "get_field_delta",
+                "data": {
+                    "since_seq": 120,
+                    "epoch": "5f0c6d1e9a2b4c7d8e9f0a1b2c3d4e5f"
+                }
+            }
+        }
+
+
+class SubscribeViewportRequest(BaseMessage):
+    type: Literal["subscribe_viewport"] = "subscribe_viewport"
+    data: Optional[ViewportData] = None  # None - снова получать обновления всего поля
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "type": "subscribe_viewport",
+                "data": {
+                    "x": 0,
+                    "y": 0,
+                    "width": 100,
+                    "height": 60
+                }
+            }
+        }
+
+
+class GetTileStateRequest(BaseMessage):
+    type: Literal["get_tile_state"] = "get_tile_state"
+    data: TileData  # координаты тайла, а не пикселя
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "type": "get_tile_state",
+                "data": {
+                    "x": 1,
+                    "y": 0
+                }
             }
         }
 
 
 class GetOnlineCountRequest(BaseMessage):
-    type: str = Field(default="get_online_count")
+    type: Literal["get_online_count"] = "get_online_count"
 
     class Config:
         json_schema_extra = {
@@ -82,7 +142,7 @@ class GetOnlineCountRequest(BaseMessage):
 
 
 class GetCooldownRequest(BaseMessage):
-    type: str = Field(default="get_cooldown")
+    type: Literal["get_cooldown"] = "get_cooldown"
 
     class Config:
         json_schema_extra = {
@@ -93,7 +153,7 @@ class GetCooldownRequest(BaseMessage):
 
 
 class DisconnectRequest(BaseMessage):
-    type: str = Field(default="disconnect")
+    type: Literal["disconnect"] = "disconnect"
 
     class Config:
         json_schema_extra = {
@@ -101,3 +161,14 @@ class DisconnectRequest(BaseMessage):
                 "type": "disconnect",
             }
         }
+
+
+class PongRequest(BaseMessage):
+    type: Literal["pong"] = "pong"
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "type": "pong",
+            }
+        }
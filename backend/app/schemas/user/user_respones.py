@@ -1,9 +1,9 @@
-from typing import Dict
+from typing import Dict, Optional
 
 from pydantic import BaseModel, Field
 
 from backend.app.schemas.data_models import (
-    BaseMessage, FieldStateData, SelectionUpdateBroadcastData
+    BaseMessage, FieldStateData, SelectionUpdateBroadcastData, BatchUpdateData
 )
 
 
@@ -20,6 +20,19 @@ class ErrorResponse(BaseMessage):
         }
 
 
+class CooldownErrorResponse(ErrorResponse):
+    remaining: float  # секунд до следующей возможности поставить пиксель
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "type": "error",
+                "message": "You can only color a pixel at a set time.",
+                "remaining": 4.2
+            }
+        }
+
+
 class SuccessResponse(BaseMessage):
     type: str = Field(default="success")
     data: str
@@ -78,6 +91,17 @@ class AuthResponse(BaseMessage):
         }
 
 
+class PingResponse(BaseMessage):
+    type: str = Field(default="ping")
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "type": "ping"
+            }
+        }
+
+
 class OnlineCountResponse(BaseMessage):
     type: str = Field(default="online_count_update")
     data: Dict[str, int]
@@ -97,6 +121,8 @@ class FieldStateResponse(BaseMessage):
     type: str = Field(default="field_state")
     cooldown: int
     size: tuple[int, int]
+    seq: int = 0  # номер последнего изменения, вошедшего в снимок
+    epoch: Optional[str] = None
     data: FieldStateData
 
     class Config:
@@ -104,6 +130,8 @@ class FieldStateResponse(BaseMessage):
             "example": {
                 "type": "field_state",
                 "size": (10, 10),  # Размер поля (x, y)
+                "seq": 120,
+                "epoch": "5f0c6d1e9a2b4c7d8e9f0a1b2c3d4e5f",
                 "data": {
                     "pixels": [
                         {
@@ -131,14 +159,108 @@ class FieldStateResponse(BaseMessage):
         }
 
 
+class FieldDeltaResponse(BaseMessage):
+    type: str = Field(default="field_delta")
+    seq: int
+    epoch: str
+    data: FieldStateData
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "type": "field_delta",
+                "seq": 125,
+                "epoch": "5f0c6d1e9a2b4c7d8e9f0a1b2c3d4e5f",
+                "data": {
+                    "pixels": [
+                        {
+                            "position": {
+                                "x": 10,
+                                "y": 20,
+                            },
+                            "color": "<HEX_цвет>",
+                            "nickname": "<псевдоним>"
+                        }
+                    ],
+                    "selections": []
+                }
+            }
+        }
+
+
+class TileStateResponse(BaseMessage):
+    type: str = Field(default="tile_state")
+    tile: tuple[int, int]
+    tile_size: int
+    seq: int
+    epoch: str
+    data: FieldStateData
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "type": "tile_state",
+                "tile": (1, 0),
+                "tile_size": 32,
+                "seq": 125,
+                "epoch": "5f0c6d1e9a2b4c7d8e9f0a1b2c3d4e5f",
+                "data": {
+                    "pixels": [
+                        {
+                            "position": {
+                                "x": 40,
+                                "y": 20,
+                            },
+                            "color": "<HEX_цвет>",
+                            "nickname": "<псевдоним>"
+                        }
+                    ],
+                    "selections": []
+                }
+            }
+        }
+
+
+class ResyncRequiredResponse(BaseMessage):
+    type: str = Field(default="resync_required")
+    seq: int  # последнее изменение на момент сброса очереди, дальше клиент запрашивает get_field_delta
+    epoch: str
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "type": "resync_required",
+                "seq": 125,
+                "epoch": "5f0c6d1e9a2b4c7d8e9f0a1b2c3d4e5f"
+            }
+        }
+
+
+class ReconnectResponse(BaseMessage):
+    type: str = Field(default="reconnect")
+    data: Dict[str, int]  # retry_after_ms: через сколько переподключаться, у каждого клиента свое
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "type": "reconnect",
+                "data": {
+                    "retry_after_ms": 2350
+                }
+            }
+        }
+
+
 class PixelUpdateResponse(BaseModel):
     type: str = Field(default="pixel_update")
+    seq: Optional[int] = None
     data: dict
 
     class Config:
         json_schema_extra = {
             "example": {
                 "type": "pixel_update",
+                "seq": 121,
                 "data": {
                     "x": 1,
                     "y": 2,
@@ -147,3 +269,27 @@ class PixelUpdateResponse(BaseModel):
                 }
             }
         }
+
+
+class BatchUpdateResponse(BaseModel):
+    type: str = Field(default="batch_update")
+    seq: Optional[int] = None  # seq последнего изменения в пакете, None - в пакете только выделения
+    data: BatchUpdateData
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "type": "batch_update",
+                "seq": 122,
+                "data": {
+                    "pixels": [
+                        {"seq": 121, "x": 1, "y": 2, "color": "#FFFFFF", "nickname": "user123"},
+                        {"seq": 122, "x": 1, "y": 3, "color": "#000000", "nickname": "user456"}
+                    ],
+                    "selections": [
+                        {"nickname": "user123", "position": {"x": 10, "y": 20}},
+                        {"nickname": "user456", "position": None}
+                    ]
+                }
+            }
+        }
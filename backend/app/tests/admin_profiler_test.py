@@ -0,0 +1,82 @@
+import asyncio
+import threading
+import tracemalloc
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import backend.app.api.admin_profiler as admin_profiler
+from backend.app.api.admin_profiler import sample_stacks, collapse, heap_diff
+
+
+# pytest backend/app/tests/admin_profiler_test.py
+
+
+def spin(stop: threading.Event):
+    while not stop.is_set():
+        sum(range(1000))
+
+
+def test_sample_stacks_collapses_busy_thread():
+    stop = threading.Event()
+    worker = threading.Thread(target=spin, args=(stop,))
+    worker.start()
+    try:
+        stacks = sample_stacks(worker.ident, seconds=0.1, interval=0.005)
+    finally:
+        stop.set()
+        worker.join()
+
+    assert sum(stacks.values()) >= 5
+    assert all(":spin:" in stack for stack in stacks)
+    # Корень стека идет первым, вершина - последней
+    assert all(stack.split(";")[0].startswith("threading.py:_bootstrap") for stack in stacks)
+    line = collapse(stacks).splitlines()[0]
+    assert line.rsplit(" ", 1)[1].isdigit()
+
+
+@pytest.mark.asyncio
+async def test_heap_diff_reports_growth_and_stops_tracing():
+    kept = []
+
+    async def allocate():
+        kept.append([bytearray(1024) for _ in range(200)])
+
+    task = asyncio.create_task(allocate())
+    top = await heap_diff(seconds=0.05, limit=5)
+    await task
+    assert not tracemalloc.is_tracing()
+    assert top[0]["size_diff"] >= 200 * 1024
+    assert "admin_profiler_test.py" in top[0]["location"]
+
+
+def make_client(monkeypatch):
+    async def fake_authenticate(token):
+        return ("admin", {"id": 1}) if token == "good" else None
+
+    monkeypatch.setattr(admin_profiler, "authenticate_admin_token", fake_authenticate)
+    app = FastAPI()
+    app.include_router(admin_profiler.router, prefix="/admin")
+    return TestClient(app)
+
+
+def test_profile_requires_admin_token(monkeypatch):
+    client = make_client(monkeypatch)
+    assert client.get("/admin/profile", params={"seconds": 0.05}).status_code == 401
+    response = client.get("/admin/profile", params={"seconds": 0.05},
+                          headers={"Authorization": "Bearer bad"})
+    assert response.status_code == 401
+
+
+def test_profile_returns_folded_stacks(monkeypatch):
+    client = make_client(monkeypatch)
+    response = client.get("/admin/profile", params={"seconds": 0.1, "interval_ms": 5},
+                          headers={"Authorization": "Bearer good"})
+    assert response.status_code == 200
+    assert response.headers["content-disposition"].endswith('.folded"')
+    assert response.text and all(line.rsplit(" ", 1)[1].isdigit() for line in response.text.splitlines())
+
+    response = client.get("/admin/heap", params={"seconds": 0.05, "limit": 3},
+                          headers={"Authorization": "Bearer good"})
+    assert response.status_code == 200 and len(response.json()["top"]) <= 3
@@ -0,0 +1,31 @@
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import backend.app.api.admin_profiler as admin_profiler
+import backend.app.api.admin_server as admin_server
+
+
+# pytest backend/app/tests/admin_server_test.py
+
+
+def test_drain_requires_admin_token(monkeypatch):
+    drained = []
+
+    async def fake_authenticate(token):
+        return ("admin", {"id": 1}) if token == "good" else None
+
+    async def drain_host():
+        drained.append(True)
+
+    monkeypatch.setattr(admin_profiler, "authenticate_admin_token", fake_authenticate)
+    monkeypatch.setattr(admin_server, "drain_host", drain_host)
+    app = FastAPI()
+    app.include_router(admin_server.router, prefix="/admin")
+    client = TestClient(app)
+
+    assert client.post("/admin/drain").status_code == 401
+    assert client.post("/admin/drain", headers={"Authorization": "Bearer bad"}).status_code == 401
+    assert not drained
+    response = client.post("/admin/drain", headers={"Authorization": "Bearer good"})
+    assert response.status_code == 200 and response.json() == {"status": "drained"}
+    assert drained == [True]
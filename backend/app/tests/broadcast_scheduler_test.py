@@ -0,0 +1,79 @@
+import asyncio
+import json
+
+import pytest
+
+from backend.app.api.websocket_core.change_log import change_log
+from backend.app.api.websocket_core.connection_manager import ConnectionManager
+from backend.app.api.websocket_core.tiles import tiles_in_rect
+from backend.app.schemas.data_models import PositionData
+from backend.app.schemas.user.user_respones import BatchUpdateResponse
+from backend.app.tests.conftest import FakeWebSocket
+from common.app.core.config import config as cfg
+
+
+# pytest backend/app/tests/broadcast_scheduler_test.py
+
+
+def batches(websocket: FakeWebSocket) -> list:
+    return [message for message in websocket.sent if '"batch_update"' in message]
+
+
+@pytest.mark.asyncio
+async def test_events_are_batched_per_tick_and_viewport(monkeypatch):
+    monkeypatch.setattr(cfg, "BROADCAST_TICK_MS", 20)
+    monkeypatch.setattr(cfg, "TILE_SIZE", 4)
+    manager = ConnectionManager()
+    everything, corner = FakeWebSocket(), FakeWebSocket()
+    await manager.connect(everything, "alice", "u1")
+    await manager.connect(corner, "bob", "u2")
+    manager.subscribe_viewport(corner, tiles_in_rect(0, 0, 4, 4, (16, 16)))
+
+    seq = change_log.seq
+    await manager.broadcast_pixel_update(1, 1, "#FF0000", "alice")
+    await manager.broadcast_pixel_update(9, 9, "#00FF00", "bob")
+    await manager.update_selection("alice", PositionData(x=2, y=2))
+    await manager.update_selection("alice", PositionData(x=10, y=10))
+    await manager.update_selection("bob", PositionData(x=12, y=12))
+    assert batches(everything) == []
+    await asyncio.sleep(0.05)
+
+    expected = BatchUpdateResponse(seq=seq + 2, data={
+        "pixels": [{"seq": seq + 1, "x": 1, "y": 1, "color": "#FF0000", "nickname": "alice"},
+                   {"seq": seq + 2, "x": 9, "y": 9, "color": "#00FF00", "nickname": "bob"}],
+        "selections": [{"nickname": "alice", "position": {"x": 10, "y": 10}},
+                       {"nickname": "bob", "position": {"x": 12, "y": 12}}],
+    }).json()
+    assert batches(everything) == [expected]
+
+    # Выделение alice побывало в тайле (0, 0) - bob должен узнать, что оно ушло
+    frame = json.loads(batches(corner)[0])
+    assert [pixel["seq"] for pixel in frame["data"]["pixels"]] == [seq + 1]
+    assert frame["data"]["selections"] == [{"nickname": "alice", "position": {"x": 10, "y": 10}}]
+    assert frame["seq"] == seq + 2 and len(batches(corner)) == 1
+
+    await manager.disconnect(everything)
+    await manager.disconnect(corner)
+
+
+@pytest.mark.asyncio
+async def test_each_recipient_gets_a_selection_once(monkeypatch):
+    monkeypatch.setattr(cfg, "TILE_SIZE", 4)
+    manager = ConnectionManager()
+    everything, both, left, admin = FakeWebSocket(), FakeWebSocket(), FakeWebSocket(), FakeWebSocket()
+    await manager.connect(everything, "alice", "u1")
+    await manager.connect(both, "bob", "u2")
+    await manager.connect(left, "carol", "u3")
+    manager.connect_admin(admin, "root")
+    assert manager.subscribe_viewport(both, tiles_in_rect(0, 0, 8, 4, (16, 16)))
+    assert manager.subscribe_viewport(left, tiles_in_rect(0, 0, 4, 4, (16, 16)))
+    # Админ всегда получает всё поле
+    assert not manager.subscribe_viewport(admin, tiles_in_rect(0, 0, 4, 4, (16, 16)))
+
+    recipients = list(manager.tile_recipients([(0, 0), (1, 0)]))
+    assert sorted(session.nickname for session in recipients) == ["alice", "bob", "carol", "root"]
+    assert sorted(session.nickname for session in manager.tile_recipients([(3, 3)])) == ["alice", "root"]
+
+    for websocket in (everything, both, left):
+        await manager.disconnect(websocket)
+    manager.disconnect_admin(admin)
@@ -0,0 +1,311 @@
+import asyncio
+import json
+from datetime import datetime, timedelta, timezone
+
+import psycopg
+import pytest
+import pytest_asyncio
+from starlette.websockets import WebSocketState
+
+from backend.app.api.websocket_core import bus as bus_module
+from backend.app.api.websocket_core.bus import MemoryBus, PostgresBus, NOTIFY_PAYLOAD_LIMIT
+from backend.app.api.websocket_core.canvas import canvas
+from backend.app.api.websocket_core.cluster import handle_bus_event, join_cluster
+from backend.app.api.websocket_core.connection_manager import ConnectionManager, manager
+from backend.app.api.websocket_core.handlers import handle_update_pixel, handle_reset_game, handle_drain_server, HOST
+from backend.app.api.websocket_core.rate_limiter import cooldown_tracker
+from backend.app.api.websocket_core.write_queue import pixel_write_queue
+from backend.app.schemas.admin.admin_requests import AdminResetGameRequest
+from backend.app.schemas.data_models import PositionData
+from backend.app.schemas.user.user_requests import PixelUpdateRequest
+from backend.app.tests.conftest import FakeWebSocket
+from common.app.core.config import config as cfg
+from common.app.db.storage import MemoryStorage, storage
+
+
+# pytest backend/app/tests/bus_test.py
+
+
+@pytest_asyncio.fixture
+async def cluster(monkeypatch):
+    # Узел с настоящими обработчиками - глобальное состояние этого процесса (manager, canvas);
+    # соседний узел - отдельный ConnectionManager на той же шине, его входящие события просто копятся
+    hub, received = [], []
+    node_bus, peer_bus = MemoryBus(hub), MemoryBus(hub)
+    monkeypatch.setattr(manager, "bus", node_bus)
+    monkeypatch.setattr(manager.presence, "bus", node_bus)
+    monkeypatch.setattr(manager.presence, "interval", 0.01)
+    monkeypatch.setattr(cfg, "PRESENCE_INTERVAL_MS", 10)
+    monkeypatch.setattr(cfg, "FIELD_SIZE", cfg.FIELD_SIZE)
+    size = canvas.size
+
+    async def record(event):
+        received.append(event)
+
+    await node_bus.start(handle_bus_event)
+    await peer_bus.start(record)
+    peer = ConnectionManager(peer_bus)
+    yield peer_bus, peer, received
+
+    await manager.disconnect_everyone()
+    for websocket in list(manager.registry.admins):
+        manager.disconnect_admin(websocket)
+    await asyncio.sleep(0.05)
+    manager.presence._remote.clear()
+    manager.selections.clear()
+    manager.selections_version += 1
+    canvas._allocate(size)
+    await node_bus.stop()
+    await peer_bus.stop()
+
+
+@pytest.mark.asyncio
+async def test_nodes_share_presence_and_selections(cluster):
+    peer_bus, peer, received = cluster
+    admin, alice, bob = FakeWebSocket(), FakeWebSocket(), FakeWebSocket()
+    manager.connect_admin(admin, "root")
+    await peer.connect(alice, "alice", "u1")
+    await manager.connect(bob, "bob", "u2")
+    await asyncio.sleep(0.05)
+
+    assert bob.of_type("online_count_update")[-1] == {"online": 2}
+    joined = [user for diff in admin.of_type("users_diff") for user in diff["joined"]]
+    assert sorted(user["id"] for user in joined) == ["u1", "u2"]
+    # Отчет этого узла дошел до соседа
+    assert [event["online"] for event in received if event["type"] == "presence"][-1] == 1
+
+    await peer.update_selection("alice", PositionData(x=1, y=2))
+    await asyncio.sleep(0.01)
+    assert bob.of_type("selection_update")[-1] == {"nickname": "alice", "position": {"x": 1, "y": 2}}
+    assert manager.selections["alice"] == PositionData(x=1, y=2)
+
+    await peer.disconnect(alice)
+    await asyncio.sleep(0.05)
+    assert bob.of_type("online_count_update")[-1] == {"online": 1}
+    assert "alice" not in manager.selections
+
+
+@pytest.mark.asyncio
+async def test_pixels_round_trip(cluster, monkeypatch):
+    peer_bus, peer, received = cluster
+    monkeypatch.setattr(cfg, "COOLDOWN", 10)
+    bob = FakeWebSocket()
+    await manager.connect(bob, "bob", "u2")
+
+    # Пиксель с соседнего узла: поле, клиенты и cooldown автора обновляются здесь
+    action_time = datetime.utcnow()
+    peer_bus.publish({"type": "pixel", "x": 1, "y": 2, "color": "#FF0000", "user_id": "u9", "nickname": "zoe",
+                      "action_time": action_time.isoformat()})
+    await asyncio.sleep(0.01)
+    assert canvas.get_pixel(1, 2)["color"] == "#FF0000"
+    assert canvas.get_pixel(1, 2)["nickname"] == "zoe"
+    assert {"x": 1, "y": 2, "color": "#FF0000", "nickname": "zoe"}.items() <= bob.of_type("pixel_update")[-1].items()
+    assert cooldown_tracker.claim("u9", action_time)[0] == "cooldown"
+
+    # Запоздавшее более старое изменение той же клетки не перетирает новое и не рассылается
+    delivered = len(bob.of_type("pixel_update"))
+    peer_bus.publish({"type": "pixel", "x": 1, "y": 2, "color": "#0000FF", "user_id": "u8", "nickname": "yan",
+                      "action_time": (action_time - timedelta(seconds=1)).isoformat()})
+    await asyncio.sleep(0.01)
+    assert canvas.get_pixel(1, 2)["color"] == "#FF0000"
+    assert len(bob.of_type("pixel_update")) == delivered
+
+    # Пиксель, поставленный здесь, уходит соседу
+    await handle_update_pixel(bob, PixelUpdateRequest(data={"x": 3, "y": 4, "color": "#00FF00"}), ("bob", "u2"))
+    await asyncio.sleep(0.01)
+    pixel = [event for event in received if event["type"] == "pixel"][-1]
+    assert (pixel["x"], pixel["y"], pixel["color"], pixel["user_id"], pixel["nickname"]) == \
+        (3, 4, "#00FF00", "u2", "bob")
+    pixel_write_queue.discard()
+
+
+@pytest.mark.asyncio
+async def test_database_decides_the_cooldown_with_a_shared_bus(cluster, monkeypatch):
+    peer_bus, peer, received = cluster
+    monkeypatch.setattr(cfg, "COOLDOWN", 10)
+    monkeypatch.setattr(cfg, "BUS_BACKEND", "postgres")
+    database = MemoryStorage()
+    monkeypatch.setattr(storage, "place_pixel", database.place_pixel)
+    user = await database.create_user("bob")
+    bob = FakeWebSocket()
+    await manager.connect(bob, "bob", user["id"])
+
+    # Тот же пользователь только что поставил пиксель через другой процесс, событие шины еще не дошло
+    await database.place_pixel(0, 0, "#FFFFFF", user["id"], "bob", datetime.utcnow() - timedelta(seconds=4))
+    await handle_update_pixel(bob, PixelUpdateRequest(data={"x": 5, "y": 5, "color": "#00FF00"}), ("bob", user["id"]))
+    await asyncio.sleep(0.01)
+    (error,) = [message for message in bob.messages() if message["type"] == "error"]
+    assert error["remaining"] == pytest.approx(6, abs=0.5)
+    assert canvas.get_pixel(5, 5) is None
+    assert cooldown_tracker.remaining(user["id"], datetime.utcnow().replace(tzinfo=timezone.utc).timestamp()) == \
+        pytest.approx(6, abs=0.5)
+    assert len(pixel_write_queue) == 0
+
+    await handle_update_pixel(bob, PixelUpdateRequest(data={"x": 1, "y": 1, "color": "#00FF00"}), ("admin", None),
+                              permission=True)
+    assert (await database.get_canvas_pixels())[-1]["color"] == "#00FF00"
+    assert canvas.get_pixel(1, 1)["color"] == "#00FF00"
+
+
+@pytest.mark.asyncio
+async def test_reset_round_trip(cluster, monkeypatch):
+    peer_bus, peer, received = cluster
+    admin, bob = FakeWebSocket(), FakeWebSocket()
+    manager.connect_admin(admin, "root")
+    await manager.connect(bob, "bob", "u2")
+    canvas.set_pixel(1, 1, 0xFF0000, "u2", "bob", datetime.utcnow())
+
+    # Сброс с соседнего узла: поле новое, игроки отключены, база не трогается
+    peer_bus.publish({"type": "reset", "size": [8, 8]})
+    await asyncio.sleep(0.01)
+    assert canvas.size == (8, 8)
+    assert cfg.FIELD_SIZE == (8, 8)
+    assert canvas.get_pixel(1, 1) is None
+    assert bob.client_state == WebSocketState.DISCONNECTED
+    assert manager.registry.get(admin) is not None
+
+    # Сброс, сделанный здесь, уходит соседу
+    cleared = []
+
+    async def clear_game():
+        cleared.append(True)
+
+    monkeypatch.setattr(storage, "clear_game", clear_game)
+    await handle_reset_game(admin, AdminResetGameRequest(data=(16, 16)))
+    await asyncio.sleep(0.01)
+    assert cleared and canvas.size == (16, 16)
+    assert [event for event in received if event["type"] == "reset"][-1]["size"] == [16, 16]
+
+
+@pytest.mark.asyncio
+async def test_drain_reaches_the_workers_of_the_same_host(cluster, monkeypatch):
+    peer_bus, peer, received = cluster
+    monkeypatch.setattr(manager, "draining", False)
+    monkeypatch.setattr(cfg, "DRAIN_TIMEOUT_S", 0.5)
+    bob = FakeWebSocket()
+    await manager.connect(bob, "bob", "u2")
+
+    peer_bus.publish({"type": "drain", "host": "another-host"})
+    await asyncio.sleep(0.01)
+    assert not manager.draining and bob.client_state == WebSocketState.CONNECTED
+
+    # Остановку запросили у соседнего воркера этого хоста
+    peer_bus.publish({"type": "drain", "host": HOST})
+    await asyncio.sleep(0.1)
+    assert manager.draining and bob.of_type("reconnect") and bob.client_state == WebSocketState.DISCONNECTED
+
+    # Запрос админа здесь уходит соседям, а соединение самого админа остается открытым
+    monkeypatch.setattr(manager, "draining", False)
+    admin = FakeWebSocket()
+    manager.connect_admin(admin, "root")
+    await handle_drain_server(admin)
+    assert [event for event in received if event["type"] == "drain"][-1]["host"] == HOST
+    assert admin.client_state == WebSocketState.CONNECTED and not admin.of_type("reconnect")
+
+
+def test_notify_payloads_stay_under_the_limit():
+    events = [json.dumps({"type": "pixel", "pad": "x" * 3000, "n": i}) for i in range(7)]
+    payloads = PostgresBus("postgresql://", "channel")._payloads(events)
+    assert len(payloads) > 1
+    assert all(len(payload.encode()) <= NOTIFY_PAYLOAD_LIMIT for payload in payloads)
+    assert [event["n"] for payload in payloads for event in json.loads(payload)] == list(range(7))
+
+
+@pytest.mark.asyncio
+async def test_events_during_load_are_applied_after_it(monkeypatch):
+    hub = []
+    node_bus, peer_bus = MemoryBus(hub), MemoryBus(hub)
+    monkeypatch.setattr(manager, "bus", node_bus)
+    size = canvas.size
+    loaded_at = datetime.utcnow()
+
+    async def get_canvas_pixels():
+        # Пока узел читает поле, сосед ставит пиксель: событие уже не должно потеряться
+        peer_bus.publish({"type": "pixel", "x": 2, "y": 3, "color": "#FF0000", "user_id": "u9", "nickname": "zoe",
+                          "action_time": datetime.utcnow().isoformat()})
+        await asyncio.sleep(0.01)
+        return [{"x": 1, "y": 1, "color": "#00FF00", "user_id": "u1", "nickname": "alice",
+                 "action_time": loaded_at}]
+
+    monkeypatch.setattr(storage, "get_canvas_pixels", get_canvas_pixels)
+    try:
+        await join_cluster()
+        assert canvas.get_pixel(1, 1)["color"] == "#00FF00"
+        assert canvas.get_pixel(2, 3)["color"] == "#FF0000"
+    finally:
+        await node_bus.stop()
+        canvas._allocate(size)
+
+
+@pytest.mark.asyncio
+async def test_resync_applies_newer_pixels_from_storage(cluster, monkeypatch):
+    peer_bus, peer, received = cluster
+    bob = FakeWebSocket()
+    await manager.connect(bob, "bob", "u2")
+    now = datetime.utcnow()
+    canvas.set_pixel(1, 2, 0xFF0000, "u2", "bob", now, manager.bus.node_id)
+    flushed = []
+
+    async def flush():
+        flushed.append(True)
+
+    async def get_canvas_pixels():
+        return [{"x": 1, "y": 2, "color": "#0000FF", "user_id": "u8", "nickname": "yan",
+                 "action_time": now - timedelta(seconds=1)},
+                {"x": 3, "y": 3, "color": "#00FF00", "user_id": "u9", "nickname": "zoe", "action_time": now}]
+
+    monkeypatch.setattr(pixel_write_queue, "flush", flush)
+    monkeypatch.setattr(storage, "get_canvas_pixels", get_canvas_pixels)
+    await handle_bus_event({"type": "resync"})
+    await asyncio.sleep(0.01)
+
+    assert flushed
+    assert canvas.get_pixel(1, 2)["color"] == "#FF0000"
+    assert canvas.get_pixel(3, 3)["color"] == "#00FF00"
+    assert [(update["x"], update["y"]) for update in bob.of_type("pixel_update")] == [(3, 3)]
+
+
+class FakeNotification:
+    def __init__(self, *events):
+        self.payload = json.dumps(list(events))
+
+
+class FakeListenConnection:
+    def __init__(self, notifications, fail: bool):
+        self.notifications = notifications
+        self.fail = fail
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def notifies(self):
+        for notification in self.notifications:
+            yield notification
+        if self.fail:
+            raise psycopg.OperationalError("server closed the connection")
+        await asyncio.Event().wait()
+
+
+@pytest.mark.asyncio
+async def test_listener_reconnect_triggers_resync(monkeypatch):
+    monkeypatch.setattr(bus_module, "RECONNECT_DELAY", 0)
+    connections = [FakeListenConnection([FakeNotification({"type": "pixel", "node": "other"})], fail=True),
+                   FakeListenConnection([FakeNotification({"type": "selection", "node": "other"})], fail=False)]
+
+    async def listen():
+        return connections.pop(0)
+
+    bus = PostgresBus("postgresql://", "channel")
+    monkeypatch.setattr(bus, "_listen", listen)
+    handled = []
+
+    async def record(event):
+        handled.append(event["type"])
+
+    await bus.start(record)
+    await asyncio.sleep(0.05)
+    await bus.stop()
+    assert handled == ["pixel", "resync", "selection"]
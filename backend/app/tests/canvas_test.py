@@ -0,0 +1,71 @@
+from datetime import datetime
+
+import pytest
+
+from backend.app.api.websocket_core.canvas import Canvas, parse_color, format_color
+from backend.app.api.websocket_core.tiles import tiles_in_rect, tile_grid, tile_bounds
+from common.app.core.config import config as cfg
+
+
+# pytest backend/app/tests/canvas_test.py
+
+
+def test_color_round_trip():
+    assert parse_color("#ff5733") == 0xFF5733
+    assert format_color(parse_color("#ff5733")) == "#FF5733"
+    for bad in ("FF5733", "#FF573", "#GG5733", "#+12345"):
+        with pytest.raises(ValueError):
+            parse_color(bad)
+
+
+def test_set_and_read_pixels():
+    canvas = Canvas((4, 3))
+    canvas.set_pixel(3, 2, 0x00FF00, "u1", "alice", datetime.utcnow())
+    canvas.set_pixel(0, 0, 0xFF0000, None, "admin", datetime.utcnow())
+
+    assert canvas.get_pixel(1, 1) is None
+    assert canvas.get_pixel(3, 2) == {"x": 3, "y": 2, "color": "#00FF00", "user_id": "u1", "nickname": "alice"}
+    assert sorted(canvas.pixels()) == [(0, 0, "#FF0000", "admin"), (3, 2, "#00FF00", "alice")]
+
+    canvas.rename_user("u1", "bob")
+    assert canvas.get_pixel(3, 2)["nickname"] == "bob"
+    assert not canvas.contains(4, 0) and not canvas.contains(0, 3)
+
+
+def test_tiles_and_tile_versions(monkeypatch):
+    monkeypatch.setattr(cfg, "TILE_SIZE", 2)
+    assert tiles_in_rect(1, 1, 2, 2, (5, 5)) == {(0, 0), (1, 0), (0, 1), (1, 1)}
+    assert tiles_in_rect(-10, 4, 100, 100, (5, 5)) == {(0, 2), (1, 2), (2, 2)}
+    assert tiles_in_rect(6, 6, 2, 2, (5, 5)) == frozenset()
+    assert tile_grid((5, 5)) == (3, 3) and tile_bounds((2, 2), (5, 5)) == (4, 4, 5, 5)
+
+    canvas = Canvas((5, 5))
+    canvas.set_pixel(3, 0, 0x111111, "u1", "alice", datetime.utcnow())
+    canvas.set_pixel(4, 4, 0x222222, "u1", "alice", datetime.utcnow())
+    assert set(canvas.tile_versions) == {(1, 0), (2, 2)}
+    assert list(canvas.pixels(tile_bounds((1, 0), canvas.size))) == [(3, 0, "#111111", "alice")]
+
+
+def test_nodes_converge_whatever_the_arrival_order():
+    # Два сервера красят одну клетку почти одновременно и получают изменения друг друга в обратном порядке
+    node_a, node_b = "a" * 32, "b" * 32
+    first, second = datetime(2024, 1, 1, 12, 0, 0, 1), datetime(2024, 1, 1, 12, 0, 0, 2)
+    for a_time, b_time in [(first, second), (second, first), (first, first)]:
+        canvas_a, canvas_b = Canvas((2, 2)), Canvas((2, 2))
+        assert canvas_a.set_pixel(0, 0, 0xAAAAAA, "u1", "alice", a_time, node_a)
+        assert canvas_b.set_pixel(0, 0, 0xBBBBBB, "u2", "bob", b_time, node_b)
+        canvas_a.set_pixel(0, 0, 0xBBBBBB, "u2", "bob", b_time, node_b)
+        canvas_b.set_pixel(0, 0, 0xAAAAAA, "u1", "alice", a_time, node_a)
+        assert canvas_a.get_pixel(0, 0) == canvas_b.get_pixel(0, 0)
+        # Побеждает более позднее изменение, при равном времени - узел со старшим id
+        expected = "#AAAAAA" if a_time > b_time else "#BBBBBB"
+        assert canvas_a.get_pixel(0, 0)["color"] == expected
+
+
+def test_stale_pixel_is_not_applied():
+    canvas = Canvas((2, 2))
+    now = datetime.utcnow()
+    assert canvas.set_pixel(1, 1, 0x111111, "u1", "alice", now, "a" * 32)
+    version = canvas.version
+    assert not canvas.set_pixel(1, 1, 0x222222, "u2", "bob", datetime(2000, 1, 1), "b" * 32)
+    assert canvas.get_pixel(1, 1)["color"] == "#111111" and canvas.version == version
@@ -0,0 +1,31 @@
+from backend.app.api.websocket_core.change_log import ChangeLog
+
+
+# pytest backend/app/tests/change_log_test.py
+
+
+def test_since_returns_latest_change_per_cell():
+    log = ChangeLog(capacity=10)
+    log.append(1, 1, "#000000", "alice")
+    log.append(2, 2, "#111111", "alice")
+    log.append(1, 1, "#222222", "bob")
+
+    assert log.since(log.epoch, 0) == [(2, 2, 2, "#111111", "alice"), (3, 1, 1, "#222222", "bob")]
+    assert log.since(log.epoch, 2) == [(3, 1, 1, "#222222", "bob")]
+    assert log.since(log.epoch, 3) == []
+
+
+def test_since_falls_back_when_client_is_too_far_behind_or_stale():
+    log = ChangeLog(capacity=2)
+    for i in range(5):
+        log.append(i, 0, "#FFFFFF", "alice")
+
+    assert log.since(log.epoch, 2) is None
+    assert log.since(log.epoch, 3) == [(4, 3, 0, "#FFFFFF", "alice"), (5, 4, 0, "#FFFFFF", "alice")]
+    assert log.since(log.epoch, 6) is None
+    assert log.since("other-epoch", 4) is None
+
+    epoch = log.epoch
+    log.reset()
+    assert log.epoch != epoch and log.since(epoch, 0) is None
+    assert log.since(log.epoch, 0) == []
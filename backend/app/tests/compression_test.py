@@ -0,0 +1,48 @@
+import asyncio
+import gzip
+import json
+import zlib
+
+import pytest
+
+from backend.app.api.websocket_core.compression import SharedFrame
+from backend.app.api.websocket_core.connection_manager import ConnectionManager
+from backend.app.prometheus.metrics import ws_compression_bytes_saved
+from backend.app.tests.conftest import FakeWebSocket
+from common.app.core.config import config as cfg
+
+
+# pytest backend/app/tests/compression_test.py
+
+
+def test_shared_frame_follows_the_policy(monkeypatch):
+    monkeypatch.setattr(cfg, "COMPRESSION_MIN_BYTES", 100)
+    text = json.dumps({"type": "batch_update", "data": ["pixel"] * 100})
+    frame = SharedFrame("batch_update", text)
+    saved = ws_compression_bytes_saved.labels(type="batch_update", encoding="gzip")._value.get()
+    assert frame.for_encoding(None) is text
+    assert gzip.decompress(frame.for_encoding("gzip")).decode() == text
+    assert frame.for_encoding("gzip") is frame.for_encoding("gzip")
+    assert zlib.decompress(frame.for_encoding("deflate")).decode() == text
+    assert ws_compression_bytes_saved.labels(type="batch_update", encoding="gzip")._value.get() > saved
+
+    assert SharedFrame("batch_update", '{"type":"batch_update"}').for_encoding("gzip") == '{"type":"batch_update"}'
+    assert SharedFrame("pixel_update", text).for_encoding("gzip") is text
+
+
+@pytest.mark.asyncio
+async def test_broadcast_is_compressed_once_for_all_recipients(monkeypatch):
+    monkeypatch.setattr(cfg, "COMPRESSION_MIN_BYTES", 100)
+    manager = ConnectionManager()
+    plain, gzip_a, gzip_b = FakeWebSocket(), FakeWebSocket(), FakeWebSocket()
+    manager.connect_admin(plain, "root")
+    manager.connect_admin(gzip_a, "admin-a", compression="gzip")
+    manager.connect_admin(gzip_b, "admin-b", compression="gzip")
+    for i in range(20):
+        await manager.connect(FakeWebSocket(), f"user-{i}", f"id-{i}")
+    await manager.broadcast_users_info()
+    await asyncio.sleep(0.01)
+
+    (text,) = plain.sent
+    assert gzip_a.sent[0] is gzip_b.sent[0]
+    assert json.loads(gzip.decompress(gzip_a.sent[0])) == json.loads(text)
@@ -0,0 +1,42 @@
+import asyncio
+import json
+
+from starlette.websockets import WebSocketState
+
+
+class FakeWebSocket:
+    # Соединение без сети: отправленные сообщения копятся в sent как есть (str или bytes).
+    # alive=False - отправка падает, как на оборванном соединении; stalled - отправка ждет stalled.set();
+    # stuck - отправка и закрытие не завершаются никогда
+    def __init__(self, alive: bool = True, stalled: bool = False, stuck: bool = False):
+        self.client_state = WebSocketState.CONNECTED
+        self.alive = alive
+        self.stuck = stuck
+        self.stalled = asyncio.Event()
+        if not stalled:
+            self.stalled.set()
+        self.sent = []
+        self.closed_with = None
+
+    async def send_text(self, data):
+        if self.stuck:
+            await asyncio.Event().wait()
+        if not self.alive:
+            raise ConnectionResetError("Connection reset by peer")
+        await self.stalled.wait()
+        self.sent.append(data)
+
+    async def send_bytes(self, data):
+        await self.send_text(data)
+
+    async def close(self, code=1000, reason=""):
+        if self.stuck:
+            await asyncio.Event().wait()
+        self.client_state = WebSocketState.DISCONNECTED
+        self.closed_with = code
+
+    def messages(self) -> list:
+        return [json.loads(message) for message in self.sent if isinstance(message, str)]
+
+    def of_type(self, message_type: str) -> list:
+        return [message.get("data") for message in self.messages() if message["type"] == message_type]
@@ -0,0 +1,118 @@
+import asyncio
+import json
+
+import pytest
+import pytest_asyncio
+from prometheus_client import REGISTRY
+from pydantic import ValidationError
+
+from backend.app.api.web_socket import process_message
+from backend.app.api.websocket_core.connection_manager import ConnectionManager, manager
+from backend.app.api.websocket_core.dispatch import ROUTES, ALLOWED_TYPES, request_adapter
+from backend.app.schemas.admin.admin_requests import AdminChangeCooldownRequest
+from backend.app.schemas.user.user_requests import PixelUpdateRequest
+from backend.app.tests.conftest import FakeWebSocket
+from common.app.core.config import config as cfg
+
+
+# pytest backend/app/tests/dispatch_test.py
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+@pytest_asyncio.fixture
+async def client():
+    # Ответы идут через очередь сессии, поэтому клиент подключен к менеджеру, как после входа
+    websocket = FakeWebSocket()
+    await manager.connect(websocket, "dispatch-user", "dispatch")
+    await asyncio.sleep(0.01)
+    websocket.sent.clear()
+    yield websocket
+    await manager.disconnect(websocket)
+
+
+def test_union_picks_model_by_type():
+    for message_type, route in ROUTES.items():
+        assert route.model.model_fields["type"].default == message_type
+
+    request = request_adapter.validate_json(b'{"type": "update_pixel", "data": {"x": 1, "y": 2, "color": "#FF0000"}}')
+    assert isinstance(request, PixelUpdateRequest) and request.data.x == 1
+    assert isinstance(request_adapter.validate_python({"type": "update_cooldown_admin", "data": 5}),
+                      AdminChangeCooldownRequest)
+    with pytest.raises(ValidationError):
+        request_adapter.validate_python({"type": "no_such_type"})
+
+
+def test_admin_types_are_only_allowed_for_admins():
+    admin_only = {message_type for message_type, route in ROUTES.items() if route.admin_only}
+    assert admin_only and all(message_type.endswith("_admin") for message_type in admin_only)
+    assert ALLOWED_TYPES[False].isdisjoint(admin_only)
+    assert ALLOWED_TYPES[True] == set(ROUTES)
+
+
+@pytest.mark.asyncio
+async def test_process_message_replies(client):
+    websocket = client
+    user = ("dispatch-user", "dispatch")
+    await process_message(websocket, '{"type": "reset_game_admin", "data": [10, 10]}', user)
+    await process_message(websocket, '{"type": "fly"}', user)
+    await process_message(websocket, '{"type": "update_pixel", "data": {"x": "a"}}', user)
+    await process_message(websocket, '{"type": ', user)
+    await process_message(websocket, '{"type": "get_online_count"}', user)
+    await asyncio.sleep(0.01)
+
+    denied, unknown, invalid, broken, online = websocket.sent
+    assert json.loads(denied)["message"] == "Access denied"
+    assert unknown == "Unknown message type or action not allowed."
+    assert json.loads(invalid)["type"] == "error"
+    assert json.loads(broken)["message"] == "Invalid JSON"
+    assert json.loads(online)["type"] == "online_count_update"
+
+
+@pytest.mark.asyncio
+async def test_messages_and_broadcasts_are_timed_by_type():
+    count = sample("ws_message_seconds_count", type="get_online_count")
+    unknown = sample("ws_message_seconds_count", type="unknown")
+    websocket = FakeWebSocket()
+    await process_message(websocket, '{"type": "get_online_count"}', ("metrics-user", "metrics"))
+    await process_message(websocket, '{"type": "no_such_type"}', ("metrics-user", "metrics"))
+    assert sample("ws_message_seconds_count", type="get_online_count") == count + 1
+    assert sample("ws_message_seconds_count", type="unknown") == unknown + 1
+
+    manager = ConnectionManager()
+    recipients = sample("ws_broadcast_recipients_sum", type="cooldown_update")
+    for i in range(3):
+        await manager.connect(FakeWebSocket(), f"fan-{i}", f"fan-{i}")
+    await manager.broadcast('{"type":"cooldown_update","data":5}', message_type="cooldown_update")
+    assert sample("ws_broadcast_recipients_sum", type="cooldown_update") == recipients + 3
+
+
+@pytest.mark.asyncio
+async def test_rate_limited_requests_get_an_error(client, monkeypatch):
+    monkeypatch.setitem(cfg.RATE_LIMITS, "get_online_count", (0.001, 1))
+    monkeypatch.setitem(cfg.RATE_LIMITS, "update_selection", (0.001, 0))
+    websocket = client
+    user = ("limited-user", "limited")
+    for _ in range(2):
+        await process_message(websocket, '{"type": "get_online_count"}', user)
+    await asyncio.sleep(0.01)
+    answered = len(websocket.sent)
+    assert json.loads(websocket.sent[-1]) == {"type": "error", "message": "Rate limited"}
+
+    # Выделения сверх лимита отбрасываются без ответа
+    await process_message(websocket, '{"type": "update_selection", "data": {"position": {"x": 1, "y": 1}}}', user)
+    await asyncio.sleep(0.01)
+    assert len(websocket.sent) == answered
+
+
+@pytest.mark.asyncio
+async def test_admin_viewport_request_is_refused():
+    websocket = FakeWebSocket()
+    manager.connect_admin(websocket, "dispatch-admin")
+    await process_message(websocket, '{"type": "subscribe_viewport", "data": {"x": 0, "y": 0, "width": 4, '
+                                     '"height": 4}}', ("dispatch-admin", None), admin=True)
+    await asyncio.sleep(0.01)
+    assert json.loads(websocket.sent[-1]) == {"type": "error", "message": "Admins always receive the whole field"}
+    manager.disconnect_admin(websocket)
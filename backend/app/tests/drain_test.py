@@ -0,0 +1,35 @@
+import time
+
+import pytest
+
+from backend.app.api.websocket_core.connection_manager import ConnectionManager
+from backend.app.tests.conftest import FakeWebSocket
+
+
+# pytest backend/app/tests/drain_test.py
+
+
+@pytest.mark.asyncio
+async def test_drain_closes_everyone_under_the_deadline():
+    manager = ConnectionManager()
+    admin = FakeWebSocket()
+    manager.connect_admin(admin, "root")
+    clients = [FakeWebSocket() for _ in range(50)]
+    for i, websocket in enumerate(clients):
+        await manager.connect(websocket, f"user-{i}", f"id-{i}")
+    stuck = FakeWebSocket(stuck=True)
+    await manager.connect(stuck, "stuck", "stuck")
+
+    started = time.monotonic()
+    await manager.drain(0.5, 3000)
+    assert time.monotonic() - started < 1
+    assert manager.draining and len(manager.registry.by_websocket) == 0
+
+    delays = set()
+    for websocket in clients + [admin]:
+        (reconnect,) = [message for message in websocket.messages() if message["type"] == "reconnect"]
+        assert 0 <= reconnect["data"]["retry_after_ms"] <= 3000
+        delays.add(reconnect["data"]["retry_after_ms"])
+        assert websocket.closed_with == 1012
+    # Клиенты переподключаются не одновременно
+    assert len(delays) > 1
@@ -0,0 +1,63 @@
+import gzip
+import json
+from datetime import datetime
+
+import pytest
+
+from backend.app.api.websocket_core.canvas import canvas
+from backend.app.api.websocket_core.change_log import change_log
+from backend.app.api.websocket_core.connection_manager import manager
+from backend.app.api.websocket_core.field_state_cache import FieldStateCache
+from backend.app.api.websocket_core.snapshot_codec import decode_snapshot
+from backend.app.schemas.data_models import PixelData, PositionData, SelectionData, FieldStateData
+from backend.app.schemas.user.user_respones import FieldStateResponse
+from common.app.core.config import config as cfg
+
+
+# pytest backend/app/tests/field_state_cache_test.py
+
+
+@pytest.fixture(autouse=True)
+def clean_field():
+    # Тесты рисуют на общем поле и ставят выделения в общий менеджер: после теста все убирается,
+    # даже если проверка упала
+    yield
+    manager.selections.clear()
+    manager.selections_version += 1
+    canvas._allocate(canvas.size)
+
+
+def test_cached_payload_matches_pydantic_and_follows_versions():
+    cache = FieldStateCache()
+    canvas.set_pixel(1, 2, 0xFF5733, "u1", "alice", datetime.utcnow())
+    manager.selections["alice"] = PositionData(x=3, y=4)
+    manager.selections_version += 1
+
+    expected = FieldStateResponse(
+        size=canvas.size, cooldown=cfg.COOLDOWN, seq=change_log.seq, epoch=change_log.epoch,
+        data=FieldStateData(
+            pixels=[PixelData(position=PositionData(x=1, y=2), color="#FF5733", nickname="alice")],
+            selections=[SelectionData(nickname="alice", position=PositionData(x=3, y=4))]),
+    ).json()
+    payload = cache.payload()
+    assert json.loads(payload) == json.loads(expected)
+    assert cache.payload() is payload
+    assert gzip.decompress(cache.compressed("gzip")) == payload.encode()
+
+    canvas.set_pixel(0, 0, 0x000000, "u2", "bob", datetime.utcnow())
+    assert cache.payload() is not payload
+    assert len(json.loads(cache.payload())["data"]["pixels"]) == 2
+
+
+def test_binary_snapshot_decodes_to_the_json_field_state():
+    cache = FieldStateCache()
+    canvas.set_pixel(5, 1, 0x00FF7F, "u1", "алиса", datetime.utcnow())
+    canvas.set_pixel(0, 63, 0xFFFFFF, None, "admin", datetime.utcnow())
+    manager.selections["алиса"] = PositionData(x=7, y=8)
+    manager.selections_version += 1
+
+    snapshot = cache.binary()
+    decoded = decode_snapshot(snapshot)
+    expected = json.loads(cache.payload())
+    expected.pop("type")
+    assert decoded == expected
@@ -0,0 +1,67 @@
+import asyncio
+import time
+
+import pytest
+
+from backend.app.api.websocket_core.connection_manager import ConnectionManager
+from backend.app.tests.conftest import FakeWebSocket
+from common.app.core.config import config as cfg
+
+
+# pytest backend/app/tests/heartbeat_test.py
+
+
+@pytest.mark.asyncio
+async def test_silent_and_broken_connections_are_reaped_together(monkeypatch):
+    monkeypatch.setattr(cfg, "PRESENCE_INTERVAL_MS", 10)
+    manager = ConnectionManager()
+    manager.heartbeat.interval, manager.heartbeat.timeout = 10, 30
+    admin = FakeWebSocket()
+    manager.connect_admin(admin, "root")
+    active, quiet = FakeWebSocket(), FakeWebSocket()
+    sessions = {name: await manager.connect(websocket, name, name, heartbeat=True)
+                for name, websocket in [("active", active), ("quiet", quiet)]}
+    ghosts = [FakeWebSocket() for _ in range(5)]
+    for i, ghost in enumerate(ghosts):
+        sessions[f"ghost-{i}"] = await manager.connect(ghost, f"ghost-{i}", f"ghost-{i}", heartbeat=True)
+    # Старый клиент не знает ping/pong: за молчание его не закрываем, а оборванную отправку - закрываем
+    legacy = FakeWebSocket()
+    sessions["legacy"] = await manager.connect(legacy, "legacy", "legacy")
+    half_open = FakeWebSocket(alive=False)
+    await manager.connect(half_open, "half-open", "half-open")
+    await asyncio.sleep(0.05)
+    assert admin.of_type("online_count_update")[-1] == {"online": 9}
+
+    now = time.monotonic()
+    sessions["quiet"].last_seen = now - 15
+    sessions["legacy"].last_seen = now - 40
+    for i in range(5):
+        sessions[f"ghost-{i}"].last_seen = now - 40
+    await manager.heartbeat.beat()
+    await asyncio.sleep(0.05)
+
+    assert quiet.of_type("ping") and not active.of_type("ping") and not legacy.of_type("ping")
+    assert all(ghost.closed_with == 1001 for ghost in ghosts) and half_open.closed_with == 1001
+    assert legacy.closed_with is None
+    assert manager.online_count == 3
+    # Шесть отключений - один отчет присутствия
+    assert admin.of_type("online_count_update") == [{"online": 9}, {"online": 3}]
+    (diff,) = admin.of_type("users_diff")[1:]
+    assert len(diff["left"]) == 6
+
+
+@pytest.mark.asyncio
+async def test_broken_writers_are_reaped_without_the_idle_timeout():
+    manager = ConnectionManager()
+    manager.heartbeat.interval, manager.heartbeat.timeout = 10, 0
+    assert manager.heartbeat.enabled
+    quiet, half_open = FakeWebSocket(), FakeWebSocket(alive=False)
+    session = await manager.connect(quiet, "quiet", "quiet", heartbeat=True)
+    await manager.connect(half_open, "half-open", "half-open")
+    await asyncio.sleep(0.05)
+
+    session.last_seen = time.monotonic() - 1000
+    await manager.heartbeat.beat()
+    await asyncio.sleep(0.05)
+    assert half_open.closed_with == 1001
+    assert quiet.closed_with is None and not quiet.of_type("ping")
@@ -0,0 +1,97 @@
+import argparse
+import json
+
+import pytest
+import websockets
+
+from backend.app.api.websocket_core.wire_codec import encode_batch
+from backend.app.benchmarks.compare import compare, load_mismatch
+from backend.app.benchmarks.websocket_load_bench import percentiles, run_benchmark, LoadStats, SimulatedUser
+
+
+# pytest backend/app/tests/load_bench_test.py
+
+
+def make_args(**overrides) -> argparse.Namespace:
+    args = dict(users=3, duration=0.5, warmup=0.1, settle=0.1, placement_rate=20, cursor_rate=10,
+                field_state_rate=2, protocol="json", field_size=(64, 64), connect_rate=100, seed=0,
+                storage=None, url=None, server_pid=None, port=0)
+    args.update(overrides)
+    return argparse.Namespace(**args)
+
+
+def test_percentiles_use_nearest_rank():
+    result = percentiles([i / 1000 for i in range(1, 101)])
+    assert (result["p50"], result["p95"], result["p99"], result["max"]) == (50, 95, 99, 100)
+    assert percentiles([])["p99"] is None
+
+
+def test_user_matches_json_and_binary_broadcasts():
+    stats = LoadStats()
+    stats.measuring = True
+    user = SimulatedUser("bench-1", make_args(protocol="binary"), stats, None)
+    stats.pending[(1, 2, "#00FF00", "bench-1")] = 10.0
+    stats.pending[(3, 4, "#0000FF", "bench-1")] = 10.0
+
+    user.handle(json.dumps({"type": "pixel_update", "seq": 1,
+                            "data": {"x": 1, "y": 2, "color": "#00FF00", "nickname": "bench-1"}}), 10.004)
+    user.handle(encode_batch(2, [(2, 3, 4, "#0000FF", "bench-1"), (3, 5, 5, "#000000", "other")], []), 10.010)
+    user.handle(json.dumps({"type": "error", "message": "Invalid pixel color"}), 10.011)
+
+    assert stats.deliveries == 2 and stats.messages == 3
+    assert percentiles(stats.broadcast_latencies)["max"] == pytest.approx(10, abs=0.01)
+    assert stats.errors == {"Invalid pixel color": 1}
+
+
+nickname_of = {}
+
+
+async def fake_server_with_nicknames(websocket):
+    login = json.loads(await websocket.recv())
+    nickname_of[websocket] = login["data"]["nickname"]
+    await websocket.send(json.dumps({"type": "success", "data": "Success login as user"}))
+    async for message in websocket:
+        request = json.loads(message)
+        if request["type"] == "update_pixel":
+            pixel = {**request["data"], "nickname": nickname_of[websocket]}
+            await websocket.send(json.dumps({"type": "pixel_update", "seq": 1, "data": pixel}))
+        elif request["type"] == "get_field_state":
+            await websocket.send(json.dumps({"type": "field_state", "data": {"pixels": [], "selections": []}}))
+
+
+@pytest.mark.asyncio
+async def test_benchmark_reports_latency_against_running_server():
+    async with websockets.serve(fake_server_with_nicknames, "127.0.0.1", 0) as server:
+        port = server.sockets[0].getsockname()[1]
+        report = await run_benchmark(make_args(url=f"ws://127.0.0.1:{port}/"))
+
+    results = report["results"]
+    assert report["meta"]["args"]["users"] == 3
+    assert results["placements"] > 0 and results["deliveries_per_placement"] == pytest.approx(1, abs=0.1)
+    assert results["latency_ms"]["count"] > 0 and results["latency_ms"]["p99"] < 100
+    assert results["field_state_ms"]["count"] > 0
+    assert results["errors"] == 0 and results["server"] is None
+
+
+def make_report(**results) -> dict:
+    base = {"placements_per_s": 100, "latency_ms": {"p50": 2, "p95": 10, "p99": 20}, "errors": 0,
+            "server": {"cpu_percent": 40, "rss_peak_mb": 100}}
+    base.update(results)
+    return {"meta": {"args": {"users": 100, "seed": 0}}, "results": base}
+
+
+def test_compare_flags_only_regressions_beyond_tolerance_and_floor():
+    baseline = make_report()
+    current = make_report(placements_per_s=95, latency_ms={"p50": 2.5, "p95": 14, "p99": 19},
+                          server={"cpu_percent": 60, "rss_peak_mb": 100}, errors=3)
+    rows = {row.metric: row for row in compare(baseline, current, tolerance=0.1, min_delta=1.0)}
+
+    # p50 вырос на 25%, но меньше чем на 1 мс - шум
+    assert not rows["latency_ms.p50"].regressed and not rows["placements_per_s"].regressed
+    assert rows["latency_ms.p95"].regressed and rows["server.cpu_percent"].regressed and rows["errors"].regressed
+    assert not rows["latency_ms.p99"].regressed and rows["latency_ms.p99"].change > 0
+    assert rows["deliveries_per_s"].change is None
+
+    assert load_mismatch(baseline, current) == []
+    current["meta"]["args"]["users"] = 200
+    assert load_mismatch(baseline, current) == ["users"]
@@ -0,0 +1,51 @@
+import asyncio
+import time
+
+import pytest
+
+from backend.app.api.websocket_core.loop_monitor import LoopMonitor, current_message_type
+
+
+# pytest backend/app/tests/loop_monitor_test.py
+
+
+async def handle_slow_message():
+    current_message_type.set("get_field_state")
+    await asyncio.sleep(0)
+    time.sleep(0.06)  # шаг, который держит цикл
+
+
+@pytest.mark.asyncio
+async def test_monitor_reports_lag_and_slow_callbacks():
+    original_run = asyncio.Handle._run
+    monitor = LoopMonitor(interval_ms=10, slow_callback_ms=40, history=5)
+    monitor.start()
+    try:
+        await asyncio.sleep(0.02)
+        await asyncio.create_task(handle_slow_message())
+        await asyncio.sleep(0.03)
+    finally:
+        monitor.stop()
+    assert asyncio.Handle._run is original_run
+
+    stats = monitor.stats()
+    assert stats["max_lag_ms"] >= 40
+    (offender,) = [offender for offender in stats["slow_callbacks"] if offender["callback"] == "handle_slow_message"]
+    assert offender["message_type"] == "get_field_state" and offender["duration_ms"] >= 60
+
+
+@pytest.mark.asyncio
+async def test_callback_hook_is_opt_in():
+    original_run = asyncio.Handle._run
+    monitor = LoopMonitor(interval_ms=10, slow_callback_ms=0, history=5)
+    monitor.start()
+    try:
+        assert asyncio.Handle._run is original_run
+        await asyncio.sleep(0.02)
+        await asyncio.create_task(handle_slow_message())
+        await asyncio.sleep(0.03)
+    finally:
+        monitor.stop()
+
+    stats = monitor.stats()
+    assert stats["max_lag_ms"] >= 40 and stats["slow_callbacks"] == []
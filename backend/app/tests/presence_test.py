@@ -0,0 +1,64 @@
+import asyncio
+
+import pytest
+
+from backend.app.api.websocket_core.connection_manager import ConnectionManager
+from backend.app.tests.conftest import FakeWebSocket
+from common.app.core.config import config as cfg
+
+
+# pytest backend/app/tests/presence_test.py
+
+
+@pytest.mark.asyncio
+async def test_presence_is_debounced_and_admins_get_diffs(monkeypatch):
+    monkeypatch.setattr(cfg, "PRESENCE_INTERVAL_MS", 20)
+    manager = ConnectionManager()
+    admin, alice, alice_tab, bob = FakeWebSocket(), FakeWebSocket(), FakeWebSocket(), FakeWebSocket()
+    manager.connect_admin(admin, "root")
+    await manager.connect(alice, "alice", "u1")
+    await manager.connect(alice_tab, "alice", "u1")
+    await manager.connect(bob, "bob", "u2")
+    await manager.disconnect(bob)
+    await asyncio.sleep(0.05)
+
+    # Каждый новый клиент получил текущий онлайн при подключении, затем один общий отчет
+    assert alice.of_type("online_count_update") == [{"online": 1}, {"online": 2}]
+    assert alice_tab.of_type("online_count_update") == [{"online": 2}, {"online": 2}]
+    assert admin.of_type("users_diff") == [{"joined": [{"nickname": "alice", "id": "u1"}], "left": []}]
+
+    await manager.disconnect(alice_tab)
+    await asyncio.sleep(0.05)
+    assert alice.of_type("online_count_update")[-1] == {"online": 1}
+    assert len(admin.of_type("users_diff")) == 1
+
+    await manager.disconnect(alice)
+    await asyncio.sleep(0.05)
+    assert admin.of_type("users_diff")[-1] == {"joined": [], "left": [{"nickname": "alice", "id": "u1"}]}
+    manager.disconnect_admin(admin)
+
+
+@pytest.mark.asyncio
+async def test_failed_flush_does_not_repeat(monkeypatch):
+    monkeypatch.setattr(cfg, "PRESENCE_INTERVAL_MS", 1000)
+    manager = ConnectionManager()
+    admin = FakeWebSocket()
+    manager.connect_admin(admin, "root")
+    await manager.connect(FakeWebSocket(), "bob", "u2")
+
+    publish = manager.presence.bus.publish
+
+    def publish_once_failing(event):
+        monkeypatch.setattr(manager.presence.bus, "publish", publish)
+        raise ConnectionError("bus is down")
+
+    # Первый сброс падает на публикации в шину, накопленная разница при этом уже забрана
+    monkeypatch.setattr(manager.presence.bus, "publish", publish_once_failing)
+    with pytest.raises(ConnectionError):
+        manager.presence.flush()
+
+    await manager.connect(FakeWebSocket(), "carol", "u3")
+    manager.presence.flush()
+    await asyncio.sleep(0.01)
+    assert admin.of_type("users_diff") == [{"joined": [{"nickname": "carol", "id": "u3"}], "left": []}]
+    manager.disconnect_admin(admin)
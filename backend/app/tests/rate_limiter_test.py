@@ -0,0 +1,40 @@
+from datetime import datetime, timedelta
+
+import backend.app.api.websocket_core.rate_limiter as rate_limiter_module
+from backend.app.api.websocket_core.rate_limiter import CooldownTracker, RateLimiter
+from common.app.core.config import config as cfg
+
+
+# pytest backend/app/tests/rate_limiter_test.py
+
+
+def test_cooldown_is_answered_from_memory_and_follows_config(monkeypatch):
+    monkeypatch.setattr(cfg, "COOLDOWN", 10)
+    tracker = CooldownTracker()
+    start = datetime(2024, 1, 1, 12, 0, 0)
+    tracker.seed("u1", start - timedelta(seconds=4))
+
+    assert tracker.claim("u1", start) == ("cooldown", 6.0)
+    assert tracker.claim("u2", start) == ("ok", 10.0)
+
+    # Изменение cooldown администратором действует сразу
+    monkeypatch.setattr(cfg, "COOLDOWN", 3)
+    assert tracker.claim("u1", start) == ("ok", 3.0)
+    assert tracker.claim("u1", start + timedelta(seconds=1)) == ("cooldown", 2.0)
+
+    # Более старое значение из базы не перетирает свежее из памяти
+    tracker.seed("u1", start - timedelta(days=1))
+    assert tracker.claim("u1", start + timedelta(seconds=1))[0] == "cooldown"
+
+
+def test_token_bucket_per_user_and_type(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(rate_limiter_module.time, "monotonic", lambda: now[0])
+    limiter = RateLimiter({"update_selection": (2, 3), "*": (1, 1)})
+
+    assert [limiter.allow("u1", "update_selection") for _ in range(4)] == [True, True, True, False]
+    assert limiter.allow("u2", "update_selection")
+    assert limiter.allow("u1", "*") and not limiter.allow("u1", "*")
+
+    now[0] += 0.5
+    assert limiter.allow("u1", "update_selection") and not limiter.allow("u1", "update_selection")
@@ -0,0 +1,27 @@
+from backend.app.api.websocket_core.registry import ConnectionRegistry, Session
+from backend.app.tests.conftest import FakeWebSocket
+
+
+# pytest backend/app/tests/registry_test.py
+
+
+def test_registry_indexes_sessions():
+    registry = ConnectionRegistry()
+    first, second, other, admin = FakeWebSocket(), FakeWebSocket(), FakeWebSocket(), FakeWebSocket()
+    registry.add(Session(first, "u1", "alice"))
+    registry.add(Session(second, "u1", "alice"))
+    registry.add(Session(other, "u2", "bob"))
+    registry.add(Session(admin, None, "root", is_admin=True))
+
+    assert len(registry) == 3 and admin in registry
+    assert {s.websocket for s in registry.for_user("u1")} == {first, second}
+    assert [s.websocket for s in registry.for_nickname("bob")] == [other]
+    assert {s.nickname for s in registry.users()} == {"alice", "bob"}
+
+    assert registry.remove(first).user_id == "u1"
+    assert registry.remove(first) is None
+    assert [s.websocket for s in registry.for_nickname("alice")] == [second]
+    registry.remove(second)
+    registry.remove(admin)
+    assert "u1" not in registry.by_user and "alice" not in registry.by_nickname
+    assert len(registry) == 1 and not registry.admins
@@ -0,0 +1,58 @@
+import asyncio
+
+import pytest
+
+from backend.app.api.websocket_core.connection_manager import ConnectionManager
+from backend.app.api.websocket_core.send_queue import SendQueue
+from backend.app.tests.conftest import FakeWebSocket
+from common.app.core.config import config as cfg
+
+
+# pytest backend/app/tests/send_queue_test.py
+
+
+@pytest.mark.asyncio
+async def test_send_queue_delivers_in_order_and_reports_overflow():
+    overflows = []
+    websocket = FakeWebSocket(stalled=True)
+    outbox = SendQueue(websocket, 2, overflows.append)
+    outbox.start()
+
+    assert outbox.put("a") and outbox.put(b"b")
+    await asyncio.sleep(0)  # писатель забрал "a" и ждет клиента
+    assert outbox.put("c") and not outbox.put("d")
+    assert overflows == [outbox]
+
+    websocket.stalled.set()
+    await asyncio.sleep(0.01)
+    assert websocket.sent == ["a", b"b", "c"] and len(outbox) == 0
+    outbox.close()
+    assert not outbox.put("e")
+
+
+@pytest.mark.asyncio
+async def test_slow_consumer_does_not_block_others(monkeypatch):
+    monkeypatch.setattr(cfg, "SEND_QUEUE_SIZE", 3)
+    monkeypatch.setattr(cfg, "SLOW_CONSUMER_POLICY", "resync")
+    manager = ConnectionManager()
+    slow, fast = FakeWebSocket(stalled=True), FakeWebSocket()
+    await manager.connect(slow, "slow", "u1")
+    await manager.connect(fast, "fast", "u2")
+    await asyncio.sleep(0.01)
+
+    for i in range(5):
+        await manager.broadcast(f"message {i}")
+        await asyncio.sleep(0)
+    await asyncio.sleep(0.01)
+    assert fast.sent[-5:] == [f"message {i}" for i in range(5)]
+    slow_outbox = manager.registry.get(slow).outbox
+    assert slow_outbox.resync_pending and '"resync_required"' in slow_outbox._messages[0]
+
+    # Повторное переполнение до разгрузки очереди - отключение
+    for i in range(5):
+        await manager.broadcast(f"again {i}")
+        await asyncio.sleep(0)
+    await asyncio.sleep(0.01)
+    assert slow.closed_with == 1013 and slow not in manager.registry
+    assert manager.online_count == 1
+    await manager.disconnect(fast)
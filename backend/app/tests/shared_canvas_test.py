@@ -0,0 +1,141 @@
+import asyncio
+import multiprocessing
+import uuid
+from datetime import datetime
+
+import pytest
+
+from backend.app.api.websocket_core.canvas import create_canvas
+from backend.app.api.websocket_core.shared_canvas import SharedCanvas
+from common.app.core.config import config as cfg
+from common.app.db.storage import storage
+
+
+# pytest backend/app/tests/shared_canvas_test.py
+
+
+def new_name() -> str:
+    return f"pb_test_{uuid.uuid4().hex[:12]}"
+
+
+def test_reader_sees_writer_changes_and_resets():
+    name = new_name()
+    writer = SharedCanvas((8, 6), name, 16, 64)
+    reader = SharedCanvas((8, 6), name, 16, 64)
+    try:
+        assert writer.is_writer and not reader.is_writer
+        writer._mark_loaded()
+        assert reader._attach() and reader.size == (8, 6)
+
+        writer.set_pixel(3, 2, 0xFF0000, "u1", "alice", datetime.utcnow())
+        writer.set_pixel(7, 5, 0x00FF00, None, "admin", datetime.utcnow())
+        reader.set_pixel(0, 0, 0x0000FF, "u2", "bob", datetime.utcnow())  # читатель не пишет
+        assert sorted(reader.pixels()) == [(3, 2, "#FF0000", "alice"), (7, 5, "#00FF00", "admin")]
+        assert reader.version == writer.version
+
+        # Переименования переполняют кучу имен и заставляют писателя ее уплотнить
+        for i in range(10):
+            writer.rename_user("u1", f"alice-{i}")
+        assert reader.get_pixel(3, 2) == {"x": 3, "y": 2, "color": "#FF0000", "user_id": "u1", "nickname": "alice-9"}
+
+        version = reader.version
+        writer._allocate((4, 4))
+        assert reader.size == (4, 4) and reader.version != version
+        assert list(reader.pixels()) == [] and reader.nicknames == []
+    finally:
+        reader.close()
+        writer.close()
+
+
+@pytest.mark.asyncio
+async def test_readers_wait_until_the_writer_has_loaded_the_field(monkeypatch):
+    name = new_name()
+    monkeypatch.setattr(cfg, "FIELD_SIZE", (8, 6))
+    loading = asyncio.Event()
+
+    async def get_canvas_pixels():
+        await loading.wait()
+        return [{"x": 3, "y": 2, "color": "#FF0000", "user_id": "u1", "nickname": "alice",
+                 "action_time": datetime.utcnow()}]
+
+    monkeypatch.setattr(storage, "get_canvas_pixels", get_canvas_pixels)
+    writer = SharedCanvas((8, 6), name, 16, 64)
+    reader = SharedCanvas((8, 6), name, 16, 64)
+    try:
+        writer_load, reader_load = asyncio.create_task(writer.load()), asyncio.create_task(reader.load())
+        await asyncio.sleep(0.3)
+        # Сегмент писателя уже есть, но поле в нем еще не загружено
+        assert not reader_load.done()
+        loading.set()
+        await writer_load
+        await asyncio.wait_for(reader_load, 1)
+        assert list(reader.pixels()) == [(3, 2, "#FF0000", "alice")]
+    finally:
+        reader.close()
+        writer.close()
+
+
+def _write_forever(name: str, count: int, ready):
+    writer = SharedCanvas((4, 4), name, 4, 4096)
+    writer._mark_loaded()
+    ready.set()
+    for i in range(count):
+        writer.set_pixel(1, 1, i, "u1", f"n{i}", datetime.utcnow())
+    writer.close()
+
+
+def test_readers_never_see_a_torn_pixel():
+    name = new_name()
+    # Писатель в другом процессе меняет цвет и имя одной клетки в одной записи
+    context = multiprocessing.get_context("spawn")
+    ready = context.Event()
+    writer = context.Process(target=_write_forever, args=(name, 20000, ready))
+    writer.start()
+    assert ready.wait(30)
+    reader = SharedCanvas((4, 4), name, 4, 4096)
+    try:
+        assert not reader.is_writer and reader._attach()
+        reads = 0
+        while writer.is_alive() or reads == 0:
+            pixel = reader.get_pixel(1, 1)
+            if pixel is not None:
+                assert int(pixel["color"][1:], 16) == int(pixel["nickname"][1:])
+                reads += 1
+        assert reads > 0
+    finally:
+        writer.join()
+        reader.close()
+
+
+def test_shared_canvas_requires_the_postgres_bus(monkeypatch):
+    monkeypatch.setattr(cfg, "CANVAS_SHARED_MEMORY", new_name())
+    monkeypatch.setattr(cfg, "BUS_BACKEND", "memory")
+    with pytest.raises(ValueError):
+        create_canvas()
+
+
+def test_name_rows_of_painted_over_authors_are_reused():
+    name = new_name()
+    writer = SharedCanvas((4, 1), name, 2, 4096)
+    reader = SharedCanvas((4, 1), name, 2, 4096)
+    try:
+        writer._mark_loaded()
+        assert reader._attach()
+        writer.set_pixel(0, 0, 0xFF0000, "u1", "alice", datetime.utcnow())
+        writer.set_pixel(1, 0, 0x00FF00, "u2", "bob", datetime.utcnow())
+        assert sorted(reader.pixels()) == [(0, 0, "#FF0000", "alice"), (1, 0, "#00FF00", "bob")]
+
+        # Клетку alice перекрасил bob: ее строка достается новому автору, хотя таблица на двоих
+        writer.set_pixel(0, 0, 0x0000FF, "u2", "bob", datetime.utcnow())
+        writer.set_pixel(2, 0, 0xFFFFFF, "u3", "carol", datetime.utcnow())
+        assert sorted(reader.pixels()) == [(0, 0, "#0000FF", "bob"), (1, 0, "#00FF00", "bob"),
+                                           (2, 0, "#FFFFFF", "carol")]
+        assert reader.get_pixel(2, 0)["user_id"] == "u3"
+
+        # Оба автора на поле - новому места нет
+        with pytest.raises(RuntimeError):
+            writer.set_pixel(3, 0, 0x000000, "u4", "dave", datetime.utcnow())
+        assert reader.get_pixel(3, 0) is None
+    finally:
+        reader.close()
+        writer.close()
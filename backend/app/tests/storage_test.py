@@ -0,0 +1,156 @@
+from datetime import datetime, timedelta
+
+import sqlite3
+
+import pytest
+import pytest_asyncio
+
+from common.app.core.config import config as cfg
+from common.app.db.storage import MemoryStorage, SqliteStorage, Storage, create_storage
+
+
+# pytest backend/app/tests/storage_test.py
+
+
+@pytest_asyncio.fixture(params=["memory", "sqlite"])
+async def storage(request, tmp_path):
+    backend = MemoryStorage() if request.param == "memory" else SqliteStorage(str(tmp_path / "game.sqlite3"))
+    await backend.open()
+    yield backend
+    await backend.close()
+
+
+@pytest.mark.asyncio
+async def test_users_and_admins(storage):
+    user = await storage.create_user("alice")
+    assert await storage.create_user("alice") is None
+    bob = await storage.create_user("bob")
+
+    assert await storage.get_user_by_id(user["id"]) == {"id": user["id"], "nickname": "alice", "is_banned": False,
+                                                        "last_pixel_update": None}
+    assert await storage.get_user_by_id("missing") is None
+    assert not await storage.update_user_nickname(user["id"], "bob")
+    assert await storage.update_user_nickname(user["id"], "carol")
+    assert (await storage.get_user_by_id(user["id"]))["nickname"] == "carol"
+    assert await storage.create_user("alice") is not None
+
+    await storage.toggle_ban_user(bob["id"])
+    assert (await storage.get_user_by_id(bob["id"]))["is_banned"] is True
+    await storage.toggle_ban_user(bob["id"])
+    assert (await storage.get_user_by_id(bob["id"]))["is_banned"] is False
+
+    assert await storage.get_admin_by_username("root") is None
+    await storage.create_admin("root", "hash")
+    admin = await storage.get_admin_by_username("root")
+    await storage.create_admin("root", "other")
+    assert admin["id"] and await storage.get_admin_by_username("root") == admin
+
+
+@pytest.mark.asyncio
+async def test_field_keeps_newest_change_and_clears_on_reset(storage):
+    user = await storage.create_user("alice")
+    earlier = datetime(2024, 1, 1, 12, 0, 0)
+    later = earlier + timedelta(microseconds=500)
+
+    await storage.upsert_pixels([(1, 2, "#ABCDEF", user["id"], "alice", later),
+                                 (3, 3, "#000000", None, "admin", earlier)])
+    # Запоздавшая запись с более старым временем не перетирает клетку
+    await storage.upsert_pixels([(1, 2, "#123456", None, "admin", earlier)])
+    await storage.update_last_pixel_updates([(user["id"], later)])
+    await storage.update_last_pixel_updates([(user["id"], earlier)])
+
+    pixels = sorted(await storage.get_canvas_pixels(), key=lambda row: (row["x"], row["y"]))
+    assert pixels == [
+        {"x": 1, "y": 2, "color": "#ABCDEF", "user_id": user["id"], "action_time": later, "nickname": "alice"},
+        {"x": 3, "y": 3, "color": "#000000", "user_id": None, "action_time": earlier, "nickname": "admin"},
+    ]
+    assert (await storage.get_user_by_id(user["id"]))["last_pixel_update"] == later
+
+    await storage.create_admin("root", "hash")
+    await storage.clear_game()
+    assert await storage.get_canvas_pixels() == []
+    assert await storage.get_user_by_id(user["id"]) is None
+    assert await storage.get_admin_by_username("root") is not None
+
+
+@pytest.mark.asyncio
+async def test_sqlite_keeps_the_game_across_restarts(tmp_path):
+    path = str(tmp_path / "game.sqlite3")
+    first = SqliteStorage(path)
+    await first.open()
+    user = await first.create_user("alice")
+    await first.upsert_pixels([(0, 0, "#FFFFFF", user["id"], "alice", datetime(2024, 1, 1)),
+                               (0, 1, "#000000", None, "admin", datetime(2024, 1, 1))])
+    await first.close()
+
+    second = SqliteStorage(path)
+    await second.open()
+    try:
+        assert (await second.get_user_by_id(user["id"]))["nickname"] == "alice"
+        # У пикселя админа нет пользователя: ник берется из самого пикселя
+        pixels = sorted((row["x"], row["y"], row["color"], row["nickname"]) for row in await second.get_canvas_pixels())
+        assert pixels == [(0, 0, "#FFFFFF", "alice"), (0, 1, "#000000", "admin")]
+    finally:
+        await second.close()
+    # Режим WAL записывается в сам файл базы
+    assert sqlite3.connect(path).execute("PRAGMA journal_mode;").fetchone()[0] == "wal"
+
+
+@pytest.mark.asyncio
+async def test_reset_on_start_begins_a_new_game(tmp_path, monkeypatch):
+    path = str(tmp_path / "game.sqlite3")
+    first = SqliteStorage(path)
+    await first.start()
+    user = await first.create_user("alice")
+    await first.create_admin("root", "hash")
+    await first.upsert_pixels([(0, 0, "#FFFFFF", user["id"], "alice", datetime(2024, 1, 1))])
+    await first.close()
+
+    monkeypatch.setattr(cfg, "STORAGE_RESET_ON_START", True)
+    second = SqliteStorage(path)
+    await second.start()
+    try:
+        assert await second.get_canvas_pixels() == []
+        assert await second.get_user_by_id(user["id"]) is None
+        assert await second.get_admin_by_username("root") is not None
+    finally:
+        await second.close()
+
+
+def test_reset_on_start_requires_a_single_server_process(monkeypatch):
+    monkeypatch.setattr(cfg, "STORAGE_RESET_ON_START", True)
+    monkeypatch.setattr(cfg, "BUS_BACKEND", "postgres")
+    with pytest.raises(ValueError):
+        create_storage("postgres")
+
+
+def test_backend_must_implement_every_method():
+    class Partial(Storage):
+        async def open(self):
+            pass
+
+        async def close(self):
+            pass
+
+    with pytest.raises(TypeError):
+        Partial()
+
+
+@pytest.mark.asyncio
+async def test_place_pixel_checks_the_cooldown(storage, monkeypatch):
+    monkeypatch.setattr(cfg, "COOLDOWN", 10)
+    user = await storage.create_user("alice")
+    start = datetime(2024, 1, 1, 12, 0, 0)
+
+    assert await storage.place_pixel(1, 1, "#FF0000", user["id"], "alice", start) == ("ok", 10.0)
+    refused = await storage.place_pixel(2, 2, "#00FF00", user["id"], "alice", start + timedelta(seconds=4))
+    assert refused == ("cooldown", 6.0)
+    assert await storage.place_pixel(2, 2, "#0000FF", user["id"], "alice", start + timedelta(seconds=10)) == ("ok", 10.0)
+    # Пиксели админа не проверяются и не сдвигают cooldown пользователя
+    admin_time = start + timedelta(seconds=11)
+    assert (await storage.place_pixel(3, 3, "#000000", None, "admin", admin_time, permission=True))[0] == "ok"
+    assert (await storage.place_pixel(4, 4, "#000000", "missing", "ghost", start))[0] == "cooldown"
+
+    pixels = sorted((row["x"], row["y"], row["color"]) for row in await storage.get_canvas_pixels())
+    assert pixels == [(1, 1, "#FF0000"), (2, 2, "#0000FF"), (3, 3, "#000000")]
+    assert (await storage.get_user_by_id(user["id"]))["last_pixel_update"] == start + timedelta(seconds=10)
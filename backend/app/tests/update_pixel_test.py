@@ -0,0 +1,104 @@
+import asyncio
+import uuid
+from datetime import datetime, timedelta
+
+import psycopg
+import pytest
+import pytest_asyncio
+from psycopg import sql
+from psycopg_pool import AsyncConnectionPool
+
+from common.app.core.config import config as cfg
+from common.app.db import api_db, create_db, db_pool
+from common.app.db.api_db import cooldown_result, update_pixel
+
+
+# pytest backend/app/tests/update_pixel_test.py
+# Запросы выполняются на Postgres из POSTGRES_* во временной схеме; без базы тесты пропускаются
+
+
+T0 = datetime(2024, 1, 1, 12, 0, 0)
+
+
+@pytest_asyncio.fixture
+async def database(monkeypatch):
+    monkeypatch.setattr(cfg, "COOLDOWN", 10)
+    schema = f"pb_test_{uuid.uuid4().hex[:12]}"
+    try:
+        admin = await psycopg.AsyncConnection.connect(cfg.DB_URL, autocommit=True, connect_timeout=3)
+    except psycopg.OperationalError:
+        pytest.skip("Postgres is not available")
+    await admin.execute(sql.SQL("CREATE SCHEMA {}").format(sql.Identifier(schema)))
+    # Таблицы создаются в своей схеме: таблицы игры в public не трогаются
+    pool = AsyncConnectionPool(cfg.DB_URL, open=False, min_size=2, max_size=4,
+                               kwargs={"options": f"-c search_path={schema},public"},
+                               configure=db_pool.configure_connection)
+    await pool.open(wait=True)
+    monkeypatch.setattr(db_pool, "pool", pool)
+    try:
+        await create_db.init_db()
+        yield
+    finally:
+        await pool.close()
+        await admin.execute(sql.SQL("DROP SCHEMA {} CASCADE").format(sql.Identifier(schema)))
+        await admin.close()
+
+
+@db_pool.get_pool_cur
+async def set_last_pixel_update(cur, user_id: str, last_pixel_update: datetime):
+    await cur.execute("UPDATE users SET last_pixel_update = %s WHERE id = %s;", (last_pixel_update, user_id))
+
+
+async def new_user(nickname: str, last_pixel_update: datetime = None) -> str:
+    user_id = (await api_db.create_user(nickname))["id"]
+    await set_last_pixel_update(user_id, last_pixel_update)
+    return user_id
+
+
+@pytest.mark.asyncio
+async def test_concurrent_placements_of_one_user_place_one_pixel(database):
+    user_id = await new_user("alice")
+    results = await asyncio.gather(*(update_pixel(x, 0, "#FF0000", user_id, "alice", T0) for x in range(5)))
+    assert sorted(message for message, _ in results) == ["cooldown"] * 4 + ["ok"]
+    assert len(await api_db.get_canvas_pixels()) == 1
+    assert (await api_db.get_user_by_id(user_id))["last_pixel_update"] == T0
+
+
+@pytest.mark.asyncio
+async def test_placement_at_the_cooldown_boundary(database):
+    user_id = await new_user("alice", T0)
+    # Условие нестрогое: ровно через COOLDOWN секунд пиксель уже ставится
+    assert await update_pixel(0, 0, "#FF0000", user_id, "alice", T0 + timedelta(seconds=10)) == ("ok", 10.0)
+    message, remaining = await update_pixel(1, 1, "#00FF00", user_id, "alice",
+                                            T0 + timedelta(seconds=19, milliseconds=999))
+    assert message == "cooldown" and remaining == pytest.approx(0.001)
+    pixels = await api_db.get_canvas_pixels()
+    assert [(pixel["x"], pixel["y"], pixel["color"]) for pixel in pixels] == [(0, 0, "#FF0000")]
+
+
+@pytest.mark.asyncio
+async def test_permission_bypasses_cooldown_without_touching_it(database):
+    user_id = await new_user("alice", T0)
+    assert (await update_pixel(0, 0, "#FF0000", user_id, "alice", T0 + timedelta(seconds=1)))[0] == "cooldown"
+    # Пиксель админа пишется внутри cooldown и не сдвигает cooldown пользователя
+    assert await update_pixel(0, 0, "#FFFFFF", None, "admin", T0 + timedelta(seconds=1),
+                              permission=True) == ("ok", 10.0)
+    assert await update_pixel(0, 0, "#0000FF", user_id, "alice", T0 + timedelta(seconds=2),
+                              permission=True) == ("ok", 10.0)
+    assert (await api_db.get_user_by_id(user_id))["last_pixel_update"] == T0
+    (pixel,) = await api_db.get_canvas_pixels()
+    assert pixel["color"] == "#0000FF"
+
+
+def test_remaining_cooldown_after_a_refusal(monkeypatch):
+    monkeypatch.setattr(cfg, "COOLDOWN", 10)
+    row = {"placed": False, "last_pixel_update": T0 - timedelta(seconds=3, milliseconds=500)}
+    assert cooldown_result(row, T0) == ("cooldown", 6.5)
+    # Конкурентный запрос того же пользователя записал время позже нашего: отсчет идет от его времени
+    row = {"placed": False, "last_pixel_update": T0 + timedelta(milliseconds=1)}
+    assert cooldown_result(row, T0) == ("cooldown", pytest.approx(10.001))
+    # Ровно на границе ждать 0 секунд нельзя: отвечаем полным cooldown
+    row = {"placed": False, "last_pixel_update": T0 - timedelta(seconds=10)}
+    assert cooldown_result(row, T0) == ("cooldown", 10.0)
+    # Пользователь не найден: last_pixel_update пустой
+    assert cooldown_result({"placed": False, "last_pixel_update": None}, T0) == ("cooldown", 10.0)
@@ -0,0 +1,52 @@
+import asyncio
+import json
+
+import pytest
+
+from backend.app.api.websocket_core.connection_manager import ConnectionManager
+from backend.app.api.websocket_core.wire_codec import encode_batch, decode_message
+from backend.app.schemas.data_models import PositionData
+from backend.app.tests.conftest import FakeWebSocket
+from common.app.core.config import config as cfg
+
+
+# pytest backend/app/tests/wire_codec_test.py
+
+UPDATE_TYPES = {"pixel_update", "selection_update", "batch_update"}
+
+
+def updates(websocket: FakeWebSocket) -> list:
+    return [message for message in websocket.sent
+            if isinstance(message, bytes) or json.loads(message)["type"] in UPDATE_TYPES]
+
+
+def test_batch_round_trip():
+    data = encode_batch(7, [(6, 1, 2, "#00FF7F", "alice"), (7, 300, 4, "#000000", "пиксель")],
+                        [("alice", (5, 6)), ("bob", None)])
+    assert decode_message(data) == {"type": "batch_update", "seq": 7, "data": {
+        "pixels": [{"seq": 6, "x": 1, "y": 2, "color": "#00FF7F", "nickname": "alice"},
+                   {"seq": 7, "x": 300, "y": 4, "color": "#000000", "nickname": "пиксель"}],
+        "selections": [{"nickname": "alice", "position": {"x": 5, "y": 6}},
+                       {"nickname": "bob", "position": None}]}}
+    assert decode_message(encode_batch(None, [], []))["seq"] is None
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("tick_ms", [0, 10])
+async def test_binary_clients_get_the_same_updates(monkeypatch, tick_ms):
+    monkeypatch.setattr(cfg, "BROADCAST_TICK_MS", tick_ms)
+    manager = ConnectionManager()
+    text_client, binary_a, binary_b = FakeWebSocket(), FakeWebSocket(), FakeWebSocket()
+    await manager.connect(text_client, "alice", "u1")
+    await manager.connect(binary_a, "bob", "u2", binary=True)
+    await manager.connect(binary_b, "carol", "u3", binary=True)
+
+    await manager.broadcast_pixel_update(3, 4, "#ABCDEF", "alice")
+    await manager.update_selection("bob", PositionData(x=1, y=1))
+    await manager.update_selection("bob", None)
+    await asyncio.sleep(0.05)
+
+    expected = [json.loads(message) for message in updates(text_client)]
+    assert expected and [decode_message(message) for message in updates(binary_a)] == expected
+    # Кадр кодируется один раз и уходит всем бинарным клиентам
+    assert all(a is b for a, b in zip(updates(binary_a), updates(binary_b)))
@@ -0,0 +1,70 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+
+import backend.app.api.websocket_core.write_queue as write_queue_module
+from backend.app.api.websocket_core.write_queue import PixelWriteQueue
+
+
+# pytest backend/app/tests/write_queue_test.py
+
+
+@pytest.mark.asyncio
+async def test_flush_collapses_writes_to_the_same_cell(monkeypatch):
+    batches = []
+
+    async def fake_upsert_pixels(rows):
+        batches.append(sorted(rows))
+
+    monkeypatch.setattr(write_queue_module.storage, "upsert_pixels", fake_upsert_pixels)
+    queue = PixelWriteQueue(flush_interval_ms=1000, flush_size=100)
+    action_time = datetime(2024, 1, 1, 12, 0, 0)
+    queue.put(1, 2, "#ABCDEF", "u1", "alice", action_time)
+    queue.put(3, 3, "#000000", "u1", "alice", action_time)
+    queue.put(1, 2, "#123456", "u2", "bob", action_time)
+
+    await queue.flush()
+    await queue.flush()
+
+    assert batches == [[(1, 2, "#123456", "u2", "bob", action_time), (3, 3, "#000000", "u1", "alice", action_time)]]
+
+
+@pytest.mark.asyncio
+async def test_failed_flush_keeps_newer_pending_writes(monkeypatch):
+    queue = PixelWriteQueue(flush_interval_ms=1000, flush_size=100)
+    action_time = datetime(2024, 1, 1, 12, 0, 0)
+
+    async def failing_upsert_pixels(rows):
+        # Пока пакет пишется, в ту же клетку приходит новая запись
+        queue.put(1, 1, "#FFFFFF", "u2", "bob", action_time)
+        raise RuntimeError("db is down")
+
+    monkeypatch.setattr(write_queue_module.storage, "upsert_pixels", failing_upsert_pixels)
+    queue.put(1, 1, "#000000", "u1", "alice", action_time)
+    queue.put(2, 2, "#000000", "u1", "alice", action_time)
+    await queue.flush()
+
+    assert sorted(queue._pending.values()) == [(1, 1, "#FFFFFF", "u2", "bob", action_time),
+                                               (2, 2, "#000000", "u1", "alice", action_time)]
+
+
+@pytest.mark.asyncio
+async def test_size_threshold_triggers_background_flush(monkeypatch):
+    flushed = []
+
+    async def fake_upsert_pixels(rows):
+        flushed.extend(rows)
+
+    monkeypatch.setattr(write_queue_module.storage, "upsert_pixels", fake_upsert_pixels)
+    queue = PixelWriteQueue(flush_interval_ms=60_000, flush_size=2)
+    queue.start()
+    queue.put(0, 0, "#000000", "u1", "alice", datetime.utcnow())
+    queue.put(0, 1, "#000000", "u1", "alice", datetime.utcnow())
+    for _ in range(10):
+        if flushed:
+            break
+        await asyncio.sleep(0.01)
+    await queue.stop()
+
+    assert len(flushed) == 2 and len(queue) == 0
@@ -12,7 +12,58 @@ class Settings(BaseSettings):
     EMAIL_CONFIRMATION_TOKEN_EXPIRATION: int = 3600
 
     FIELD_SIZE: tuple[int, int] = (64, 64)
+    TILE_SIZE: int = Field(32, validation_alias='TILE_SIZE')  # сторона тайла для подписок на область поля
     COOLDOWN: int = 0
+    PIXEL_WRITE_FLUSH_INTERVAL_MS: int = Field(200, validation_alias='PIXEL_WRITE_FLUSH_INTERVAL_MS')
+    PIXEL_WRITE_FLUSH_SIZE: int = Field(500, validation_alias='PIXEL_WRITE_FLUSH_SIZE')
+    # Ограничение частоты сообщений на пользователя: тип -> (сообщений в секунду, размер всплеска)
+    RATE_LIMITS: dict[str, tuple[float, float]] = Field({
+        "update_pixel": (5, 10),
+        "update_selection": (30, 60),
+        "get_field_state": (1, 5),
+        "get_field_delta": (2, 10),
+        "get_tile_state": (50, 200),
+        "subscribe_viewport": (10, 20),
+        "pong": (1, 5),
+        "*": (10, 20),
+    }, validation_alias='RATE_LIMITS')
+    CHANGE_LOG_SIZE: int = Field(10000, validation_alias='CHANGE_LOG_SIZE')  # pixel changes kept for delta resync
+    BROADCAST_TICK_MS: int = Field(0, validation_alias='BROADCAST_TICK_MS')  # 0 - без пакетной рассылки
+    PRESENCE_INTERVAL_MS: int = Field(1000, validation_alias='PRESENCE_INTERVAL_MS')  # период рассылки онлайна
+    # Где хранятся пользователи, админы и поле: "postgres", "sqlite" (файл STORAGE_SQLITE_PATH) или "memory"
+    STORAGE_BACKEND: str = Field("postgres", validation_alias='STORAGE_BACKEND')
+    STORAGE_SQLITE_PATH: str = Field("pixel_battle.sqlite3", validation_alias='STORAGE_SQLITE_PATH')
+    # Начинать новую игру при каждом запуске: поле и пользователи удаляются, админы остаются. Только для одного процесса
+    STORAGE_RESET_ON_START: bool = Field(False, validation_alias='STORAGE_RESET_ON_START')
+    # Шина событий между процессами: "memory" - один процесс, "postgres" - LISTEN/NOTIFY
+    BUS_BACKEND: str = Field("memory", validation_alias='BUS_BACKEND')
+    BUS_CHANNEL: str = Field("pixel_battle", validation_alias='BUS_CHANNEL')
+    CLUSTER_HEARTBEAT_S: float = Field(5, validation_alias='CLUSTER_HEARTBEAT_S')  # узел без вестей 3 периода забывается
+    # Имя сегмента разделяемой памяти для поля: воркеры одного хоста читают одну копию. None - поле в процессе
+    CANVAS_SHARED_MEMORY: Optional[str] = Field(None, validation_alias='CANVAS_SHARED_MEMORY')
+    CANVAS_SHARED_MAX_USERS: int = Field(65536, validation_alias='CANVAS_SHARED_MAX_USERS')  # авторов на поле сразу
+    CANVAS_SHARED_NAMES_BYTES: int = Field(4 * 1024 * 1024, validation_alias='CANVAS_SHARED_NAMES_BYTES')
+    SEND_QUEUE_SIZE: int = Field(256, validation_alias='SEND_QUEUE_SIZE')  # исходящих сообщений на соединение
+    # Что делать с клиентом, переполнившим очередь: "resync" - сбросить очередь и попросить дозапрос, "evict" - отключить
+    SLOW_CONSUMER_POLICY: str = Field("resync", validation_alias='SLOW_CONSUMER_POLICY')
+    # Сжатие сообщений для клиентов, согласовавших его при входе: какие типы и начиная с какого размера
+    COMPRESSION_MESSAGE_TYPES: list[str] = Field(
+        ["field_state", "field_delta", "batch_update", "users_info_update", "users_diff"],
+        validation_alias='COMPRESSION_MESSAGE_TYPES')
+    COMPRESSION_MIN_BYTES: int = Field(2048, validation_alias='COMPRESSION_MIN_BYTES')
+    COMPRESSION_LEVEL: int = Field(6, validation_alias='COMPRESSION_LEVEL')
+    # Раз в HEARTBEAT_INTERVAL_S закрываются оборванные соединения. Клиентам, включившим heartbeat при входе,
+    # при молчании шлется ping; не ответившие за HEARTBEAT_TIMEOUT_S отключаются. 0 - без проверки
+    HEARTBEAT_INTERVAL_S: float = Field(20, validation_alias='HEARTBEAT_INTERVAL_S')
+    HEARTBEAT_TIMEOUT_S: float = Field(60, validation_alias='HEARTBEAT_TIMEOUT_S')
+    # Остановка сервера: за сколько закрыть все соединения и в каком разбросе клиентам переподключаться
+    DRAIN_TIMEOUT_S: float = Field(10, validation_alias='DRAIN_TIMEOUT_S')
+    RECONNECT_JITTER_MS: int = Field(5000, validation_alias='RECONNECT_JITTER_MS')
+    # Наблюдение за циклом событий: период замера задержки (0 - выключено), порог медленного шага, сколько их помнить.
+    # Поиск медленных шагов подменяет asyncio.Handle._run во всем процессе, поэтому включается отдельно (0 - выключен)
+    LOOP_MONITOR_INTERVAL_MS: int = Field(500, validation_alias='LOOP_MONITOR_INTERVAL_MS')
+    LOOP_SLOW_CALLBACK_MS: int = Field(0, validation_alias='LOOP_SLOW_CALLBACK_MS')
+    LOOP_SLOW_HISTORY: int = Field(100, validation_alias='LOOP_SLOW_HISTORY')
 
     FRONTEND_URL: str = "http://localhost:8000"
 
@@ -30,8 +81,14 @@ class Settings(BaseSettings):
     DB_PASSWORD: Optional[str] = Field("mypassword", validation_alias='POSTGRES_PASSWORD')
     DB_DB: Optional[str] = Field("postgres", validation_alias='POSTGRES_DB')
 
+    DB_POOL_SIZE_MIN: int = Field(10, validation_alias='POOL_SIZE_MIN')  # соединения открываются при старте
     DB_POOL_SIZE_MAX: int = Field(50, validation_alias='POOL_SIZE_MAX')
-    DB_POOL_TIMEOUT: int = Field(300, validation_alias='POOL_TIMEOUT')
+    DB_POOL_TIMEOUT: int = Field(10, validation_alias='POOL_TIMEOUT')  # ожидание свободного соединения, секунды
+    DB_POOL_MAX_WAITING: int = Field(0, validation_alias='POOL_MAX_WAITING')  # 0 - очередь не ограничена
+    # Запрос готовится на сервере после N выполнений на соединении (None - никогда),
+    # частые запросы из api_db готовятся сразу, если включен DB_PREPARE_HOT_STATEMENTS
+    DB_PREPARE_THRESHOLD: Optional[int] = Field(5, validation_alias='PREPARE_THRESHOLD')
+    DB_PREPARE_HOT_STATEMENTS: bool = Field(True, validation_alias='PREPARE_HOT_STATEMENTS')
     BACKEND_DOMAIN: str = Field('localhost', validation_alias='BACKEND_DOMAIN')
     BACKEND_DOMAIN_PORT: int = Field(8000, validation_alias='BACKEND_DOMAIN_PORT')
 
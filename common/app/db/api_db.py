@@ -1,10 +1,10 @@
 from datetime import datetime
-from typing import List
+from typing import List, Tuple
 from common.app.core.config import config as cfg
 
 from psycopg import Cursor
 from psycopg.types.uuid import UUID
-from common.app.db.db_pool import get_pool_cur
+from common.app.db.db_pool import get_pool_cur, PREPARE_HOT
 from psycopg.rows import dict_row
 
 
@@ -24,7 +24,7 @@ async def create_user(cur: Cursor, nickname: str) -> dict:
         INSERT INTO users (nickname) VALUES (%s)
         ON CONFLICT (nickname) DO NOTHING
         RETURNING id;
-    """, (nickname,))
+    """, (nickname,), prepare=PREPARE_HOT)
     return await cur.fetchone()
 
 
@@ -60,8 +60,8 @@ async def update_user_nickname(cur: Cursor, user_id: UUID, new_nickname: str):
 async def get_user_by_id(cur: Cursor, user_id: UUID):
     cur.row_factory = dict_row
     await cur.execute("""
-        SELECT id, nickname, is_banned FROM users WHERE id = %s;
-    """, (user_id,))
+        SELECT id, nickname, is_banned, last_pixel_update FROM users WHERE id = %s;
+    """, (user_id,), prepare=PREPARE_HOT)
     return await cur.fetchone()
 
 
@@ -74,38 +74,87 @@ async def get_admin_by_username(cur: Cursor, username: str):
     return await cur.fetchone()
 
 
+def cooldown_result(row: dict, action_time: datetime) -> Tuple[str, float]:
+    # Для отказа считаем оставшееся время; если конкурентный запрос успел раньше, ждать нужно полный cooldown
+    if row['placed']:
+        return "ok", float(cfg.COOLDOWN)
+    remaining = cfg.COOLDOWN
+    if row['last_pixel_update']:
+        remaining = cfg.COOLDOWN - (action_time - row['last_pixel_update']).total_seconds()
+    return "cooldown", remaining if remaining > 0 else float(cfg.COOLDOWN)
+
+
 @get_pool_cur
-async def update_pixel(cur: Cursor, x: int, y: int, color: str, user_id: str, action_time: datetime,
-                       permission: bool = False) -> str:
-    # Сначала проверяем, когда пользователь последний раз обновлял пиксель
+async def update_pixel(cur: Cursor, x: int, y: int, color: str, user_id: str, nickname: str, action_time: datetime,
+                       permission: bool = False) -> Tuple[str, float]:
+    # Проверка cooldown, запись пикселя и обновление last_pixel_update - один атомарный запрос.
+    # UPDATE с условием на cooldown блокирует строку пользователя, поэтому из двух одновременных
+    # запросов одного пользователя пройдет только один
     cur.row_factory = dict_row
     await cur.execute("""
-        SELECT last_pixel_update FROM users WHERE id = %s;
-    """, (user_id,))
-    user = await cur.fetchone()
-
-    # Проверяем, было ли предыдущее обновление и прошло ли с тех пор COOLDOWN
-    if not permission:
-        if user and user['last_pixel_update'] and (
-                action_time - user['last_pixel_update']).total_seconds() < cfg.COOLDOWN:
-            return "cooldown"
+        WITH claimed AS (
+            UPDATE users SET last_pixel_update = %(action_time)s
+            WHERE id = %(user_id)s AND NOT %(permission)s
+              AND (last_pixel_update IS NULL
+                   OR last_pixel_update <= %(action_time)s - %(cooldown)s::float8 * INTERVAL '1 second')
+            RETURNING id
+        ), placed AS (
+            INSERT INTO pixels (x, y, color, user_id, nickname, action_time)
+            SELECT %(x)s, %(y)s, %(color)s, %(user_id)s, %(nickname)s, %(action_time)s
+            WHERE %(permission)s OR EXISTS (SELECT 1 FROM claimed)
+            ON CONFLICT (x, y) DO UPDATE
+            SET color = CASE WHEN pixels.action_time < EXCLUDED.action_time THEN EXCLUDED.color ELSE pixels.color END,
+                user_id = CASE WHEN pixels.action_time < EXCLUDED.action_time THEN EXCLUDED.user_id ELSE pixels.user_id END,
+                nickname = CASE WHEN pixels.action_time < EXCLUDED.action_time THEN EXCLUDED.nickname ELSE pixels.nickname END,
+                action_time = CASE WHEN pixels.action_time < EXCLUDED.action_time THEN EXCLUDED.action_time ELSE pixels.action_time END
+            RETURNING 1
+        )
+        SELECT EXISTS (SELECT 1 FROM placed) AS placed,
+               (SELECT last_pixel_update FROM users WHERE id = %(user_id)s) AS last_pixel_update;
+    """, {"x": x, "y": y, "color": color, "user_id": user_id, "nickname": nickname, "action_time": action_time,
+          "permission": permission, "cooldown": cfg.COOLDOWN}, prepare=PREPARE_HOT)
+    return cooldown_result(await cur.fetchone(), action_time)
 
 
-    # Если last_pixel_update NULL или прошло более 5 минут, обновляем пиксель
+@get_pool_cur
+async def upsert_pixels(cur: Cursor, pixels: List[tuple]):
+    # pixels: список (x, y, color, user_id, nickname, action_time) без повторов клеток,
+    # пишется одним запросом через unnest, чтобы текст запроса не зависел от размера пакета
+    xs, ys, colors, user_ids, nicknames, action_times = zip(*pixels)
     await cur.execute("""
-        INSERT INTO pixels (x, y, color, user_id, action_time) VALUES (%s, %s, %s, %s, %s)
+        INSERT INTO pixels (x, y, color, user_id, nickname, action_time)
+        SELECT * FROM unnest(%s::int[], %s::int[], %s::varchar[], %s::varchar[], %s::varchar[], %s::timestamp[])
         ON CONFLICT (x, y) DO UPDATE
         SET color = CASE WHEN pixels.action_time < EXCLUDED.action_time THEN EXCLUDED.color ELSE pixels.color END,
             user_id = CASE WHEN pixels.action_time < EXCLUDED.action_time THEN EXCLUDED.user_id ELSE pixels.user_id END,
+            nickname = CASE WHEN pixels.action_time < EXCLUDED.action_time THEN EXCLUDED.nickname ELSE pixels.nickname END,
             action_time = CASE WHEN pixels.action_time < EXCLUDED.action_time THEN EXCLUDED.action_time ELSE pixels.action_time END;
-    """, (x, y, color, user_id, action_time))
+    """, (list(xs), list(ys), list(colors), list(user_ids), list(nicknames), list(action_times)),
+        prepare=PREPARE_HOT)
+
+
+@get_pool_cur
+async def update_last_pixel_updates(cur: Cursor, updates: List[tuple]):
+    # updates: список (user_id, last_pixel_update) без повторов пользователей
+    user_ids, action_times = zip(*updates)
+    await cur.execute("""
+        UPDATE users SET last_pixel_update = GREATEST(users.last_pixel_update, v.action_time)
+        FROM unnest(%s::varchar[], %s::timestamp[]) AS v(id, action_time)
+        WHERE users.id = v.id;
+    """, (list(user_ids), list(action_times)), prepare=PREPARE_HOT)
 
-    # Обновляем время последнего обновления для пользователя
-    if not permission:
-        await cur.execute("""
-            UPDATE users SET last_pixel_update = %s WHERE id = %s;
-        """, (action_time, user_id,))
-    return "ok"
+
+@get_pool_cur
+async def get_canvas_pixels(cur: Cursor) -> List[dict]:
+    # Полное состояние поля для загрузки канваса в память при старте. Ник пользователя берется текущий,
+    # у пикселей без пользователя (админских) - сохраненный при записи
+    cur.row_factory = dict_row
+    await cur.execute("""
+        SELECT p.x, p.y, p.color, p.user_id, p.action_time, COALESCE(u.nickname, p.nickname, '') AS nickname
+        FROM pixels p
+        LEFT JOIN users u ON p.user_id = u.id;
+    """)
+    return await cur.fetchall()
 
 
 # TODO: на данный момент возразаются просто все записи о состоянии поля.
@@ -151,7 +200,7 @@ async def get_users_info(cur: Cursor, user_ids: List[str]) -> List[dict]:
 async def get_pixel_info(cur: Cursor, x: int, y: int) -> dict:
     cur.row_factory = dict_row
     await cur.execute("""
-        SELECT p.x, p.y, p.color, p.user_id, u.nickname
+        SELECT p.x, p.y, p.color, p.user_id, COALESCE(u.nickname, p.nickname) AS nickname
         FROM pixels p
         LEFT JOIN users u ON p.user_id = u.id
         WHERE p.x = %s AND p.y = %s;
@@ -176,3 +225,9 @@ async def clear_db_admin(cur: Cursor):
     await cur.execute("DELETE FROM users;")
 
     await cur.execute("COMMIT;")
+
+
+@get_pool_cur
+async def notify(cur: Cursor, channel: str, payload: str):
+    # Событие для остальных серверов (LISTEN/NOTIFY), см. backend websocket_core/bus.py
+    await cur.execute("SELECT pg_notify(%s, %s);", (channel, payload))
@@ -7,13 +7,18 @@ from common.app.db.db_pool import get_pool_cur
 The init_db function creates the necessary tables in the database if they don't already exist.
 It executes a series of CREATE TABLE statements for the pixels, admins, and users tables.
 Finally, it commits the changes to the database. 
+Existing tables are kept: whether a start begins a new game is decided by STORAGE_RESET_ON_START
+for every storage backend (see Storage.start).
 """
 
+# Ключ блокировки, под которой воркеры по очереди создают схему
+SCHEMA_LOCK_KEY = 7209131
+
 
 @get_pool_cur
 async def init_db(cur: Cursor):
-    for tbl in ('users', 'pixels', 'admins', ):
-        await cur.execute(f"""DROP TABLE IF EXISTS public.{tbl} CASCADE;""")
+    # Одновременные CREATE ... IF NOT EXISTS из нескольких воркеров могут упасть на уникальности каталога
+    await cur.execute("SELECT pg_advisory_xact_lock(%s);", (SCHEMA_LOCK_KEY,))
 
     await cur.execute("""
     CREATE EXTENSION IF NOT EXISTS pgcrypto;
@@ -36,16 +41,19 @@ async def init_db(cur: Cursor):
         y INT NOT NULL,
         color VARCHAR(7) NOT NULL, -- Цвет в формате HEX, например, #FFFFFF
         user_id VARCHAR(36),
+        nickname VARCHAR(255), -- ник автора: для пикселей админа другого источника ника нет
         action_time TIMESTAMP WITHOUT TIME ZONE,
         PRIMARY KEY (x, y),
         FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE SET NULL
     );
     """)
+    # Базы, созданные до появления колонки, сохраняются между запусками
+    await cur.execute("ALTER TABLE pixels ADD COLUMN IF NOT EXISTS nickname VARCHAR(255);")
 
     # Создание таблицы admins
     await cur.execute("""
     CREATE TABLE IF NOT EXISTS admins (
-        id VARCHAR(36) PRIMARY KEY,
+        id VARCHAR(36) PRIMARY KEY DEFAULT gen_random_uuid(),
         username VARCHAR(255) UNIQUE NOT NULL,
         password_hash VARCHAR(255) NOT NULL
     );
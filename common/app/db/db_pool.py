@@ -1,19 +1,37 @@
-from psycopg_pool import AsyncConnectionPool
-from psycopg import Cursor
+import functools
+import time
+
+from psycopg import AsyncConnection, Cursor
+from psycopg_pool import AsyncConnectionPool, PoolTimeout
 from common.app.core.config import config as cfg_c
+from common.app.prometheus.metrics import db_pool_size, db_pool_connections_in_use, db_pool_requests_waiting, \
+    db_pool_checkout_seconds, db_pool_checkout_timeouts, db_query_seconds, db_query_errors
 
 """
 The pool object creates a pool of connects.
-This ensures that every user who comes to us will be served asynchronously
+This ensures that every user who comes to us will be served asynchronously.
+Connections are configured once when the pool creates them (autocommit, prepared statements policy)
+and the pool is filled up to DB_POOL_SIZE_MIN before the server starts accepting clients.
 """
 pool: AsyncConnectionPool = None
 
+# Частые запросы передают prepare=PREPARE_HOT в execute: None - решает prepare_threshold соединения
+PREPARE_HOT = True if cfg_c.DB_PREPARE_HOT_STATEMENTS else None
+
+
+async def configure_connection(conn: AsyncConnection):
+    await conn.set_autocommit(True)
+    conn.prepare_threshold = cfg_c.DB_PREPARE_THRESHOLD
+
 
 async def init_pool(cfg=cfg_c):
     global pool
     if pool is None:
-        pool = AsyncConnectionPool(cfg.DB_URL, open=False, max_size=cfg.DB_POOL_SIZE_MAX, timeout=cfg.DB_POOL_TIMEOUT)
-        await pool.open()
+        pool = AsyncConnectionPool(cfg.DB_URL, open=False, min_size=cfg.DB_POOL_SIZE_MIN,
+                                   max_size=cfg.DB_POOL_SIZE_MAX, timeout=cfg.DB_POOL_TIMEOUT,
+                                   max_waiting=cfg.DB_POOL_MAX_WAITING, configure=configure_connection)
+        # Прогрев: ждем, пока откроются min_size соединений
+        await pool.open(wait=True, timeout=cfg.DB_POOL_TIMEOUT)
 
 
 async def close_pool():
@@ -27,11 +45,48 @@ def get_pool():
     return pool
 
 
+def _pool_stat(name: str):
+    def read():
+        return pool.get_stats().get(name, 0) if pool is not None else 0
+    return read
+
+
+def _connections_in_use():
+    if pool is None:
+        return 0
+    stats = pool.get_stats()
+    return stats.get("pool_size", 0) - stats.get("pool_available", 0)
+
+
+db_pool_size.set_function(_pool_stat("pool_size"))
+db_pool_requests_waiting.set_function(_pool_stat("requests_waiting"))
+db_pool_connections_in_use.set_function(_connections_in_use)
+
+
 def get_pool_cur(func):
+    # Метки разрешаются один раз при объявлении функции, а не на каждый вызов
+    query_seconds = db_query_seconds.labels(function=func.__name__)
+    query_errors = db_query_errors.labels(function=func.__name__)
+
+    @functools.wraps(func)
     async def _inner_(*args, **kwargs):
-        async with get_pool().connection() as conn:
-            await conn.set_autocommit(True)
-            cursor: Cursor = conn.cursor()
-            return await func(cursor, *args, **kwargs)
+        start = time.perf_counter()
+        try:
+            async with get_pool().connection() as conn:
+                checked_out = time.perf_counter()
+                db_pool_checkout_seconds.observe(checked_out - start)
+                cursor: Cursor = conn.cursor()
+                try:
+                    return await func(cursor, *args, **kwargs)
+                except Exception:
+                    query_errors.inc()
+                    raise
+                finally:
+                    query_seconds.observe(time.perf_counter() - checked_out)
+        except PoolTimeout:
+            # Пул исчерпан: ожидание не дождалось свободного соединения за DB_POOL_TIMEOUT
+            db_pool_checkout_seconds.observe(time.perf_counter() - start)
+            db_pool_checkout_timeouts.inc()
+            raise
 
     return _inner_
@@ -0,0 +1,417 @@
+import asyncio
+import functools
+import sqlite3
+import time
+import uuid
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+from common.app.core.config import config as cfg
+from common.app.db import api_db, create_db, db_pool
+from common.app.prometheus.metrics import db_query_seconds, db_query_errors
+
+"""
+Storage keeps what outlives a process: users (nickname, ban, last placement), admins and the field
+(one row per painted cell; the canvas loads it at startup and writes changes back in batches).
+The rest of the server talks to the storage object only, the backend is chosen by STORAGE_BACKEND:
+ - "postgres": the psycopg pool and the queries in api_db, the default. Required for several workers,
+   since they share users through the database and events through BUS_BACKEND=postgres;
+ - "sqlite": one file (STORAGE_SQLITE_PATH) in WAL mode, for a single-node event without Postgres.
+   Queries run one at a time on a dedicated thread, so the event loop never waits on the disk;
+ - "memory": plain dicts, nothing survives a restart. For tests and for benchmarking the websocket layer.
+Every backend returns rows as dicts with the same keys and naive UTC datetimes.
+A start keeps the stored game unless STORAGE_RESET_ON_START is set; the reset is the same clear_game
+for every backend, so the memory backend, which always starts empty, is the only one that differs.
+"""
+
+PixelRow = Tuple[int, int, str, Optional[str], str, datetime]  # x, y, color, user_id, nickname, action_time
+
+
+class Storage(ABC):
+    async def start(self):
+        # Открытие при запуске сервера
+        await self.open()
+        if cfg.STORAGE_RESET_ON_START:
+            await self.clear_game()
+
+    @abstractmethod
+    async def open(self):
+        ...
+
+    @abstractmethod
+    async def close(self):
+        ...
+
+    @abstractmethod
+    async def create_user(self, nickname: str) -> Optional[dict]:
+        # {"id": ...} или None, если ник занят
+        ...
+
+    @abstractmethod
+    async def get_user_by_id(self, user_id: str) -> Optional[dict]:
+        # id, nickname, is_banned, last_pixel_update
+        ...
+
+    @abstractmethod
+    async def update_user_nickname(self, user_id: str, nickname: str) -> bool:
+        ...
+
+    @abstractmethod
+    async def toggle_ban_user(self, user_id: str):
+        ...
+
+    @abstractmethod
+    async def create_admin(self, username: str, password_hash: str):
+        # Существующего админа не трогает
+        ...
+
+    @abstractmethod
+    async def get_admin_by_username(self, username: str) -> Optional[dict]:
+        ...
+
+    @abstractmethod
+    async def upsert_pixels(self, pixels: List[PixelRow]):
+        # Клетка перезаписывается, только если изменение новее сохраненного
+        ...
+
+    @abstractmethod
+    async def update_last_pixel_updates(self, updates: List[Tuple[str, datetime]]):
+        # last_pixel_update только растет
+        ...
+
+    @abstractmethod
+    async def place_pixel(self, x: int, y: int, color: str, user_id: Optional[str], nickname: str,
+                          action_time: datetime, permission: bool = False) -> Tuple[str, float]:
+        # Проверка cooldown и запись пикселя одной операцией: ("ok" | "cooldown", секунд до следующего пикселя)
+        ...
+
+    @abstractmethod
+    async def get_canvas_pixels(self) -> List[dict]:
+        # x, y, color, user_id, action_time, nickname (текущий ник пользователя,
+        # у пикселей без пользователя - ник, сохраненный при записи)
+        ...
+
+    @abstractmethod
+    async def clear_game(self):
+        # Сброс игры: удаляются поле и пользователи, админы остаются
+        ...
+
+
+class PostgresStorage(Storage):
+    async def open(self):
+        await db_pool.init_pool(cfg)
+        await create_db.init_db()
+
+    async def close(self):
+        await db_pool.close_pool()
+
+    async def create_user(self, nickname: str) -> Optional[dict]:
+        return await api_db.create_user(nickname)
+
+    async def get_user_by_id(self, user_id: str) -> Optional[dict]:
+        return await api_db.get_user_by_id(user_id)
+
+    async def update_user_nickname(self, user_id: str, nickname: str) -> bool:
+        return await api_db.update_user_nickname(user_id, nickname)
+
+    async def toggle_ban_user(self, user_id: str):
+        await api_db.toggle_ban_user(user_id)
+
+    async def create_admin(self, username: str, password_hash: str):
+        await api_db.create_admin(username, password_hash)
+
+    async def get_admin_by_username(self, username: str) -> Optional[dict]:
+        return await api_db.get_admin_by_username(username)
+
+    async def upsert_pixels(self, pixels: List[PixelRow]):
+        await api_db.upsert_pixels(pixels)
+
+    async def update_last_pixel_updates(self, updates: List[Tuple[str, datetime]]):
+        await api_db.update_last_pixel_updates(updates)
+
+    async def place_pixel(self, x: int, y: int, color: str, user_id: Optional[str], nickname: str,
+                          action_time: datetime, permission: bool = False) -> Tuple[str, float]:
+        return await api_db.update_pixel(x, y, color, user_id, nickname, action_time, permission)
+
+    async def get_canvas_pixels(self) -> List[dict]:
+        return await api_db.get_canvas_pixels()
+
+    async def clear_game(self):
+        await api_db.clear_db_admin()
+
+
+class MemoryStorage(Storage):
+    def __init__(self):
+        self.users: Dict[str, dict] = {}
+        self.user_by_nickname: Dict[str, str] = {}
+        self.admins: Dict[str, dict] = {}
+        self.pixels: Dict[Tuple[int, int], Tuple[str, Optional[str], datetime]] = {}
+
+    async def open(self):
+        # Открывать и закрывать нечего: данные живут в словарях процесса
+        pass
+
+    async def close(self):
+        pass
+
+    async def create_user(self, nickname: str) -> Optional[dict]:
+        if nickname in self.user_by_nickname:
+            return None
+        user_id = str(uuid.uuid4())
+        self.users[user_id] = {"id": user_id, "nickname": nickname, "is_banned": False, "last_pixel_update": None}
+        self.user_by_nickname[nickname] = user_id
+        return {"id": user_id}
+
+    async def get_user_by_id(self, user_id: str) -> Optional[dict]:
+        user = self.users.get(user_id)
+        return dict(user) if user is not None else None
+
+    async def update_user_nickname(self, user_id: str, nickname: str) -> bool:
+        if nickname in self.user_by_nickname:
+            return False
+        user = self.users.get(user_id)
+        if user is not None:
+            del self.user_by_nickname[user["nickname"]]
+            user["nickname"] = nickname
+            self.user_by_nickname[nickname] = user_id
+        return True
+
+    async def toggle_ban_user(self, user_id: str):
+        user = self.users.get(user_id)
+        if user is not None:
+            user["is_banned"] = not user["is_banned"]
+
+    async def create_admin(self, username: str, password_hash: str):
+        self.admins.setdefault(username, {"id": str(uuid.uuid4()), "password_hash": password_hash})
+
+    async def get_admin_by_username(self, username: str) -> Optional[dict]:
+        admin = self.admins.get(username)
+        return {"id": admin["id"]} if admin is not None else None
+
+    async def upsert_pixels(self, pixels: List[PixelRow]):
+        for x, y, color, user_id, nickname, action_time in pixels:
+            current = self.pixels.get((x, y))
+            if current is None or current[3] < action_time:
+                self.pixels[(x, y)] = (color, user_id, nickname, action_time)
+
+    async def update_last_pixel_updates(self, updates: List[Tuple[str, datetime]]):
+        for user_id, action_time in updates:
+            user = self.users.get(user_id)
+            if user is not None and (user["last_pixel_update"] is None or user["last_pixel_update"] < action_time):
+                user["last_pixel_update"] = action_time
+
+    async def place_pixel(self, x: int, y: int, color: str, user_id: Optional[str], nickname: str,
+                          action_time: datetime, permission: bool = False) -> Tuple[str, float]:
+        if not permission:
+            user = self.users.get(user_id)
+            last = user["last_pixel_update"] if user is not None else None
+            if user is None or (last is not None and last > action_time - timedelta(seconds=cfg.COOLDOWN)):
+                return api_db.cooldown_result({"placed": False, "last_pixel_update": last}, action_time)
+            user["last_pixel_update"] = action_time
+        await self.upsert_pixels([(x, y, color, user_id, nickname, action_time)])
+        return "ok", float(cfg.COOLDOWN)
+
+    async def get_canvas_pixels(self) -> List[dict]:
+        rows = []
+        for (x, y), (color, user_id, nickname, action_time) in self.pixels.items():
+            user = self.users.get(user_id)
+            rows.append({"x": x, "y": y, "color": color, "user_id": user_id if user else None,
+                         "action_time": action_time, "nickname": user["nickname"] if user else nickname or ""})
+        return rows
+
+    async def clear_game(self):
+        self.pixels.clear()
+        self.users.clear()
+        self.user_by_nickname.clear()
+
+
+SQLITE_UPSERT_PIXEL = """
+    INSERT INTO pixels (x, y, color, user_id, nickname, action_time) VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT (x, y) DO UPDATE
+    SET color = excluded.color, user_id = excluded.user_id, nickname = excluded.nickname,
+        action_time = excluded.action_time
+    WHERE pixels.action_time < excluded.action_time;
+"""
+
+
+def _to_text(value: Optional[datetime]) -> Optional[str]:
+    # Время хранится текстом ISO 8601 с микросекундами: так строки сравниваются в порядке времени
+    return value.isoformat(sep=" ", timespec="microseconds") if value is not None else None
+
+
+def _from_text(value: Optional[str]) -> Optional[datetime]:
+    return datetime.fromisoformat(value) if value is not None else None
+
+
+def sqlite_query(func: Callable):
+    # Запрос выполняется в потоке хранилища одной транзакцией; метрики те же, что у запросов к Postgres
+    query_seconds = db_query_seconds.labels(function=func.__name__)
+    query_errors = db_query_errors.labels(function=func.__name__)
+
+    def run(storage: "SqliteStorage", *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            with storage.connection:
+                return func(storage, storage.connection.cursor(), *args, **kwargs)
+        except Exception:
+            query_errors.inc()
+            raise
+        finally:
+            query_seconds.observe(time.perf_counter() - start)
+
+    @functools.wraps(func)
+    async def _inner_(storage: "SqliteStorage", *args, **kwargs):
+        call = functools.partial(run, storage, *args, **kwargs)
+        return await asyncio.get_running_loop().run_in_executor(storage.executor, call)
+
+    return _inner_
+
+
+class SqliteStorage(Storage):
+    def __init__(self, path: str):
+        self.path = path
+        self.connection: Optional[sqlite3.Connection] = None
+        self.executor: Optional[ThreadPoolExecutor] = None
+
+    def _connect(self):
+        self.connection = sqlite3.connect(self.path, isolation_level="DEFERRED")
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute("PRAGMA journal_mode=WAL;")
+        # В WAL с synchronous=NORMAL коммит не ждет fsync; при сбое питания теряются последние транзакции
+        self.connection.execute("PRAGMA synchronous=NORMAL;")
+        self.connection.execute("PRAGMA foreign_keys=ON;")
+        with self.connection:
+            self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS users (
+                id TEXT PRIMARY KEY,
+                nickname TEXT UNIQUE NOT NULL,
+                is_banned INTEGER NOT NULL DEFAULT 0,
+                last_pixel_update TEXT
+            );
+            CREATE TABLE IF NOT EXISTS pixels (
+                x INTEGER NOT NULL,
+                y INTEGER NOT NULL,
+                color TEXT NOT NULL,
+                user_id TEXT REFERENCES users(id) ON DELETE SET NULL,
+                nickname TEXT,
+                action_time TEXT,
+                PRIMARY KEY (x, y)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS admins (
+                id TEXT PRIMARY KEY,
+                username TEXT UNIQUE NOT NULL,
+                password_hash TEXT NOT NULL
+            );
+            """)
+
+    async def open(self):
+        if self.executor is None:
+            # Один поток: соединение sqlite3 живет в нем, запросы выполняются по очереди
+            self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite-storage")
+            await asyncio.get_running_loop().run_in_executor(self.executor, self._connect)
+
+    async def close(self):
+        if self.executor is not None:
+            await asyncio.get_running_loop().run_in_executor(self.executor, self.connection.close)
+            self.executor.shutdown()
+            self.executor, self.connection = None, None
+
+    @sqlite_query
+    def create_user(self, cur: sqlite3.Cursor, nickname: str) -> Optional[dict]:
+        user_id = str(uuid.uuid4())
+        cur.execute("INSERT OR IGNORE INTO users (id, nickname) VALUES (?, ?);", (user_id, nickname))
+        return {"id": user_id} if cur.rowcount else None
+
+    @sqlite_query
+    def get_user_by_id(self, cur: sqlite3.Cursor, user_id: str) -> Optional[dict]:
+        row = cur.execute("SELECT id, nickname, is_banned, last_pixel_update FROM users WHERE id = ?;",
+                          (user_id,)).fetchone()
+        if row is None:
+            return None
+        return {"id": row["id"], "nickname": row["nickname"], "is_banned": bool(row["is_banned"]),
+                "last_pixel_update": _from_text(row["last_pixel_update"])}
+
+    @sqlite_query
+    def update_user_nickname(self, cur: sqlite3.Cursor, user_id: str, nickname: str) -> bool:
+        if cur.execute("SELECT id FROM users WHERE nickname = ?;", (nickname,)).fetchone():
+            return False
+        cur.execute("UPDATE users SET nickname = ? WHERE id = ?;", (nickname, user_id))
+        return True
+
+    @sqlite_query
+    def toggle_ban_user(self, cur: sqlite3.Cursor, user_id: str):
+        cur.execute("UPDATE users SET is_banned = NOT is_banned WHERE id = ?;", (user_id,))
+
+    @sqlite_query
+    def create_admin(self, cur: sqlite3.Cursor, username: str, password_hash: str):
+        cur.execute("INSERT OR IGNORE INTO admins (id, username, password_hash) VALUES (?, ?, ?);",
+                    (str(uuid.uuid4()), username, password_hash))
+
+    @sqlite_query
+    def get_admin_by_username(self, cur: sqlite3.Cursor, username: str) -> Optional[dict]:
+        row = cur.execute("SELECT id FROM admins WHERE username = ?;", (username,)).fetchone()
+        return {"id": row["id"]} if row is not None else None
+
+    @sqlite_query
+    def upsert_pixels(self, cur: sqlite3.Cursor, pixels: List[PixelRow]):
+        cur.executemany(SQLITE_UPSERT_PIXEL, [(x, y, color, user_id, nickname, _to_text(action_time))
+                                              for x, y, color, user_id, nickname, action_time in pixels])
+
+    @sqlite_query
+    def update_last_pixel_updates(self, cur: sqlite3.Cursor, updates: List[Tuple[str, datetime]]):
+        cur.executemany("""
+            UPDATE users SET last_pixel_update = MAX(COALESCE(last_pixel_update, :time), :time) WHERE id = :id;
+        """, [{"id": user_id, "time": _to_text(action_time)} for user_id, action_time in updates])
+
+    @sqlite_query
+    def place_pixel(self, cur: sqlite3.Cursor, x: int, y: int, color: str, user_id: Optional[str], nickname: str,
+                    action_time: datetime, permission: bool = False) -> Tuple[str, float]:
+        # Запросы идут по одному в потоке хранилища, поэтому проверка и запись не разделяются чужим запросом
+        if not permission:
+            cur.execute("""
+                UPDATE users SET last_pixel_update = :time
+                WHERE id = :id AND (last_pixel_update IS NULL OR last_pixel_update <= :limit);
+            """, {"id": user_id, "time": _to_text(action_time),
+                  "limit": _to_text(action_time - timedelta(seconds=cfg.COOLDOWN))})
+            if not cur.rowcount:
+                row = cur.execute("SELECT last_pixel_update FROM users WHERE id = ?;", (user_id,)).fetchone()
+                last = _from_text(row["last_pixel_update"]) if row is not None else None
+                return api_db.cooldown_result({"placed": False, "last_pixel_update": last}, action_time)
+        cur.execute(SQLITE_UPSERT_PIXEL, (x, y, color, user_id, nickname, _to_text(action_time)))
+        return "ok", float(cfg.COOLDOWN)
+
+    @sqlite_query
+    def get_canvas_pixels(self, cur: sqlite3.Cursor) -> List[dict]:
+        rows = cur.execute("""
+            SELECT p.x, p.y, p.color, p.user_id, p.action_time, COALESCE(u.nickname, p.nickname, '') AS nickname
+            FROM pixels p
+            LEFT JOIN users u ON p.user_id = u.id;
+        """).fetchall()
+        return [{**dict(row), "action_time": _from_text(row["action_time"])} for row in rows]
+
+    @sqlite_query
+    def clear_game(self, cur: sqlite3.Cursor):
+        cur.execute("DELETE FROM pixels;")
+        cur.execute("DELETE FROM users;")
+
+
+def create_storage(backend: str) -> Storage:
+    backends: Dict[str, Callable[[], Storage]] = {
+        "postgres": PostgresStorage,
+        "sqlite": lambda: SqliteStorage(cfg.STORAGE_SQLITE_PATH),
+        "memory": MemoryStorage,
+    }
+    if backend not in backends:
+        raise ValueError(f"Unknown storage backend: {backend}")
+    if cfg.BUS_BACKEND == "postgres" and backend != "postgres":
+        # Шина на LISTEN/NOTIFY работает через пул Postgres, а пользователи должны быть общими для всех узлов
+        raise ValueError("BUS_BACKEND=postgres requires STORAGE_BACKEND=postgres")
+    if cfg.STORAGE_RESET_ON_START and (cfg.BUS_BACKEND == "postgres" or cfg.CANVAS_SHARED_MEMORY):
+        # Стартующий воркер стер бы игру, которую уже обслуживают остальные
+        raise ValueError("STORAGE_RESET_ON_START requires a single server process")
+    return backends[backend]()
+
+
+storage = create_storage(cfg.STORAGE_BACKEND)
@@ -0,0 +1,17 @@
+from prometheus_client import Gauge, Counter, Histogram
+
+# Состояние пула соединений с базой, значения читаются из pool.get_stats() при сборе метрик
+db_pool_size = Gauge('db_pool_size', 'Number of connections currently managed by the pool')
+db_pool_connections_in_use = Gauge('db_pool_connections_in_use', 'Number of pool connections checked out')
+db_pool_requests_waiting = Gauge('db_pool_requests_waiting', 'Number of requests waiting for a pool connection')
+
+# Время ожидания свободного соединения при каждом запросе к базе
+db_pool_checkout_seconds = Histogram('db_pool_checkout_seconds', 'Time spent waiting for a pool connection',
+                                     buckets=(.0001, .0005, .001, .005, .01, .05, .1, .5, 1, 5, 10))
+db_pool_checkout_timeouts = Counter('db_pool_checkout_timeouts', 'Number of requests that timed out waiting '
+                                                                 'for a pool connection')
+
+# Время запросов к базе по функциям api_db (без ожидания соединения)
+db_query_seconds = Histogram('db_query_seconds', 'Time spent running an api_db function on a pool connection',
+                             ['function'], buckets=(.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 5))
+db_query_errors = Counter('db_query_errors', 'Number of api_db calls that raised', ['function'])
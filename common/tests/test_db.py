@@ -33,7 +33,7 @@ async def test_update_pixel(setup_user):
     action_time = datetime.utcnow()
 
     # Создаем пиксель в бпзе данных
-    await update_pixel(x=x, y=y, color=color, user_id=user_id, action_time=action_time)
+    await update_pixel(x=x, y=y, color=color, user_id=user_id, nickname="test_user", action_time=action_time)
 
     # Получаем записи с базы данных, о том что пиксель создан и с ним все ок.
     responses = await get_pixels()